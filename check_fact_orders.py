@@ -1,6 +1,11 @@
-import pandas as pd
+import sys
+from pathlib import Path
 
-df = pd.read_csv("data/derived/fact_orders.csv")
+sys.path.append(str(Path(__file__).resolve().parent / "src"))
+from common.loader import load_table  # noqa: E402
+
+# ordered_time arrives parsed (shared, cached loader)
+df = load_table("data/derived/fact_orders.csv")
 
 print("Total rows in fact_orders:", len(df))
 print("Non-null ordered_time:", df["ordered_time"].notna().sum())
@@ -9,7 +14,7 @@ print(df["ordered_time"].astype(str).head(10))
 
 print("\nOrders per month (raw count):")
 print(
-    pd.to_datetime(df["ordered_time"], errors="coerce")
+    df["ordered_time"]
       .dt.to_period("M")
       .value_counts()
       .sort_index()
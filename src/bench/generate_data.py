@@ -0,0 +1,366 @@
+"""
+Synthetic inputs for scaling the pipeline beyond the checked-in samples.
+
+Writes, under --out (a project-shaped directory):
+
+- data/raw/deliveroo.csv, data/raw/"hungry panda.csv": the two export
+  layouts (HungryPanda repeats the restaurant columns, order numbers are
+  floats / empty), with the timestamp variants try_parse_datetime repairs
+  ('01;04', '01：04', '13/12/202501:04'), blank rows and a few bad
+  delivery times;
+- data/clean/roster.csv: one row per day over the whole order range, in the
+  duplicated shift_start/shift_end/shift_type layout of the real export,
+  with '#N/A' and empty rows. The first shift follows a fortnightly rota
+  with swapped days (common.shift_calendar patterns and overrides);
+- data/clean/menu_items.csv + menu_synonyms.csv: menus of every restaurant.
+
+With --users N (> 1) orders are spread over N users (a trailing `User`
+column) and the roster holds one shift calendar per user (`user` column).
+
+Orders are generated and written in chunks, so the scale is bounded by disk,
+not memory. The same --seed and sizes always produce the same files.
+
+Usage:
+    python src/bench/generate_data.py --scale medium --out .pipeline/bench/medium
+    python src/bench/generate_data.py --orders 2500000 --years 5 --out /tmp/takeaway
+    python src/bench/generate_data.py --scale small --users 20 --out /tmp/takeaway-users
+"""
+import argparse
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # src/
+from common.shift_calendar import default_calendar  # noqa: E402
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+# orders per preset; restaurants/menu items grow with the square root
+SCALES = {
+    "tiny": 1_000,
+    "small": 100_000,
+    "medium": 1_000_000,
+    "large": 10_000_000,
+    "xlarge": 30_000_000,
+}
+
+CHUNK_ROWS = 500_000
+DELIVEROO_SHARE = 0.75
+
+DELIVEROO_COLUMNS = [
+    "Platform", "Order Number", "Ordered Time", "Delivered Time", "Order Status",
+    "Restaurant Name", "Restaurant Category", "Restaurant Type", "Payment Type",
+    "Deliver Address", "Items Count", "Food Cost", "Service Fee", "Delivery Fee",
+    "Rider Tip", "Deposit Return Scheme", "Paid With Voucher", "Paid With Visa",
+    "Total Paid", "Discount", "Empty Col",
+]
+HUNGRYPANDA_COLUMNS = [
+    "Order Number", "Ordered Time", "Delivered Time", "Order Status",
+    "Restaurant Name", "Restaurant Category", "Restaurant Type", "Payment Type",
+    "Deliver Address", "Items Count", "Food Cost", "Service Fee", "Delivery Fee",
+    "Rider Tip", "Deposit Return Scheme", "Paid With Voucher", "Paid With Visa",
+    "Total Paid", "Restaurant Name", "Restaurant Category", "Restaurant Type",
+    "Discount", "Empty Col",
+]
+ROSTER_HEADER = "date, shift_start, shift_end, shift_type, hours,,,,, shift_start, shift_end, shift_type"
+
+# (shift_start, shift_end, shift_type, hours) as the roster export spells them
+SHIFTS = [
+    ("3pm", "11pm", "evenning shift", "8"),
+    (" ", " ", "day off", "0"),
+    ("7am", "3pm", "morning shift", "8"),
+    ("11pm", "7am", "night shift", "8"),
+]
+SHIFT_WEIGHTS = [0.45, 0.25, 0.17, 0.13]
+ROTA_DAYS = 14
+SWAP_SHARE = 0.1  # rota days swapped for another shift
+
+SEED_RESTAURANTS = [
+    "Xian Street Food", "Charllies", "Little Sichuan", "YGF Malatang", "Hunan Spicy",
+    "Boston Pizza", "Camile Thai", "Da Mimmo Pizza", "Eatokyo", "KFC", "McDonald's",
+    "Pizza Hut", "Shuppa", "Sushida", "Taste Of HK", "Tatami", "Zambrero", "Zakura",
+    "biang biang", "hei gaga", "chuanjiu xiang",
+]
+NAME_WORDS = ["Golden", "Red", "Lucky", "Dragon", "Noodle", "Spice", "Garden", "Street",
+              "House", "Kitchen", "Bowl", "Wok", "Express", "Palace", "Corner", "Bar"]
+CATEGORIES = ["chinese food", "chinese", "japanese", "pizza", "thai", "mexican", "fast food", "middlle eastern"]
+TYPES = ["fast food", "casual dining", "fast casual"]
+ADDRESSES = ["4 Burgh Quay", "2 The Laurel Knockrabo", "Stay city", "Stay City", "Howth Road"]
+DELIVEROO_PAYMENTS = ["visa 2837", "visa 2266", "VISA 2266", "credit or voucher"]
+HUNGRYPANDA_PAYMENTS = ["alipay", "visa", "apple pay", "wechat"]
+
+DISH_BASES = ["chow mein", "fried rice", "ramen", "udon", "pad thai", "laksa", "pho", "curry",
+              "dumplings", "bao", "burrito", "pizza", "wings", "katsu", "tofu bowl", "hot pot",
+              "broth", "soup", "salad", "fries", "roll", "tempura", "noodles", "rice bowl"]
+DISH_WORDS = ["spicy", "crispy", "chicken", "beef", "pork", "vegan", "seafood", "chilli",
+              "vegetarian", "house", "classic", "sweet and sour", "garlic", "plant based"]
+
+# ordered-hour profile: lunch, dinner and late-night peaks
+HOUR_WEIGHTS = np.array([3, 2, 1, 0.5, 0.2, 0.2, 0.3, 0.5, 1, 1.5, 2, 4,
+                         6, 5, 3, 3, 4, 6, 9, 10, 8, 6, 5, 4])
+
+
+def restaurant_names(n: int) -> list:
+    names = SEED_RESTAURANTS[:n]
+    for i in range(n - len(names)):
+        a, b = NAME_WORDS[i % len(NAME_WORDS)], NAME_WORDS[(i // len(NAME_WORDS) + 3) % len(NAME_WORDS)]
+        names.append(f"{a} {b} {i + 1}")
+    return names
+
+
+def popularity(n: int) -> np.ndarray:
+    """Zipf-like share of orders per restaurant (a few favourites dominate)."""
+    w = 1.0 / np.arange(1, n + 1) ** 0.9
+    return w / w.sum()
+
+
+def _lookup(values) -> np.ndarray:
+    return np.asarray(values, dtype=object)
+
+
+def messy_timestamps(ns: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    '%d/%m/%Y %H:%M' strings where ~30% use ';' or '：' as the time separator
+    and ~10% lose the space before the time. Built from per-day and
+    per-minute lookup tables, so cost does not depend on strftime.
+    """
+    minutes = ns // 60_000_000_000
+    day = minutes // 1440
+    day0 = day.min()
+    days = pd.to_datetime((np.arange(day.max() - day0 + 1) + day0) * 86_400, unit="s")
+    date_str = _lookup(days.strftime("%d/%m/%Y"))[day - day0]
+
+    mod = minutes % 1440
+    seps = [":", ";", "："]
+    times = [_lookup([f"{m // 60:02d}{s}{m % 60:02d}" for m in range(1440)]) for s in seps]
+    which = rng.choice(len(seps), size=len(ns), p=[0.7, 0.15, 0.15])
+    time_str = np.empty(len(ns), dtype=object)
+    for k, table in enumerate(times):
+        sel = which == k
+        time_str[sel] = table[mod[sel]]
+
+    gap = np.where(rng.random(len(ns)) < 0.1, "", " ").astype(object)
+    return date_str + gap + time_str
+
+
+def _money(x: np.ndarray) -> np.ndarray:
+    return np.round(x, 2)
+
+
+def order_chunk(n: int, platform: str, start_ns: int, span_ns: int, names: list,
+                weights: np.ndarray, rng: np.random.Generator, first_number: int) -> pd.DataFrame:
+    """`n` raw export rows of one platform, in its export column order."""
+    day = rng.integers(0, span_ns // 86_400_000_000_000, size=n)
+    hour = rng.choice(24, size=n, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    minute = rng.integers(0, 60, size=n)
+    ordered = start_ns + (day * 86_400 + hour * 3600 + minute * 60) * 1_000_000_000
+
+    delivery = np.clip(rng.gamma(4.0, 9.0, size=n), 8, None)
+    slow = rng.random(n) < 0.003          # delivery_minutes outliers
+    delivery[slow] *= 25
+    delivered = ordered + (delivery * 60).astype("int64") * 1_000_000_000
+    early = rng.random(n) < 0.002         # delivered before ordered
+    delivered[early] = ordered[early] - 3_600_000_000_000
+
+    rest = rng.choice(len(names), size=n, p=weights)
+    items = rng.choice([1, 2, 3, 4, 5, 6], size=n, p=[0.3, 0.32, 0.2, 0.1, 0.05, 0.03])
+    food = _money(items * rng.uniform(6, 16, size=n))
+    service = _money(np.where(rng.random(n) < 0.15, 0.0, rng.choice([0.74, 0.99, 1.37, 1.75, 1.99], size=n)))
+    delivery_fee = np.where(rng.random(n) < 0.12, 0.99 if platform == "Deliveroo" else 0.2, 0.0)
+    voucher = np.where(rng.random(n) < 0.3, rng.choice([3.05, 7.0, 8.98], size=n), 0.0)
+    discount = np.where(rng.random(n) < 0.6, _money(rng.uniform(2, 11, size=n)), np.nan)
+    total = _money(np.maximum(food + service + delivery_fee - voucher, 1.0))
+    if platform != "Deliveroo":
+        total = _money(np.maximum(total - np.nan_to_num(discount), 1.0))
+
+    status = rng.choice(["delivered", "failed", "rejected"], size=n, p=[0.97, 0.02, 0.01])
+    cat = _lookup(CATEGORIES)[rest % len(CATEGORIES)]
+    typ = _lookup(TYPES)[rest % len(TYPES)]
+    rest_names = _lookup(names)[rest]
+
+    df = pd.DataFrame({
+        "Order Number": (np.arange(n) + first_number).astype("float64"),
+        "Ordered Time": messy_timestamps(ordered, rng),
+        "Delivered Time": messy_timestamps(delivered, rng),
+        "Order Status": status,
+        "Restaurant Name": rest_names,
+        "Restaurant Category": cat,
+        "Restaurant Type": typ,
+        "Payment Type": rng.choice(DELIVEROO_PAYMENTS if platform == "Deliveroo" else HUNGRYPANDA_PAYMENTS, size=n),
+        "Deliver Address": rng.choice(ADDRESSES, size=n, p=[0.75, 0.13, 0.05, 0.03, 0.04]),
+        "Items Count": items.astype("float64"),
+        "Food Cost": food,
+        "Service Fee": service,
+        "Delivery Fee": delivery_fee,
+        "Rider Tip": 0.0,
+        "Deposit Return Scheme": np.where(rng.random(n) < 0.02, 0.15, np.nan),
+        "Paid With Voucher": voucher,
+        "Paid With Visa": total,
+        "Total Paid": total,
+        "Discount": discount,
+        "Empty Col": np.nan,
+    })
+
+    # a few exports lose both timestamps
+    blank = rng.random(n) < 0.01
+    df.loc[blank, ["Ordered Time", "Delivered Time"]] = np.nan
+
+    if platform == "Deliveroo":
+        df.insert(0, "Platform", np.where(rng.random(n) < 0.01, "deliveroo", "Deliveroo"))
+        df["Discount"] = np.nan
+    else:
+        df["Order Number"] = np.nan
+        df[["Paid With Voucher", "Paid With Visa"]] = np.nan
+        # the lookup block next to the order columns is only partly filled
+        lookup = rng.random(n) < 0.25
+        for col in ["Restaurant Name", "Restaurant Category", "Restaurant Type"]:
+            df[col + " (lookup)"] = df[col].where(lookup)
+        df["Restaurant Name (lookup)"] = df["Restaurant Name (lookup)"].str.lower()
+        df = df[[c for c in df.columns if c not in ("Discount", "Empty Col")] + ["Discount", "Empty Col"]]
+    return df
+
+
+def user_names(n: int) -> list:
+    return [f"user{i + 1:03d}" for i in range(n)]
+
+
+def write_orders(path: Path, header: list, n_orders: int, platform: str, start: pd.Timestamp,
+                 years: int, names: list, weights: np.ndarray, seed: int, users: int = 1):
+    span_ns = (start + pd.DateOffset(years=years) - start).value
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        # written by hand: the HungryPanda header repeats column names
+        f.write(",".join(header + (["User"] if users > 1 else [])) + "\n")
+        for i, lo in enumerate(range(0, n_orders, CHUNK_ROWS)):
+            n = min(CHUNK_ROWS, n_orders - lo)
+            rng = np.random.default_rng([seed, i, 0 if platform == "Deliveroo" else 1])
+            chunk = order_chunk(n, platform, start.value, span_ns, names, weights, rng, first_number=lo + 1)
+            if users > 1:
+                chunk["User"] = _lookup(user_names(users))[rng.integers(0, users, size=n)]
+            chunk.to_csv(f, header=False, index=False, lineterminator="\n")
+    return n_orders
+
+
+def rota_shifts(dates: pd.DatetimeIndex, rng: np.random.Generator, user: str) -> np.ndarray:
+    """SHIFTS index per date: a random fortnightly rota with a share of swapped days."""
+    cal = default_calendar()
+    spellings = [s[2] for s in SHIFTS]
+    index = dict(zip(cal.normalize(pd.Series(spellings)), range(len(SHIFTS))))
+    cal.add_pattern("rota", [spellings[i] for i in rng.choice(len(SHIFTS), size=ROTA_DAYS, p=SHIFT_WEIGHTS)])
+    swapped = np.flatnonzero(rng.random(len(dates)) < SWAP_SHARE)
+    for day, i in zip(dates[swapped], rng.choice(len(SHIFTS), size=len(swapped), p=SHIFT_WEIGHTS)):
+        cal.add_override(user, day, spellings[i])
+    return cal.expand(dates[0], dates[-1], {user: "rota"})["shift_type"].map(index).to_numpy()
+
+
+def roster_rows(dates: pd.DatetimeIndex, rng: np.random.Generator, user: str) -> pd.DataFrame:
+    n = len(dates)
+    left = rota_shifts(dates, rng, user)
+    right = rng.choice(len(SHIFTS), size=n, p=SHIFT_WEIGHTS)
+    shifts = pd.DataFrame(SHIFTS)
+    rows = pd.DataFrame({
+        "date": dates.strftime("%d-%m-%Y"),
+        "start": shifts[0].to_numpy()[left], "end": shifts[1].to_numpy()[left],
+        "type": shifts[2].to_numpy()[left], "hours": shifts[3].to_numpy()[left],
+        "e1": "", "e2": "", "e3": "", "e4": "",
+        "start2": shifts[0].to_numpy()[right], "end2": shifts[1].to_numpy()[right],
+        "type2": shifts[2].to_numpy()[right],
+    })
+    # spreadsheet leftovers: broken lookups and empty rows
+    broken = rng.random(n) < 0.005
+    rows.loc[broken, ["end", "type"]] = "#N/A"
+    return rows
+
+
+def write_roster(path: Path, start: pd.Timestamp, years: int, seed: int, users: int = 1):
+    dates = pd.date_range(start, start + pd.DateOffset(years=years), inclusive="left")
+    parts = []
+    for u, user in enumerate(user_names(users)):
+        rows = roster_rows(dates, np.random.default_rng([seed, 99] + ([u] if u else [])), user)
+        if users > 1:
+            rows["user"] = user
+        parts.append(rows)
+    rows = pd.concat(parts, ignore_index=True)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(ROSTER_HEADER + (", user" if users > 1 else "") + "\n")
+        rows.to_csv(f, header=False, index=False, lineterminator="\n")
+        f.write(("," * (rows.shape[1] - 1) + "\n") * max(5, len(dates) // 20))
+    return len(rows)
+
+
+def write_menu(path: Path, names: list, items_per_restaurant: int, seed: int):
+    rng = np.random.default_rng([seed, 7])
+    n = len(names) * items_per_restaurant
+    base = rng.choice(DISH_BASES, size=n)
+    word = rng.choice(DISH_WORDS, size=n)
+    plain = rng.random(n) < 0.3
+    item = np.where(plain, base, np.char.add(np.char.add(word.astype(str), " "), base.astype(str)))
+    menu = pd.DataFrame({
+        "restaurant": np.repeat(_lookup(names), items_per_restaurant),
+        "item_name": item,
+        "price": np.round(rng.uniform(4, 26, size=n) * 2) / 2,
+    })
+    for i in range(7):
+        menu[f"Unnamed: {i + 3}"] = ""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    menu.rename(columns=lambda c: "" if c.startswith("Unnamed") else c).to_csv(path, index=False)
+    return n
+
+
+def generate(out: Path, orders: int, years: int = 3, start: str = "2023-01-01",
+             restaurants: int = None, menu_items: int = 8, seed: int = 7, users: int = 1) -> dict:
+    """Write a full synthetic input set under `out`; returns row counts per file."""
+    out = Path(out)
+    start = pd.Timestamp(start)
+    restaurants = restaurants or max(len(SEED_RESTAURANTS), int(np.sqrt(orders) / 4))
+    names = restaurant_names(restaurants)
+    weights = popularity(len(names))
+
+    n_deliveroo = int(round(orders * DELIVEROO_SHARE))
+    counts = {
+        "data/raw/deliveroo.csv": write_orders(
+            out / "data/raw/deliveroo.csv", DELIVEROO_COLUMNS, n_deliveroo, "Deliveroo",
+            start, years, names, weights, seed, users),
+        "data/raw/hungry panda.csv": write_orders(
+            out / "data/raw/hungry panda.csv", HUNGRYPANDA_COLUMNS, orders - n_deliveroo, "hungry panda",
+            start, years, names, weights, seed, users),
+        "data/clean/roster.csv": write_roster(out / "data/clean/roster.csv", start, years, seed, users),
+        "data/clean/menu_items.csv": write_menu(out / "data/clean/menu_items.csv", names, menu_items, seed),
+    }
+    synonyms = PROJECT_ROOT / "data/clean/menu_synonyms.csv"
+    target = out / "data/clean/menu_synonyms.csv"
+    # with --out at the project root the dictionary is already in place
+    if synonyms.exists() and synonyms.resolve() != target.resolve():
+        shutil.copyfile(synonyms, target)
+    return counts
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate synthetic raw exports, roster and menus.")
+    ap.add_argument("--scale", choices=list(SCALES), default="small", help="order-count preset")
+    ap.add_argument("--orders", type=int, help="number of orders (overrides --scale)")
+    ap.add_argument("--years", type=int, default=3, help="years of history (orders and roster)")
+    ap.add_argument("--start", default="2023-01-01", help="first day of history")
+    ap.add_argument("--restaurants", type=int, help="number of restaurants (default grows with orders)")
+    ap.add_argument("--menu-items", type=int, default=8, help="menu items per restaurant")
+    ap.add_argument("--users", type=int, default=1, help="spread orders and rosters over this many users")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--out", type=Path, help="output project directory (default .pipeline/bench/<scale>)")
+    args = ap.parse_args()
+
+    orders = args.orders or SCALES[args.scale]
+    out = args.out or PROJECT_ROOT / ".pipeline" / "bench" / (args.scale if not args.orders else f"orders-{orders}")
+    counts = generate(out, orders, years=args.years, start=args.start, restaurants=args.restaurants,
+                      menu_items=args.menu_items, seed=args.seed, users=args.users)
+
+    print(f"✅ Synthetic data written to {out}")
+    for rel, n in counts.items():
+        print(f" - {rel}: {n:,} rows")
+
+
+if __name__ == "__main__":
+    main()
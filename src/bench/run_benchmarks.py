@@ -0,0 +1,217 @@
+"""
+Per-stage benchmark of the refresh pipeline at several data scales.
+
+For every scale the synthetic inputs are generated once (see
+generate_data.py) into .pipeline/bench/<scale>/, which is laid out like the
+project root. Each repeat then starts from an empty state (no derived
+tables, KPI partials or table cache) and runs every stage in dependency
+order as its own process from a copy of src/ (some stages resolve paths
+from their own location), recording:
+
+- wall_s: elapsed time;
+- cpu_s: user + system CPU time of the stage process;
+- peak_mb: its peak resident memory (ru_maxrss);
+  both need os.wait4 and are n/a where it is missing (Windows);
+- out_bytes: size of the files it wrote.
+
+The best repeat (lowest wall time) per stage and scale is printed and saved
+as JSON. With --baseline, the run is compared to an earlier results file
+and exits 1 when a stage got slower or bigger than --tolerance allows.
+TAKEAWAY_* settings (table format, chunk size, warehouse, ...) are passed
+through to the stages and recorded with the results.
+
+Usage:
+    python src/bench/run_benchmarks.py --scales tiny small
+    python src/bench/run_benchmarks.py --scales medium --repeat 3 --save bench.json
+    python src/bench/run_benchmarks.py --scales medium --baseline bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # src/
+from bench.generate_data import SCALES, generate  # noqa: E402
+from pipeline.stages import PROJECT_ROOT, STAGES, stored_files, topo_order, upstream  # noqa: E402
+
+BENCH_DIR = PROJECT_ROOT / ".pipeline" / "bench"
+
+# files a stage run leaves behind (relative to the workspace); cleared before each repeat
+RUN_STATE = [".pipeline", "data/derived", "reports", "data/clean/orders_clean.csv", "data/clean/orders_clean.parquet"]
+
+# ignore differences below these, whatever the tolerance (timer noise, allocator slack)
+MIN_WALL_DELTA_S = 0.5
+MIN_MEM_DELTA_MB = 20.0
+
+
+def _rss_mb(ru_maxrss: int) -> float:
+    # kilobytes on Linux, bytes on macOS
+    return ru_maxrss / (1024 * 1024) if sys.platform == "darwin" else ru_maxrss / 1024
+
+
+def prepare_workspace(scale: str, orders: int, args) -> Path:
+    """Generated inputs for `scale`, reused while the generator settings match."""
+    ws = BENCH_DIR / scale
+    spec = {"orders": orders, "years": args.years, "seed": args.seed}
+    marker = ws / "generated.json"
+    if not (marker.exists() and json.loads(marker.read_text()) == spec):
+        if ws.exists():
+            shutil.rmtree(ws)
+        print(f"🧪 {scale}: generating {orders:,} orders ...")
+        generate(ws, orders, years=args.years, seed=args.seed)
+        marker.write_text(json.dumps(spec))
+    return ws
+
+
+def reset_workspace(ws: Path):
+    """Fresh copy of the code and no outputs of earlier runs."""
+    if (ws / "src").exists():
+        shutil.rmtree(ws / "src")
+    shutil.copytree(PROJECT_ROOT / "src", ws / "src", ignore=shutil.ignore_patterns("__pycache__"))
+    for rel in RUN_STATE:
+        p = ws / rel
+        if p.is_dir():
+            shutil.rmtree(p)
+        elif p.exists():
+            p.unlink()
+    for d in ["data/derived", "reports"]:
+        (ws / d).mkdir(parents=True, exist_ok=True)
+
+
+def output_bytes(ws: Path, name: str) -> int:
+    return sum((ws / p).stat().st_size for p in stored_files(STAGES[name]["outputs"], on_disk=True) if (ws / p).exists())
+
+
+def run_stage(ws: Path, name: str) -> dict:
+    """Run one stage script in `ws` and measure it."""
+    log_dir = ws / ".pipeline" / "logs"
+    log_dir.mkdir(parents=True, exist_ok=True)
+    with open(log_dir / f"{name}.log", "w", encoding="utf-8") as log:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, str(ws / STAGES[name]["script"])],
+            cwd=ws, stdout=log, stderr=subprocess.STDOUT,
+        )
+        usage = None
+        if hasattr(os, "wait4"):
+            # wait4 gives the resource usage of this child alone
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+        else:
+            proc.wait()
+        wall = time.perf_counter() - t0
+    return {
+        "stage": name,
+        "ok": proc.returncode == 0,
+        "wall_s": round(wall, 3),
+        "cpu_s": round(usage.ru_utime + usage.ru_stime, 3) if usage else None,
+        "peak_mb": round(_rss_mb(usage.ru_maxrss), 1) if usage else None,
+        "out_bytes": output_bytes(ws, name),
+    }
+
+
+def bench_scale(scale: str, orders: int, stages: list, args) -> list:
+    ws = prepare_workspace(scale, orders, args)
+    best = {}
+    for rep in range(args.repeat):
+        reset_workspace(ws)
+        for name in stages:
+            r = run_stage(ws, name)
+            if not r["ok"]:
+                print(f"❌ {scale}/{name} failed, see {ws / '.pipeline' / 'logs' / f'{name}.log'}")
+                best[name] = {**r, "scale": scale, "orders": orders}
+                return list(best.values())
+            if name not in best or r["wall_s"] < best[name]["wall_s"]:
+                best[name] = {**r, "scale": scale, "orders": orders}
+        print(f"✅ {scale}: repeat {rep + 1}/{args.repeat} done")
+    return list(best.values())
+
+
+def with_upstream(names) -> list:
+    """`names` plus every stage they (transitively) read from."""
+    out, todo = set(), list(names)
+    while todo:
+        n = todo.pop()
+        if n not in out:
+            out.add(n)
+            todo.extend(upstream(n))
+    return [n for n in STAGES if n in out]
+
+
+def compare(results: pd.DataFrame, baseline: pd.DataFrame, tolerance: float) -> list:
+    """Stages slower or bigger than the baseline beyond `tolerance` (and the noise floors)."""
+    merged = results.merge(baseline, on=["scale", "stage"], suffixes=("", "_base"))
+    problems = []
+    for _, r in merged.iterrows():
+        if r["wall_s"] > r["wall_s_base"] * (1 + tolerance) and r["wall_s"] - r["wall_s_base"] > MIN_WALL_DELTA_S:
+            problems.append(f"{r['scale']}/{r['stage']}: wall {r['wall_s_base']:.2f}s -> {r['wall_s']:.2f}s")
+        if pd.isna(r["peak_mb"]) or pd.isna(r["peak_mb_base"]):
+            continue  # measured on a platform without os.wait4
+        if r["peak_mb"] > r["peak_mb_base"] * (1 + tolerance) and r["peak_mb"] - r["peak_mb_base"] > MIN_MEM_DELTA_MB:
+            problems.append(f"{r['scale']}/{r['stage']}: peak {r['peak_mb_base']:.0f}MB -> {r['peak_mb']:.0f}MB")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic data.")
+    ap.add_argument("--scales", nargs="+", default=["tiny", "small"],
+                    help=f"presets ({', '.join(SCALES)}) or order counts")
+    ap.add_argument("--stages", nargs="*", help="only these stages (their upstream stages still run)")
+    ap.add_argument("--repeat", type=int, default=1, help="runs per scale; the fastest is kept")
+    ap.add_argument("--years", type=int, default=3, help="years of generated history")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--save", type=Path, help="write results JSON here")
+    ap.add_argument("--baseline", type=Path, help="results JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown/growth vs baseline")
+    args = ap.parse_args()
+
+    unknown = [s for s in args.stages or [] if s not in STAGES]
+    if unknown:
+        ap.error(f"Unknown stage(s): {', '.join(unknown)}")
+    stages = topo_order(with_upstream(args.stages) if args.stages else None)
+
+    rows = []
+    for scale in args.scales:
+        orders = SCALES[scale] if scale in SCALES else int(scale)
+        rows += bench_scale(scale if scale in SCALES else f"orders-{orders}", orders, stages, args)
+    results = pd.DataFrame(rows)
+
+    print()
+    table = results[["scale", "orders", "stage", "wall_s", "cpu_s", "peak_mb", "out_bytes"]]
+    print(table.astype(object).where(table.notna(), "n/a").to_string(index=False))
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps({
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "cpus": os.cpu_count(),
+            "env": {k: v for k, v in os.environ.items() if k.startswith("TAKEAWAY_")},
+            "results": rows,
+        }, indent=2))
+        print(f"\n✅ Saved: {args.save}")
+
+    failed = not results["ok"].all()
+    if args.baseline:
+        baseline = pd.DataFrame(json.loads(args.baseline.read_text())["results"])
+        problems = compare(results, baseline, args.tolerance)
+        for p in problems:
+            print(f"⚠️  regression {p}")
+        if not problems:
+            print(f"✅ No regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+        failed = failed or bool(problems)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,18 @@
+import argparse
+import json
+import os
 import re
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
+from common import metrics
+from common.datetimes import parse_datetimes
+from common.rollups import QuantileSketch
+from common.order_keys import key_parts, occurrence, order_scope
+from common.users import with_user
+from common.storage import write_table, append_table, table_exists, table_columns, TableWriter
+
 RAW_DIR = Path("data/raw")
 OUT_CLEAN = Path("data/clean/orders_clean.csv")
 OUT_QC = Path("reports/data_quality_report.md")
@@ -11,102 +21,418 @@ RAW_FILES = [
     "deliveroo.csv","hungry panda.csv"
 ]
 
+# Rows per chunk in streaming mode (0 = load everything at once)
+CHUNKSIZE = int(os.environ.get("TAKEAWAY_CLEAN_CHUNKSIZE", "0"))
+# Centroids of the delivery_minutes sketch behind the streaming outlier cap:
+# exact up to this many orders, ~capacity/200 centroids in the top 0.5% above
+CAP_SKETCH_CAPACITY = 8192
+
+# Append-only mode: clean only rows newer than the per-platform watermark
+INCREMENTAL = os.environ.get("TAKEAWAY_CLEAN_INCREMENTAL", "0") == "1"
+WATERMARK_PATH = Path(".pipeline/clean_watermark.json")
+
+DATETIME_COLS = ["ordered_time", "delivered_time"]
+NUMERIC_COLS = ["food_cost", "delivery_fee", "service_fee", "total_paid"]
+
 def normalize_colnames(cols):
     return [str(c).strip().lower().replace(" ", "_") for c in cols]
 
-def try_parse_datetime(series):
+def repair_datetime_strings(series):
+    """Regex clean-up for messy export timestamps ('01：04', '01;04', '13/12/202501:04')."""
     s = series.astype(str).str.strip()
-    s = s.str.replace("：", ":", regex=False)   
-    s = s.str.replace(";", ":", regex=False)   
+    s = s.str.replace("：", ":", regex=False)
+    s = s.str.replace(";", ":", regex=False)
     s = s.str.replace(r"[^0-9:/\-\s]", ":", regex=True)
     s = s.str.replace(r":+", ":", regex=True)
     s = s.str.replace(r"(\d{2}/\d{2}/\d{4})(\d{1,2}:\d{1,2})", r"\1 \2", regex=True)
 
     return pd.to_datetime(s, errors="coerce", dayfirst=True)
 
+def try_parse_datetime(series):
+    # explicit known formats first; only values none of them match go through the regex repair
+    return parse_datetimes(series, repair=repair_datetime_strings)
+
 
 def to_numeric(series):
     return pd.to_numeric(series, errors="coerce")
 
-def main():
-    frames = []
+def prepare_raw(df: pd.DataFrame, f: str) -> pd.DataFrame:
+    """Per-export column cleanup (names, platform, user). Empty columns are dropped by the caller."""
+    df.columns = normalize_colnames(df.columns)
+    if "platform" not in df.columns:
+        df["platform"] = f.replace(".csv", "")
+    return with_user(df)
+
+@metrics.timed("clean:cross_field_checks")
+def add_cross_field_checks(raw: pd.DataFrame) -> pd.DataFrame:
+    """Parse datetimes, flag ordered_time vs delivered_time conflicts, add delivery_minutes."""
+    for col in DATETIME_COLS:
+        if col in raw.columns:
+            raw[col] = try_parse_datetime(raw[col])
+
+    # --- Cross-field checks: ordered_time vs delivered_time ---
+    if "ordered_time" in raw.columns and "delivered_time" in raw.columns:
+        raw["delivery_before_order"] = raw["delivered_time"] < raw["ordered_time"]
+
+        raw["year_diff"] = raw["delivered_time"].dt.year - raw["ordered_time"].dt.year
+        raw["year_mismatch"] = raw["year_diff"] != 0
+
+        raw["delivery_time_bad"] = (
+            raw["delivery_before_order"].fillna(False)
+            | (raw["year_diff"].abs() >= 2).fillna(False)
+        )
+
+        raw.loc[raw["delivery_time_bad"], "delivered_time"] = pd.NaT
+
+        raw["delivery_minutes"] = (raw["delivered_time"] - raw["ordered_time"]).dt.total_seconds() / 60
+    return raw
+
+def flag_delivery_outliers(raw: pd.DataFrame, cap: float) -> pd.DataFrame:
+    # --- Data-driven check: delivery duration outliers (quantile-based) ---
+    if "delivery_minutes" in raw.columns:
+        raw["delivery_minutes_outlier"] = (raw["delivery_minutes"] < 0) | (raw["delivery_minutes"] > cap)
+
+        raw.loc[raw["delivery_minutes_outlier"].fillna(False), "delivered_time"] = pd.NaT
+    return raw
+
+@metrics.timed("clean:numeric_calendar")
+def add_numeric_and_calendar(raw: pd.DataFrame) -> pd.DataFrame:
+    for col in NUMERIC_COLS:
+        if col in raw.columns:
+            raw[col] = to_numeric(raw[col])
+
+    raw["order_date"] = raw["ordered_time"].dt.date
+    raw["order_hour"] = raw["ordered_time"].dt.hour
+    raw["order_weekday"] = raw["ordered_time"].dt.day_name()
+    return raw
+
+def write_quality_report(missing_rate: pd.Series, rows: int):
+    qc = missing_rate.sort_values(ascending=False)
+    report = "# Data Quality Report\n\n"
+    report += f"Rows: {rows}\n\n"
+    report += "Missing rate by column:\n"
+    for k, v in qc.items():
+        report += f"- {k}: {v:.1%}\n"
+
+    OUT_QC.parent.mkdir(parents=True, exist_ok=True)
+    OUT_QC.write_text(report, encoding="utf-8")
+
+def stabilize_dtypes(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Keep int-or-NaN columns float in every chunk so appended CSV text stays uniform."""
+    for c in ["year_diff", "order_hour"]:
+        if c in chunk.columns:
+            chunk[c] = chunk[c].astype("float64")
+    return chunk
+
+# ----------------------------
+# Watermarks (incremental mode), kept per order scope: platform, and user
+# when there are several
+# ----------------------------
+def order_keys(df: pd.DataFrame, ordered_time: pd.Series, seen: dict = None) -> pd.Series:
+    """
+    Natural key [user|]platform|order_number|ordered_time|n from
+    common.order_keys: the base key, then its occurrence n in row order after
+    `seen` {base key: count} earlier ones. Keys are only comparable between
+    frames holding a scope's rows in export order (a raw export, orders_clean).
+    """
+    parts = key_parts(df, ordered_time, missing_time="NaT")
+    base = (parts["scope"] + "|" + parts["order_number"] + "|" + parts["ordered_time"]).astype(object)
+    n = occurrence(parts)
+    if seen:
+        n = n + base.map(seen).fillna(0).astype("int64")
+    return (base + "|" + n.astype(str)).astype(object)
+
+def key_counts(keys) -> dict:
+    """{base key: occurrences} of order_keys, for numbering later rows (see `seen`)."""
+    return pd.Series(list(keys), dtype=object).str.rsplit("|", n=1).str[0].value_counts().to_dict()
+
+def empty_watermarks() -> dict:
+    return {"platforms": {}, "undated_keys": [], "cap": None, "rows": 0, "missing": {}}
+
+def window_keys(state: dict) -> set:
+    """order_keys stored in the watermark window: the watermark minutes plus undated rows."""
+    return {k for wm in state["platforms"].values() for k in wm["keys"]} | set(state["undated_keys"])
+
+def update_watermarks(state: dict, df: pd.DataFrame, ordered_time: pd.Series, keys: pd.Series = None):
+    """
+    Advance per-platform (per-user) max ordered_time and remember the keys of
+    every row in its minute (keys share a minute, so the whole minute is the
+    window later runs dedup against).
+    """
+    if keys is None:
+        # number rows after the same-minute ones already remembered (chunks)
+        keys = order_keys(df, ordered_time, key_counts(window_keys(state)))
+    undated = ordered_time.isna()
+    state["undated_keys"] = sorted(set(state["undated_keys"]) | set(keys[undated]))
+
+    minute = ordered_time.dt.floor("min")
+    for platform, t in minute[~undated].groupby(order_scope(df)[~undated].astype(str)):
+        t_max = t.max()
+        at_max = set(keys[t.index[t == t_max]])
+        t_last = ordered_time[t.index[t == t_max]].max()
+        cur = state["platforms"].get(platform)
+        cur_minute = None if cur is None else pd.Timestamp(cur["ordered_time"]).floor("min")
+        if cur is None or t_max > cur_minute:
+            state["platforms"][platform] = {"ordered_time": t_last.isoformat(), "keys": sorted(at_max)}
+        elif t_max == cur_minute:
+            cur["ordered_time"] = max(t_last, pd.Timestamp(cur["ordered_time"])).isoformat()
+            cur["keys"] = sorted(set(cur["keys"]) | at_max)
+
+def load_watermarks():
+    if not WATERMARK_PATH.exists():
+        return None
+    return json.loads(WATERMARK_PATH.read_text(encoding="utf-8"))
+
+def save_watermarks(state: dict):
+    # guards against the table being rebuilt behind the watermark's back
+    state["out_size"] = OUT_CLEAN.stat().st_size if OUT_CLEAN.exists() else None
+    WATERMARK_PATH.parent.mkdir(parents=True, exist_ok=True)
+    WATERMARK_PATH.write_text(json.dumps(state, indent=2), encoding="utf-8")
+
+def in_window(df: pd.DataFrame, ordered_time: pd.Series, state: dict) -> pd.Series:
+    """
+    Rows in or after their platform's watermark minute, plus undated rows.
+    All rows of a base key share its minute, so keys numbered on just these
+    rows equal keys numbered on the whole export.
+    """
+    minute = ordered_time.dt.floor("min")
+    scope = order_scope(df).astype(str)
+    keep = pd.Series(True, index=df.index)
+    for platform, wm in state["platforms"].items():
+        t_wm = pd.Timestamp(wm["ordered_time"]).floor("min")
+        keep &= ~scope.eq(platform) | ordered_time.isna() | (minute >= t_wm)
+    return keep
 
+def is_new(df: pd.DataFrame, ordered_time: pd.Series, state: dict) -> pd.Series:
+    """Rows after their platform's watermark, or on it / undated but not seen before."""
+    keys = order_keys(df, ordered_time)
+    return in_window(df, ordered_time, state) & ~keys.isin(window_keys(state))
+
+def raw_paths():
+    paths = []
     for f in RAW_FILES:
         path = RAW_DIR / f
         if not path.exists():
             raise FileNotFoundError(f"Missing raw file: {path}")
+        paths.append((f, path))
+    return paths
+
+def main():
+    frames = []
 
+    for f, path in raw_paths():
         df = pd.read_csv(path)
+        metrics.record_read(path, len(df))
         df = df.dropna(axis=1, how="all")
-        df.columns = normalize_colnames(df.columns)
+        frames.append(prepare_raw(df, f))
 
-        if "platform" not in df.columns:
-            df["platform"] = f.replace(".csv", "")
+    raw = pd.concat(frames, ignore_index=True)
 
-        frames.append(df)
+    raw = add_cross_field_checks(raw)
+    cap = np.nan
+    if "delivery_minutes" in raw.columns:
+        cap = raw["delivery_minutes"].quantile(0.995)
+        raw = flag_delivery_outliers(raw, cap)
+    raw = add_numeric_and_calendar(raw)
 
-    raw = pd.concat(frames, ignore_index=True)
+    OUT_CLEAN.parent.mkdir(parents=True, exist_ok=True)
 
-    for col in ["ordered_time", "delivered_time"]:
-        if col in raw.columns:
-            raw[col] = try_parse_datetime(raw[col])
-            # --- Cross-field checks: ordered_time vs delivered_time ---
-    if "ordered_time" in raw.columns and "delivered_time" in raw.columns:
-     raw["delivery_before_order"] = raw["delivered_time"] < raw["ordered_time"]
+    # datetimes stay typed; the CSV form renders them as %d/%m/%Y %H:%M
+    write_table(raw, OUT_CLEAN)
 
-     raw["year_diff"] = raw["delivered_time"].dt.year - raw["ordered_time"].dt.year
-     raw["year_mismatch"] = raw["year_diff"] != 0
+    write_quality_report(raw.isna().mean(), len(raw))
 
-     raw["delivery_time_bad"] = (
-        raw["delivery_before_order"].fillna(False)
-        | (raw["year_diff"].abs() >= 2).fillna(False)
-    )
+    state = empty_watermarks()
+    update_watermarks(state, raw, raw["ordered_time"])
+    state.update(cap=None if pd.isna(cap) else float(cap), rows=len(raw),
+                 missing={k: int(v) for k, v in raw.isna().sum().items()})
+    save_watermarks(state)
 
-     raw.loc[raw["delivery_time_bad"], "delivered_time"] = pd.NaT
-    # --- Data-driven check: delivery duration outliers (quantile-based) ---
-    # --- Data-driven check: delivery duration outliers (quantile-based) ---
-    if "ordered_time" in raw.columns and "delivered_time" in raw.columns:
-     raw["delivery_minutes"] = (raw["delivered_time"] - raw["ordered_time"]).dt.total_seconds() / 60
+    print("✅ Data cleaning completed")
+    print("Saved:", OUT_CLEAN)
+    print("Report:", OUT_QC)
 
-     cap = raw["delivery_minutes"].quantile(0.995)
-     raw["delivery_minutes_outlier"] = (raw["delivery_minutes"] < 0) | (raw["delivery_minutes"] > cap)
+def main_streaming(chunksize: int):
+    """
+    Bounded-memory variant of main(): every export is read `chunksize` rows at
+    a time. Across chunks only a fixed-size quantile sketch of delivery_minutes
+    is kept, because the outlier cap is a quantile over the whole history
+    (exact up to CAP_SKETCH_CAPACITY orders, approximate beyond).
 
-     raw.loc[raw["delivery_minutes_outlier"].fillna(False), "delivered_time"] = pd.NaT
+    Pass 1 cleans each chunk and spills it to a temporary CSV.
+    Pass 2 applies the outlier cap, drops columns that were empty in every
+    export and writes the final table chunk by chunk.
 
+    Columns that are only passed through keep their raw text (all chunks are
+    read as strings so their dtypes cannot drift between chunks).
+    """
+    sources = raw_paths()
 
+    # column layout of each export (read headers only)
+    layouts = []
+    for f, path in sources:
+        header = prepare_raw(pd.read_csv(path, nrows=0), f)
+        layouts.append(list(header.columns))
+    all_cols = list(dict.fromkeys(c for cols in layouts for c in cols))
 
+    spill = OUT_CLEAN.with_name(OUT_CLEAN.stem + ".partial.csv")
+    spill.parent.mkdir(parents=True, exist_ok=True)
+    nonempty = [set() for _ in sources]
+    minutes = QuantileSketch()
+    started = False
 
-    for col in ["food_cost", "delivery_fee", "service_fee", "total_paid"]:
-        if col in raw.columns:
-            raw[col] = to_numeric(raw[col])
+    # ---- pass 1: clean chunks, spill to disk ----
+    for i, (f, path) in enumerate(sources):
+        reader = pd.read_csv(path, chunksize=chunksize, dtype=str)
+        rows_read = 0
+        for chunk in reader:
+            rows_read += len(chunk)
+            chunk = prepare_raw(chunk, f)
+            nonempty[i].update(chunk.columns[chunk.notna().any()])
+            chunk = chunk.reindex(columns=all_cols)
+            chunk = add_cross_field_checks(chunk)
+            chunk = stabilize_dtypes(add_numeric_and_calendar(chunk))
+            if "delivery_minutes" in chunk.columns:
+                values = np.sort(chunk["delivery_minutes"].dropna().to_numpy(dtype="float64"))
+                minutes = QuantileSketch.merge_all(
+                    [minutes, QuantileSketch.from_sorted(values, CAP_SKETCH_CAPACITY)], CAP_SKETCH_CAPACITY,
+                )
 
-    raw["order_date"] = raw["ordered_time"].dt.date
-    raw["order_hour"] = raw["ordered_time"].dt.hour
-    raw["order_weekday"] = raw["ordered_time"].dt.day_name()
+            chunk.to_csv(
+                spill, index=False, mode="a" if started else "w", header=not started,
+                date_format="%d/%m/%Y %H:%M",
+            )
+            spill_cols = list(chunk.columns)
+            started = True
+        metrics.record_read(path, rows_read)
 
-    OUT_CLEAN.parent.mkdir(parents=True, exist_ok=True)
-    OUT_QC.parent.mkdir(parents=True, exist_ok=True)
+    if not started:
+        raise ValueError("Raw exports contain no rows.")
 
-    
-    for c in ["ordered_time", "delivered_time"]:
-      if c in raw.columns:
-        raw[c] = raw[c].dt.strftime("%d/%m/%Y %H:%M")
+    # same column order as the in-memory path: concat of per-export non-empty columns
+    keep = list(dict.fromkeys(
+        c for cols, ne in zip(layouts, nonempty) for c in cols if c in ne
+    ))
+    derived = [
+        "delivery_before_order", "year_diff", "year_mismatch", "delivery_time_bad",
+        "delivery_minutes", "delivery_minutes_outlier",
+        "order_date", "order_hour", "order_weekday",
+    ]
+    if "delivery_minutes" in spill_cols:
+        spill_cols.append("delivery_minutes_outlier")
+    out_cols = keep + [c for c in derived if c in spill_cols and c not in keep]
 
-    
-    raw.to_csv(OUT_CLEAN, index=False)
+    cap = minutes.quantile(0.995)
 
-    qc = raw.isna().mean().sort_values(ascending=False)
-    report = "# Data Quality Report\n\n"
-    report += f"Rows: {len(raw)}\n\n"
-    report += "Missing rate by column:\n"
-    for k, v in qc.items():
-        report += f"- {k}: {v:.1%}\n"
+    # ---- pass 2: outlier cap, final layout, write ----
+    missing = pd.Series(0, index=out_cols, dtype="int64")
+    rows = 0
+    state = empty_watermarks()
+    with TableWriter(OUT_CLEAN) as writer:
+        for chunk in pd.read_csv(spill, chunksize=chunksize, dtype=str):
+            if "delivery_minutes" in chunk.columns:
+                chunk["delivery_minutes"] = to_numeric(chunk["delivery_minutes"])
+                chunk = flag_delivery_outliers(chunk, cap)
+            chunk = chunk.reindex(columns=out_cols)
+            for col in DATETIME_COLS:
+                if col in chunk.columns:
+                    chunk[col] = pd.to_datetime(chunk[col], errors="coerce", format="%d/%m/%Y %H:%M")
+            missing += chunk.isna().sum()
+            rows += len(chunk)
+            update_watermarks(state, chunk, chunk["ordered_time"])
+            writer.write(chunk)
+    spill.unlink()
 
-    OUT_QC.write_text(report, encoding="utf-8")
+    write_quality_report(missing / max(rows, 1), rows)
 
-    print("✅ Data cleaning completed")
+    state.update(cap=None if pd.isna(cap) else float(cap), rows=rows,
+                 missing={k: int(v) for k, v in missing.items()})
+    save_watermarks(state)
+
+    print(f"✅ Data cleaning completed (streaming, chunksize={chunksize:,})")
+    print("Saved:", OUT_CLEAN)
+    print("Report:", OUT_QC)
+
+def main_incremental():
+    """
+    Append-only refresh: clean only raw rows past each platform's watermark,
+    or on its minute / undated but with an order key not stored yet, and
+    append them. Work grows with that window, not with the history; rows
+    dated before the watermark are left to the next full clean.
+
+    Existing rows are never touched: their outlier flags keep the cap from
+    the last full run, and the QC report is updated from stored counts.
+    Falls back to a full clean when there is no usable watermark or the new
+    rows bring columns the table doesn't have.
+    """
+    state = load_watermarks()
+    if (
+        state is None
+        or not table_exists(OUT_CLEAN)
+        or state.get("out_size") != (OUT_CLEAN.stat().st_size if OUT_CLEAN.exists() else None)
+    ):
+        print("ℹ️  No usable watermark for the current table, running a full clean.")
+        return main()
+
+    loaded = window_keys(state)
+    frames = []
+    for f, path in raw_paths():
+        df = pd.read_csv(path)
+        metrics.record_read(path, len(df))
+        df = df.dropna(axis=1, how="all")
+        df = prepare_raw(df, f)
+        if "ordered_time" not in df.columns:
+            raise ValueError(f"{path} has no ordered_time column; incremental mode needs it.")
+        t = try_parse_datetime(df["ordered_time"])
+        window = in_window(df, t, state).to_numpy()
+        df = df[window]
+        keys = order_keys(df, t[window])
+        new = ~keys.isin(loaded)
+        frames.append(df[new.to_numpy()].assign(_key=keys[new].to_numpy()))
+
+    delta = pd.concat(frames, ignore_index=True).drop_duplicates("_key")
+    keys = delta.pop("_key")
+    if delta.empty:
+        print("✅ No new orders since the last watermark.")
+        return
+
+    columns = table_columns(OUT_CLEAN)
+    unknown = [c for c in delta.columns if c not in columns]
+    if unknown:
+        print(f"ℹ️  New columns in raw exports ({', '.join(unknown)}), running a full clean.")
+        return main()
+
+    delta = add_cross_field_checks(delta)
+    if "delivery_minutes" in delta.columns:
+        delta = flag_delivery_outliers(delta, np.nan if state["cap"] is None else state["cap"])
+    delta = stabilize_dtypes(add_numeric_and_calendar(delta))
+    delta = delta.reindex(columns=columns)
+
+    append_table(delta, OUT_CLEAN)
+
+    missing = pd.Series(state["missing"]).reindex(columns, fill_value=0) + delta.isna().sum()
+    rows = state["rows"] + len(delta)
+    write_quality_report(missing / max(rows, 1), rows)
+
+    update_watermarks(state, delta, delta["ordered_time"], keys)
+    state.update(rows=rows, missing={k: int(v) for k, v in missing.items()})
+    save_watermarks(state)
+
+    print(f"✅ Incremental clean: appended {len(delta)} new orders")
     print("Saved:", OUT_CLEAN)
     print("Report:", OUT_QC)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Clean raw platform exports into data/clean/orders_clean.csv")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE,
+                        help="stream raw exports in chunks of this many rows (default: TAKEAWAY_CLEAN_CHUNKSIZE or 0 = in memory)")
+    parser.add_argument("--incremental", action="store_true", default=INCREMENTAL,
+                        help="append only orders newer than the stored watermark (default: TAKEAWAY_CLEAN_INCREMENTAL=1)")
+    args = parser.parse_args()
+
+    if args.incremental:
+        main_incremental()
+    elif args.chunksize > 0:
+        main_streaming(args.chunksize)
+    else:
+        main()
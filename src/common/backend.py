@@ -0,0 +1,93 @@
+"""
+Dataframe engine for the stages' row-level transformations.
+
+Stages express derived-column steps (finance features, KPI time features,
+the star schema's dimension-key lookups, ...) as named transformations
+registered here, with a pandas version and optionally a Polars one, and run
+them with `derive(df, name, **tables)`; `tables` are extra frames a step
+joins against (e.g. the dimensions).
+TAKEAWAY_BACKEND picks the engine:
+
+- "pandas" (default): the registered pandas function, eager, on the frame
+  itself. Copy-on-Write is on (the default from pandas 3), so stages pass
+  frames around and take shallow copies instead of copying the data.
+- "polars": the Polars version as a lazy query over only the columns it
+  declares as inputs, so Polars prunes the rest, fuses the expressions and
+  runs them on all cores; the new columns are collected once and added to
+  the pandas frame. Needs polars. Transformations without a Polars version
+  run on pandas.
+
+Both engines produce the same values; Polars dates come back as
+datetime.date objects, like pandas' `.dt.date`.
+"""
+import os
+
+import pandas as pd
+
+from common import metrics
+
+ENGINES = ("pandas", "polars")
+ENGINE = os.environ.get("TAKEAWAY_BACKEND", "pandas").lower()
+if ENGINE not in ENGINES:
+    raise ValueError(f"TAKEAWAY_BACKEND must be one of {ENGINES}, got {ENGINE!r}")
+
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+_transforms = {}  # (name, engine) -> (fn, inputs)
+
+
+def _require_polars():
+    try:
+        import polars
+    except ImportError as e:
+        raise ImportError(
+            "TAKEAWAY_BACKEND=polars needs polars (pip install polars), "
+            "or set TAKEAWAY_BACKEND=pandas."
+        ) from e
+    return polars
+
+
+def transform(name: str, engine: str = "pandas", inputs: list = None):
+    """
+    Register a transformation for `engine`:
+    - pandas: fn(df, **tables) -> df with the new columns (it may modify df);
+    - polars: fn(lf, pl, **tables) -> LazyFrame holding just the new
+      columns, one row per input row in input order, with `tables` as
+      LazyFrames; `inputs` are the columns it reads (missing ones are left
+      out, fn checks `lf.collect_schema()` where that matters).
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}")
+
+    def register(fn):
+        _transforms[(name, engine)] = (fn, list(inputs or []))
+        return fn
+    return register
+
+
+def _derive_polars(df: pd.DataFrame, name: str, tables: dict) -> pd.DataFrame:
+    pl = _require_polars()
+    fn, inputs = _transforms[(name, "polars")]
+    lf = pl.from_pandas(df[[c for c in inputs if c in df.columns]]).lazy()
+    out = fn(lf, pl, **{k: pl.from_pandas(t).lazy() for k, t in tables.items()}).collect()
+    dates = [c for c, t in out.schema.items() if t == pl.Date]
+    new = out.to_pandas()
+    new.index = df.index
+    for c in dates:
+        new[c] = pd.to_datetime(new[c]).dt.date
+    for c in new.columns:
+        df[c] = new[c]
+    return df
+
+
+def derive(df: pd.DataFrame, name: str, engine: str = None, **tables) -> pd.DataFrame:
+    """`df` with the columns of transformation `name`, computed on `engine` (default ENGINE)."""
+    if (name, "pandas") not in _transforms:
+        raise KeyError(f"No transformation registered as {name!r}")
+    engine = engine or ENGINE
+    engine = "polars" if engine == "polars" and (name, "polars") in _transforms else "pandas"
+    with metrics.step(f"derive:{name}:{engine}"):
+        if engine == "polars":
+            return _derive_polars(df, name, tables)
+        return _transforms[(name, "pandas")][0](df, **tables)
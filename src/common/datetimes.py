@@ -0,0 +1,78 @@
+"""
+Timestamp parsing shared by the cleaning and modeling stages.
+
+Order exports only use a handful of layouts, and the same timestamp string
+is often repeated (e.g. delivered_time rounded to the minute). So:
+
+1. factorize the column: each distinct string is parsed once;
+2. rank the known formats by how many distinct values they match on a sample;
+3. parse with explicit formats (vectorized, no per-row format inference),
+   each one only on the values the better-ranked ones left unparsed, so a
+   minority layout that never shows up in the sample is still tried;
+4. hand only the values no format matched to an optional `repair` callback
+   (e.g. the regex clean-up in clean_orders.try_parse_datetime).
+"""
+import numpy as np
+import pandas as pd
+
+from common import metrics
+
+# Day-first layouts used by the platform exports, then ISO (what pandas writes)
+KNOWN_FORMATS = [
+    "%d/%m/%Y %H:%M",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "ISO8601",
+]
+
+SAMPLE_SIZE = 1000
+
+
+def detect_formats(values: pd.Series, formats=None) -> list:
+    """Known formats ordered by how many of a sample of `values` they match, best first."""
+    formats = list(dict.fromkeys(KNOWN_FORMATS if formats is None else formats))
+    sample = values.iloc[:SAMPLE_SIZE]
+    hits = {
+        fmt: int(pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum())
+        for fmt in formats
+    }
+    # formats without a hit in the sample stay candidates for the values after it
+    return sorted(formats, key=lambda f: -hits[f])
+
+
+@metrics.timed("parse_datetimes")
+def parse_datetimes(series: pd.Series, formats=None, repair=None) -> pd.Series:
+    """
+    Parse a column of timestamp strings to datetime64.
+
+    `formats` restricts the candidate layouts (default KNOWN_FORMATS).
+    `repair(strings) -> datetime Series` is called once with the distinct
+    strings no format matched; without it they become NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+
+    s = series.astype("string").str.strip()
+    codes, uniques = pd.factorize(s)
+    uniques = pd.Series(uniques, dtype="string")
+
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype="datetime64[ns]")
+    todo = pd.Series(True, index=uniques.index)
+    for fmt in detect_formats(uniques, formats):
+        p = pd.to_datetime(uniques[todo], format=fmt, errors="coerce")
+        ok = p.notna()
+        parsed[ok[ok].index] = p[ok]
+        todo[ok[ok].index] = False
+        if not todo.any():
+            break
+
+    if repair is not None and todo.any():
+        fixed = pd.to_datetime(repair(uniques[todo]), errors="coerce")
+        parsed[todo[todo].index] = fixed
+
+    values = np.append(parsed.to_numpy(), np.datetime64("NaT", "ns"))
+    # code -1 (missing) picks the trailing NaT
+    return pd.Series(values[codes], index=series.index)
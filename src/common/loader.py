@@ -0,0 +1,106 @@
+"""
+Memoized, ready-typed table loading shared by the stages.
+
+Several stages read the same table in one refresh (fact_orders is read by
+roster_join, eda_kpi, eda_behavior_metrics and check_fact_orders). The first
+`load_table` call pays the CSV parse + schema coercion and pickles the typed
+frame under .pipeline/cache/; later calls with the same source file version
+and column projection unpickle it instead.
+
+Cache entries are keyed by the stored file's path, size and mtime_ns plus the
+projection. When a table is rewritten, every entry of its previous version
+is evicted on the next load. TAKEAWAY_TABLE_CACHE=0 disables the cache.
+"""
+import hashlib
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from common import metrics
+from common.storage import TABLE_FORMAT, parquet_path, read_table
+
+CACHE_DIR = Path(".pipeline/cache")
+ENABLED = os.environ.get("TAKEAWAY_TABLE_CACHE", "1") != "0"
+
+_memo = {}  # in-process: cache key -> DataFrame
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def source_file(path) -> Path:
+    """The file read_table(path) would actually read."""
+    path = Path(path)
+    pq = parquet_path(path)
+    return pq if pq.exists() and (TABLE_FORMAT != "csv" or not path.exists()) else path
+
+
+def _entry(path, columns) -> tuple:
+    src = source_file(path)
+    st = src.stat()
+    prefix = f"{src.stem}-{_digest(str(src.resolve()))}"
+    version = _digest(f"{st.st_size}|{st.st_mtime_ns}")
+    projection = _digest("*" if columns is None else "|".join(sorted(columns)))
+    return prefix, version, CACHE_DIR / f"{prefix}.{version}.{projection}.pkl"
+
+
+def _evict_stale(prefix: str, version: str):
+    for old in CACHE_DIR.glob(f"{prefix}.*.pkl"):
+        if old.name[len(prefix) + 1:].split(".")[0] != version:
+            old.unlink(missing_ok=True)
+
+
+def _forget_stale(prefix: str, version: str):
+    # long-running readers (serve_kpi) see many versions of a table
+    for key in [k for k in _memo if Path(k).name.startswith(f"{prefix}.")]:
+        if Path(key).name[len(prefix) + 1:].split(".")[0] != version:
+            del _memo[key]
+
+
+def _read_pickle(cache_path: Path):
+    if not cache_path.exists():
+        return None
+    try:
+        return pd.read_pickle(cache_path)
+    except Exception:
+        cache_path.unlink(missing_ok=True)
+        return None
+
+
+def load_table(path, columns=None) -> pd.DataFrame:
+    """
+    read_table(path, columns) through the parsed-frame cache. A projection is
+    also served from a cached full read of the same version. Returns a
+    shallow copy; with Copy-on-Write callers may still modify it freely.
+    """
+    if not ENABLED:
+        return read_table(path, columns=columns)
+
+    prefix, version, cache_path = _entry(path, columns)
+    key = str(cache_path)
+    if key in _memo:
+        metrics.record_read(source_file(path), len(_memo[key]), nbytes=0, source="memory")
+        return _memo[key].copy(deep=False)
+
+    with metrics.step("load_table:cache"):
+        df = _read_pickle(cache_path)
+        cached = cache_path
+        if df is None and columns is not None:
+            cached = _entry(path, None)[2]
+            full = _read_pickle(cached)
+            if full is not None:
+                df = full[[c for c in full.columns if c in set(columns)]]
+    if df is not None:
+        metrics.record_read(source_file(path), len(df), nbytes=metrics.file_size(cached), source="cache")
+    else:
+        df = read_table(path, columns=columns)
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _evict_stale(prefix, version)
+        tmp = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        df.to_pickle(tmp)
+        os.replace(tmp, cache_path)
+    _forget_stale(prefix, version)
+    _memo[key] = df
+    return df.copy(deep=False)
@@ -0,0 +1,112 @@
+"""
+In-process metrics for one stage run.
+
+The shared helpers record what a stage does as it runs:
+
+- `step(name)`: wall time and call count of a sub-step (datetime parsing,
+  merges, groupbys, table reads/writes). Steps may nest; each one is timed
+  inclusively.
+- `record_read` / `record_write`: rows and bytes of every table read or
+  written (common.storage and common.loader do this for their tables).
+
+When run_pipeline starts a stage it sets TAKEAWAY_METRICS_FILE; the
+collected metrics, plus the process's CPU time and peak memory, are written
+there as JSON when the script exits and end up in the run manifest. Without
+the variable nothing is written and the overhead is a few dict updates.
+"""
+import atexit
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_PATH = os.environ.get("TAKEAWAY_METRICS_FILE")
+
+_steps = {}  # name -> {"seconds": float, "calls": int}
+_reads = []
+_writes = []
+
+
+@contextmanager
+def step(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        s = _steps.setdefault(name, {"seconds": 0.0, "calls": 0})
+        s["seconds"] += time.perf_counter() - t0
+        s["calls"] += 1
+
+
+def timed(name: str):
+    """Decorator form of step()."""
+    def wrap(fn):
+        @wraps(fn)
+        def inner(*args, **kwargs):
+            with step(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def file_size(path) -> int:
+    try:
+        return Path(path).stat().st_size
+    except OSError:
+        return 0
+
+
+def record_read(path, rows: int, nbytes: int = None, source: str = None):
+    """`rows` read from `path`; bytes default to the file size, `source` e.g. 'cache'."""
+    _reads.append({
+        "path": Path(path).as_posix(), "rows": int(rows),
+        "bytes": file_size(path) if nbytes is None else int(nbytes),
+        **({"source": source} if source else {}),
+    })
+
+
+def record_write(path, rows: int, nbytes: int = None):
+    _writes.append({"path": Path(path).as_posix(), "rows": int(rows),
+                    "bytes": file_size(path) if nbytes is None else int(nbytes)})
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process so far (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def snapshot() -> dict:
+    return {
+        "cpu_s": round(time.process_time(), 3),
+        "peak_mb": peak_memory_mb(),
+        "rows_in": sum(r["rows"] for r in _reads),
+        "rows_out": sum(w["rows"] for w in _writes),
+        "bytes_read": sum(r["bytes"] for r in _reads),
+        "bytes_written": sum(w["bytes"] for w in _writes),
+        "steps": {k: {"seconds": round(v["seconds"], 4), "calls": v["calls"]}
+                  for k, v in sorted(_steps.items(), key=lambda kv: -kv[1]["seconds"])},
+        "reads": _reads,
+        "writes": _writes,
+    }
+
+
+def _dump():
+    path = Path(METRICS_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(snapshot(), indent=2), encoding="utf-8")
+
+
+if METRICS_PATH:
+    atexit.register(_dump)
@@ -0,0 +1,43 @@
+"""
+Natural key of an order: [user|]platform, order_number and ordered_time to
+the minute, plus an occurrence number for rows sharing those parts
+(HungryPanda has no order numbers, so orders placed in the same minute
+differ only by occurrence).
+
+clean_orders joins the parts into text keys for incremental dedup;
+build_star_schema hashes them into order_id. Only these columns are keyed,
+so neither changes when a fee or a derived column is corrected.
+"""
+import pandas as pd
+
+from common.users import USER_COL, scoped
+
+
+def order_scope(df: pd.DataFrame) -> pd.Series:
+    """Platform, prefixed with the user when there are several (see users.scoped)."""
+    platform = df["platform"].astype("string").fillna("")
+    return scoped(platform, df[USER_COL]) if USER_COL in df.columns else platform
+
+
+def key_parts(df: pd.DataFrame, ordered_time: pd.Series = None, missing_time: str = "") -> pd.DataFrame:
+    """
+    Text columns scope / order_number / ordered_time of every row. Order
+    numbers are normalized (2204 and 2204.0 agree); undated rows get
+    `missing_time`.
+    """
+    if ordered_time is None:
+        ordered_time = df["ordered_time"] if "ordered_time" in df.columns else pd.Series(pd.NaT, index=df.index)
+    number = (
+        df["order_number"].astype("string").str.strip().str.replace(r"\.0$", "", regex=True).fillna("")
+        if "order_number" in df.columns else pd.Series("", index=df.index, dtype="string")
+    )
+    return pd.DataFrame({
+        "scope": order_scope(df),
+        "order_number": number,
+        "ordered_time": ordered_time.dt.strftime("%Y-%m-%d %H:%M").astype("string").fillna(missing_time),
+    }, index=df.index)
+
+
+def occurrence(parts: pd.DataFrame) -> pd.Series:
+    """0, 1, ... over the rows sharing all key parts, in row order."""
+    return parts.groupby(list(parts.columns), sort=False).cumcount()
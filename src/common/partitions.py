@@ -0,0 +1,104 @@
+"""
+Incremental KPI maintenance by date partition.
+
+KPI scripts keep their mergeable partial aggregates (see common.rollups) per
+date under .pipeline/kpi/. On each run every date's rows are digested
+(order-insensitive sum of row hashes + row count); only dates whose digest
+changed, appeared or disappeared are re-aggregated, and their cells replace
+the stored ones. The KPI tables are then rebuilt from the cells, so the
+aggregation cost follows the delta, not the length of history.
+
+The cache is dropped (full rebuild) when the caller's `spec` changes or
+TAKEAWAY_KPI_FULL_REFRESH=1.
+
+With several users and TAKEAWAY_USER_WORKERS > 1, the rows to aggregate are
+split per user and built in worker processes (see common.users).
+"""
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from common import metrics, users
+
+STATE_DIR = Path(".pipeline/kpi")
+FULL_REFRESH = os.environ.get("TAKEAWAY_KPI_FULL_REFRESH", "") == "1"
+
+_MISSING = "<NA>"
+
+
+def partition_keys(values: pd.Series) -> pd.Series:
+    """String form of a partition column (dates, months, ...); missing -> '<NA>'."""
+    return values.astype("string").fillna(_MISSING)
+
+
+@metrics.timed("partition_digests")
+def partition_digests(df: pd.DataFrame, partition_col: str, columns: list) -> pd.Series:
+    """'<hash sum>:<rows>' per partition over `columns` (row order does not matter)."""
+    h = pd.util.hash_pandas_object(df[columns], index=False).to_numpy().view("int64")
+    g = pd.Series(h).groupby(partition_keys(df[partition_col]).to_numpy())
+    agg = g.agg(["sum", "size"])
+    return agg["sum"].astype(str) + ":" + agg["size"].astype(str)
+
+
+def stored_cells(name: str):
+    """The cells last saved by PartitionedPartials(`name`), or None (read-only, any spec)."""
+    path = STATE_DIR / f"{name}.pkl"
+    if not path.exists():
+        return None
+    try:
+        return pd.read_pickle(path)["cells"]
+    except Exception:
+        return None
+
+
+class PartitionedPartials:
+    """Stored partial-aggregate cells of one KPI script, keyed by date partition."""
+
+    def __init__(self, name: str, spec: dict):
+        self.path = STATE_DIR / f"{name}.pkl"
+        self.spec = spec
+
+    def _load(self):
+        if FULL_REFRESH or not self.path.exists():
+            return None
+        try:
+            state = pd.read_pickle(self.path)
+        except Exception:
+            return None
+        return state if state.get("spec") == self.spec else None
+
+    @staticmethod
+    def _build(rows: pd.DataFrame, partition_col: str, build) -> pd.DataFrame:
+        parts = users.split_by_user(rows)
+        if users.WORKERS <= 1 or len(parts) <= 1:
+            return build(rows)
+        cells = pd.concat(users.map_partitions(build, [(p,) for _, p in parts]), ignore_index=True)
+        # users are already in sorted order; restore the (partition, user, ...) order of one build
+        order = partition_keys(cells[partition_col]).argsort(kind="stable")
+        return cells.iloc[order].reset_index(drop=True)
+
+    def refresh(self, df: pd.DataFrame, partition_col: str, digest_columns: list, build):
+        """
+        Cells for all of `df`, re-aggregating (`build(rows) -> cells`) only the
+        partitions whose rows changed. Returns (cells, recomputed partition keys).
+        """
+        digests = partition_digests(df, partition_col, digest_columns)
+        state = self._load()
+
+        if state is None:
+            cells = self._build(df, partition_col, build)
+            changed = set(digests.index)
+        else:
+            old = state["digests"]
+            changed = set(digests.index[~digests.eq(old.reindex(digests.index))]) | (set(old.index) - set(digests.index))
+            kept = state["cells"][~partition_keys(state["cells"][partition_col]).isin(changed)]
+            delta = df[partition_keys(df[partition_col]).isin(changed)]
+            cells = pd.concat([kept, self._build(delta, partition_col, build)], ignore_index=True) if len(delta) else kept
+            # same cell order as a full rebuild, so merged floats add up identically
+            order = partition_keys(cells[partition_col]).argsort(kind="stable")
+            cells = cells.iloc[order].reset_index(drop=True)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        pd.to_pickle({"spec": self.spec, "digests": digests, "cells": cells}, self.path)
+        return cells, changed
@@ -0,0 +1,149 @@
+"""
+Restaurant name canonicalization across platforms and the menu file.
+
+"Charllies" on Deliveroo, "charllies " on HungryPanda and "Charllie's" in
+menu_items.csv should all be one restaurant. Names are resolved to a
+canonical spelling with a character-trigram inverted index: a new name is
+only scored against canonical names that share trigrams with it, never
+against the whole dimension. Trigrams are taken with spaces dropped, so
+"Charllie's" matches "Charllies" but "Kitchen Dragon" does not match
+"Dragon Kitchen", and a match needs exactly the same numbers: branch
+"Sushi King 2" is neither "Sushi King 3" nor "Sushi King".
+
+Resolved aliases are persisted (alias, canonical, score), so later runs only
+score names they have not seen before.
+"""
+import re
+import unicodedata
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+
+ALIASES_PATH = Path("data/derived/restaurant_aliases.csv")
+
+# Dice similarity of trigram sets (of the space-free names) needed to treat
+# two names as one restaurant
+MATCH_THRESHOLD = 0.85
+
+# Names that are placeholders, never merged or indexed
+UNRESOLVED = {"Unknown"}
+
+
+def name_key(name: str) -> str:
+    """Case/accent/punctuation-insensitive form used for matching."""
+    s = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii")
+    s = re.sub(r"[^a-z0-9]+", " ", s.lower())
+    return " ".join(s.split())
+
+
+def trigrams(key: str) -> set:
+    """Trigrams of the key without spaces: "charllie s" and "charllies" are one name."""
+    padded = f"  {key.replace(' ', '')} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def numbers(key: str) -> tuple:
+    """Branch / street numbers in a name; they must match exactly."""
+    return tuple(re.findall(r"\d+", key))
+
+
+def similarity(a: str, b: str) -> float:
+    """Dice score of two names as best_match computes it (0.0 when their numbers differ)."""
+    ka, kb = name_key(a), name_key(b)
+    if ka == kb:
+        return 1.0
+    if numbers(ka) != numbers(kb):
+        return 0.0
+    ga, gb = trigrams(ka), trigrams(kb)
+    return 2 * len(ga & gb) / (len(ga) + len(gb))
+
+
+class RestaurantResolver:
+    """Alias -> canonical name map plus the trigram index over canonical names."""
+
+    def __init__(self, threshold: float = MATCH_THRESHOLD):
+        self.threshold = threshold
+        self.aliases = {}   # raw spelling -> (canonical, score)
+        self._by_key = {}   # name_key -> canonical
+        self._canon = []    # canonical names
+        self._grams = []    # trigram set per canonical
+        self._numbers = []  # numbers per canonical
+        self._index = {}    # trigram -> [canonical position]
+
+    # ---------- persistence ----------
+    @classmethod
+    def load(cls, path: Path = ALIASES_PATH, threshold: float = MATCH_THRESHOLD):
+        r = cls(threshold)
+        if Path(path).exists():
+            cache = pd.read_csv(path, dtype={"alias": str, "canonical": str})
+            # merges cached under older matching rules are re-resolved
+            keep = [a == c or similarity(a, c) >= threshold for a, c in zip(cache["alias"], cache["canonical"])]
+            cache = cache[keep]
+            for canonical in cache["canonical"].drop_duplicates():
+                r._add_canonical(canonical)
+            for alias, canonical, score in cache[["alias", "canonical", "score"]].itertuples(index=False):
+                r.aliases[alias] = (canonical, float(score))
+        return r
+
+    def save(self, path: Path = ALIASES_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        rows = [(a, c, round(s, 4)) for a, (c, s) in self.aliases.items()]
+        pd.DataFrame(rows, columns=["alias", "canonical", "score"]).to_csv(path, index=False)
+
+    # ---------- index ----------
+    def _add_canonical(self, name: str):
+        key = name_key(name)
+        if key in self._by_key:
+            return
+        pos = len(self._canon)
+        grams = trigrams(key)
+        self._canon.append(name)
+        self._grams.append(grams)
+        self._numbers.append(numbers(key))
+        self._by_key[key] = name
+        for g in grams:
+            self._index.setdefault(g, []).append(pos)
+
+    def best_match(self, name: str):
+        """(canonical, dice score) of the closest indexed name with the same numbers, or (None, 0.0)."""
+        key = name_key(name)
+        if key in self._by_key:
+            return self._by_key[key], 1.0
+        grams, nums = trigrams(key), numbers(key)
+        shared = Counter()
+        for g in grams:
+            shared.update(self._index.get(g, ()))
+        best, best_score = None, 0.0
+        for pos, n in shared.items():
+            score = 2 * n / (len(grams) + len(self._grams[pos]))
+            if score > best_score and self._numbers[pos] == nums:
+                best, best_score = self._canon[pos], score
+        return best, best_score
+
+    # ---------- resolution ----------
+    def resolve_one(self, name: str, learn: bool = True) -> str:
+        if name in UNRESOLVED:
+            return name
+        if name in self.aliases:
+            return self.aliases[name][0]
+
+        match, score = self.best_match(name)
+        if match is None or score < self.threshold:
+            match, score = name, 1.0
+            if learn:
+                self._add_canonical(name)
+        if learn:
+            self.aliases[name] = (match, score)
+        return match
+
+    def resolve(self, names: pd.Series, learn: bool = True) -> pd.Series:
+        """
+        Map every name to its canonical spelling. Distinct names are resolved
+        once, most frequent first, so the common spelling becomes canonical.
+        With learn=False the index and cache are left untouched.
+        """
+        counts = names.dropna().value_counts(sort=True)
+        mapping = {n: self.resolve_one(n, learn=learn) for n in counts.index}
+        return names.map(mapping).where(names.notna(), names)
@@ -0,0 +1,203 @@
+"""
+Mergeable partial aggregates for KPI rollups.
+
+The fact table is scanned once into the finest grain cells (e.g. date x
+platform x shift type). Each cell stores only mergeable state:
+
+- `rows`, and `<col>_sum` / `<col>_n` (non-null count) per measure, so means
+  of any coarser grain are sum / n;
+- `<col>_min` / `<col>_max` for extremes;
+- `<col>_distinct`: a k-minimum-values sketch of the key hashes (exact below
+  DISTINCT_K distinct keys per group, an estimate above);
+- `<col>_sketch`: a quantile sketch (exact below SKETCH_CAPACITY values, then
+  compressed into equal-weight centroids).
+
+Coarser grains (week, month, platform, ...) are built by merging cells with
+`merge_partials`, never by rescanning the rows.
+"""
+import numpy as np
+import pandas as pd
+
+from common import metrics
+
+SKETCH_CAPACITY = 512
+DISTINCT_K = 1024
+
+_HASH_SPACE = float(2 ** 64)
+
+
+class QuantileSketch:
+    """Sorted (value, weight) centroids; unit weights until compressed."""
+
+    __slots__ = ("values", "weights")
+
+    def __init__(self, values=None, weights=None):
+        self.values = np.asarray([] if values is None else values, dtype="float64")
+        self.weights = np.ones(len(self.values)) if weights is None else np.asarray(weights, dtype="float64")
+
+    @classmethod
+    def from_sorted(cls, values: np.ndarray, capacity: int = SKETCH_CAPACITY):
+        return cls(values)._compress(capacity)
+
+    @classmethod
+    def merge_all(cls, sketches, capacity: int = SKETCH_CAPACITY):
+        sketches = [s for s in sketches if len(s.values)]
+        if not sketches:
+            return cls()
+        if len(sketches) == 1:
+            return sketches[0]
+        values = np.concatenate([s.values for s in sketches])
+        weights = np.concatenate([s.weights for s in sketches])
+        order = np.argsort(values, kind="stable")
+        return cls(values[order], weights[order])._compress(capacity)
+
+    def _compress(self, capacity: int):
+        if len(self.values) <= capacity:
+            return self
+        total = self.weights.sum()
+        mid = np.cumsum(self.weights) - self.weights / 2
+        bucket = np.minimum((mid / total * capacity).astype("int64"), capacity - 1)
+        w = np.bincount(bucket, weights=self.weights, minlength=capacity)
+        vw = np.bincount(bucket, weights=self.values * self.weights, minlength=capacity)
+        keep = w > 0
+        return QuantileSketch(vw[keep] / w[keep], w[keep])
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def quantile(self, q: float) -> float:
+        """Linear-interpolated quantile (matches np.percentile on exact sketches)."""
+        if not len(self.values):
+            return np.nan
+        if len(self.values) == self.weights.sum():
+            return float(np.quantile(self.values, q))
+        # rank of each centroid's middle element, 0-based
+        pos = np.cumsum(self.weights) - (self.weights + 1) / 2
+        return float(np.interp(q * (self.weights.sum() - 1), pos, self.values))
+
+
+class DistinctSketch:
+    """K minimum values over 64-bit hashes."""
+
+    __slots__ = ("hashes",)
+
+    def __init__(self, hashes=None):
+        self.hashes = np.asarray([] if hashes is None else hashes, dtype="uint64")
+
+    @classmethod
+    def merge_all(cls, sketches, k: int = DISTINCT_K):
+        sketches = [s for s in sketches if len(s.hashes)]
+        if len(sketches) <= 1:
+            return sketches[0] if sketches else cls()
+        return cls(np.unique(np.concatenate([s.hashes for s in sketches]))[:k])
+
+    def estimate(self, k: int = DISTINCT_K) -> float:
+        n = len(self.hashes)
+        if n < k:
+            return float(n)
+        return (k - 1) / ((float(self.hashes[k - 1]) + 1) / _HASH_SPACE)
+
+
+def _split_sorted(codes: np.ndarray, values: np.ndarray, n_groups: int) -> list:
+    """values sorted by (code, value) -> one array per group code."""
+    if n_groups == 0:
+        return []
+    bounds = np.searchsorted(codes, np.arange(1, n_groups))
+    return np.split(values, bounds)
+
+
+def _as_list(cols) -> list:
+    if cols is None:
+        return []
+    return [cols] if isinstance(cols, str) else list(cols)
+
+
+@metrics.timed("groupby:partial_aggregates")
+def partial_aggregates(df: pd.DataFrame, keys: list, measures=(), extremes=(), distinct=None, quantiles=None) -> pd.DataFrame:
+    """
+    One pass over `df`: a row per `keys` cell with rows, <measure>_sum,
+    <measure>_n, <extreme>_min/_max and the requested sketches.
+    """
+    grouped = df.groupby(keys, dropna=False, sort=True)
+    spec = {"rows": (keys[0], "size")}
+    for c in measures:
+        spec[f"{c}_sum"] = (c, "sum")
+        spec[f"{c}_n"] = (c, "count")
+    for c in extremes:
+        spec[f"{c}_min"] = (c, "min")
+        spec[f"{c}_max"] = (c, "max")
+    parts = grouped.agg(**spec).reset_index()
+
+    codes = grouped.ngroup().to_numpy()
+    n_groups = len(parts)
+
+    for col in _as_list(distinct):
+        ok = df[col].notna().to_numpy()
+        h = pd.util.hash_pandas_object(df[col], index=False).to_numpy()[ok]
+        c = codes[ok]
+        order = np.lexsort((h, c))
+        c, h = c[order], h[order]
+        first = np.ones(len(h), dtype=bool)
+        first[1:] = (c[1:] != c[:-1]) | (h[1:] != h[:-1])
+        c, h = c[first], h[first]
+        rank = np.arange(len(c)) - np.searchsorted(c, c)
+        c, h = c[rank < DISTINCT_K], h[rank < DISTINCT_K]
+        parts[f"{col}_distinct"] = [DistinctSketch(a) for a in _split_sorted(c, h, n_groups)]
+
+    for col in _as_list(quantiles):
+        v = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype="float64")
+        ok = ~np.isnan(v)
+        c, v = codes[ok], v[ok]
+        order = np.lexsort((v, c))
+        parts[f"{col}_sketch"] = [
+            QuantileSketch.from_sorted(a) for a in _split_sorted(c[order], v[order], n_groups)
+        ]
+
+    return parts
+
+
+@metrics.timed("groupby:merge_partials")
+def merge_partials(parts: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """Roll partial aggregates up to the coarser grain `keys` ([] = grand total)."""
+    how = {}
+    for c in parts.columns:
+        if c == "rows" or c.endswith(("_sum", "_n")):
+            how[c] = "sum"
+        elif c.endswith("_min"):
+            how[c] = "min"
+        elif c.endswith("_max"):
+            how[c] = "max"
+    if keys:
+        grouped = parts.groupby(keys, dropna=False, sort=True)
+        out = grouped.agg(how).reset_index()
+        codes = grouped.ngroup().to_numpy()
+    else:
+        out = pd.DataFrame({c: [parts[c].agg(f)] for c, f in how.items()})
+        codes = np.zeros(len(parts), dtype="int64")
+    order = np.argsort(codes, kind="stable")
+
+    def cells(col):
+        return _split_sorted(codes[order], parts[col].to_numpy()[order], len(out))
+
+    for c in parts.columns:
+        if c.endswith("_distinct"):
+            out[c] = [DistinctSketch.merge_all(g) for g in cells(c)]
+        elif c.endswith("_sketch"):
+            out[c] = [QuantileSketch.merge_all(g) for g in cells(c)]
+    return out
+
+
+def mean(parts: pd.DataFrame, col: str) -> pd.Series:
+    n = parts[f"{col}_n"]
+    return (parts[f"{col}_sum"] / n).where(n > 0)
+
+
+def quantile(parts: pd.DataFrame, col: str, q: float) -> pd.Series:
+    return parts[f"{col}_sketch"].map(lambda s: s.quantile(q)).astype("float64")
+
+
+def distinct_count(parts: pd.DataFrame, col: str) -> pd.Series:
+    # an estimate above the number of rows is never right
+    estimate = parts[f"{col}_distinct"].map(lambda s: s.estimate()).round().astype("int64")
+    return estimate.clip(upper=parts["rows"])
@@ -0,0 +1,141 @@
+"""
+Declared column types for the tables the pipeline writes.
+
+Keys are table names (file stem under data/clean or data/derived). Columns
+not listed are stored with whatever dtype pandas inferred, unless the table
+has a DEFAULT_KINDS entry. The same types are applied when a stage loads a
+table (common.storage.read_table), so frames arrive compact: low-cardinality
+text as categoricals, 32-bit ids, small integers and 0/1 indicators as narrow
+nullable ints, real booleans.
+
+Kinds:
+- "datetime": timestamp
+- "date":     calendar date
+- "bool":     True/False flag (nullable boolean)
+- "flag":     0/1 indicator (nullable Int8; stays 0/1 in CSV for Power BI)
+- "id":       integer key (nullable Int32)
+- "int":      small integer: hours, days, counts (nullable Int16)
+- "float":    float64; money stays here, it is summed into reported totals
+- "float32":  minute/hour durations, whole or near-whole numbers
+- "category": low-cardinality text
+- "str":      text
+"""
+
+_ORDER_TIMES = {
+    "ordered_time": "datetime",
+    "delivered_time": "datetime",
+    "order_date": "date",
+    "order_hour": "int",
+    "order_weekday": "category",
+}
+
+_ORDER_MONEY = {
+    "food_cost": "float",
+    "delivery_fee": "float",
+    "service_fee": "float",
+    "total_paid": "float",
+    "delivery_minutes": "float32",
+}
+
+_ORDER_FLAGS = {
+    "delivery_time_bad": "bool",
+    "delivery_minutes_outlier": "bool",
+}
+
+_FACT = {
+    "order_id": "str",
+    "user_id": "category",
+    "platform_id": "id",
+    "restaurant_id": "id",
+    "date_id": "id",
+    **_ORDER_TIMES,
+    **_ORDER_MONEY,
+    **_ORDER_FLAGS,
+    "total_fees": "float",
+    "fees_ratio": "float",
+    "is_weekend": "flag",
+}
+
+_ROSTER = {
+    "shift_type": "category",
+    "shift_start_dt": "datetime",
+    "shift_end_dt": "datetime",
+    "work_hours": "float32",
+    "is_workday": "flag",
+    "mins_after_shift_end": "float32",
+    "is_after_shift": "flag",
+}
+
+_FINANCE = {
+    "order_date_dt": "datetime",
+    "weekday": "int",
+    "is_payday": "flag",
+    "days_since_payday": "int",
+    "day_of_month": "int",
+    "is_rent_due": "flag",
+    "days_to_rent_due": "int",
+    "is_near_rent_due": "flag",
+}
+
+_BEHAVIOR = {
+    "spend_7d": "float",
+    "spend_30d": "float",
+    "days_since_last_order": "float32",
+    "days_since_last_order_restaurant": "float32",
+}
+
+SCHEMAS = {
+    "orders_clean": {
+        "user_id": "category",
+        "platform": "category",
+        "order_number": "str",
+        "order_status": "category",
+        "restaurant_name": "str",
+        "restaurant_category": "category",
+        "restaurant_type": "category",
+        "items_count": "int",
+        **_ORDER_TIMES,
+        **_ORDER_MONEY,
+        **_ORDER_FLAGS,
+        "delivery_before_order": "bool",
+        "year_mismatch": "bool",
+    },
+    "dim_platform": {"platform": "str", "platform_id": "id"},
+    "dim_restaurant": {"restaurant": "str", "restaurant_id": "id"},
+    "dim_date": {"date": "date", "date_id": "id", "is_weekend": "bool"},
+    "fact_orders": _FACT,
+    "orders_enriched_roster": {**_FACT, **_ROSTER},
+    "orders_roster_nlp": {**_FACT, **_ROSTER, "restaurant": "category"},
+    "orders_roster_nlp_fixed": {**_FACT, **_ROSTER, "restaurant": "category"},
+    "orders_finance_context": {**_FACT, **_ROSTER, **_FINANCE},
+    "orders_behavior_features": {**_FACT, **_ROSTER, **_BEHAVIOR},
+    "orders_stream": {
+        **_FACT, **_ROSTER, **_FINANCE,
+        "platform_raw": "category", "order_number": "str", "event_key": "str", "event_digest": "str",
+    },
+    "menu_features": {"restaurant": "category", "item_name": "str", "item_price": "float"},
+}
+
+# Kind of the columns a table does not list: menu_features has one 0/1 column
+# per keyword label, and menu_synonyms.csv can add labels
+DEFAULT_KINDS = {
+    "menu_features": "flag",
+}
+
+# How datetimes are rendered in each table's CSV form (pandas' ISO default otherwise)
+CSV_DATETIME_FORMATS = {
+    "orders_clean": "%d/%m/%Y %H:%M",
+}
+
+
+def table_schema(name: str, columns=()) -> dict:
+    """Declared kinds of table `name`, plus its DEFAULT_KINDS entry for any unlisted of `columns`."""
+    schema = SCHEMAS.get(name, {})
+    default = DEFAULT_KINDS.get(name)
+    if default:
+        schema = {**schema, **{c: default for c in columns if c not in schema}}
+    return schema
+
+
+def datetime_columns(name: str) -> list:
+    return [c for c, kind in table_schema(name).items() if kind == "datetime"]
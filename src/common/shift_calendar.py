@@ -0,0 +1,191 @@
+"""
+Shift templates and their expansion into concrete shift intervals.
+
+A template is a named daily window, e.g. "night shift" 23:00-07:00 (an end
+at or before the start runs into the next day). Templates without a window
+("day off") produce no interval. A ShiftCalendar holds:
+
+- templates, plus aliases for spellings found in the rosters
+  ("evenning shift");
+- recurring patterns: a list of template names, one per day, repeated from
+  a Monday (7 names make a weekly pattern, 14 a fortnightly rotation);
+- per-person overrides of single days (swaps, holidays).
+
+Every lookup is a template-code array indexed into offset arrays, so
+resolving the shift of millions of orders, or expanding years of patterns
+for many people, costs a few array operations regardless of the number of
+templates.
+
+    cal = default_calendar()
+    start, end = cal.intervals(order_dates, shift_types)
+
+    cal.add_pattern("weekdays", ["morning shift"] * 5 + ["day off"] * 2)
+    cal.add_override("alice", "2024-12-25", "day off")
+    roster = cal.expand("2024-01-01", "2025-12-31", {"alice": "weekdays", "bob": "weekdays"})
+"""
+import numpy as np
+import pandas as pd
+
+from common.users import USER_COL
+
+# name -> (start, end) as HH:MM, or None for templates without working hours
+TEMPLATES = {
+    "morning shift": ("07:00", "15:00"),
+    "evening shift": ("15:00", "23:00"),
+    "night shift": ("23:00", "07:00"),
+    "day off": None,
+}
+
+# roster spellings -> template names (after lower-casing and stripping)
+ALIASES = {"evenning shift": "evening shift"}
+
+UNKNOWN = "unknown"
+
+# pattern day 0 is a Monday
+_CYCLE_ANCHOR = pd.Timestamp("1970-01-05")
+_NAT = np.timedelta64("NaT", "ns")
+
+
+def _clock(hhmm: str) -> pd.Timedelta:
+    return pd.Timedelta(hhmm + ":00")
+
+
+class ShiftCalendar:
+    """Template registry, recurring patterns and per-person overrides."""
+
+    def __init__(self, templates: dict = None, aliases: dict = None):
+        self._names = []
+        self._start = []  # offset from midnight (timedelta64[ns], NaT = no window)
+        self._length = []
+        self.aliases = {}
+        self.patterns = {}
+        self._overrides = {}  # (user, date) -> template name
+        for name, window in (templates or {}).items():
+            self.add_template(name, *(window or (None, None)))
+        for alias, name in (aliases or {}).items():
+            self.add_alias(alias, name)
+
+    # ---- registry ----
+    def add_template(self, name: str, start: str = None, end: str = None):
+        """Register (or redefine) a template; without start/end it has no working window."""
+        name = name.lower().strip()
+        if start is None:
+            begin, length = _NAT, _NAT
+        else:
+            begin, stop = _clock(start), _clock(end)
+            length = stop - begin if stop > begin else stop + pd.Timedelta(days=1) - begin
+            begin, length = begin.to_timedelta64(), length.to_timedelta64()
+        if name in self._names:
+            i = self._names.index(name)
+            self._start[i], self._length[i] = begin, length
+        else:
+            self._names.append(name)
+            self._start.append(begin)
+            self._length.append(length)
+
+    def add_alias(self, alias: str, name: str):
+        if name not in self._names:
+            raise KeyError(f"Unknown shift template: {name}")
+        self.aliases[alias.lower().strip()] = name
+
+    def add_pattern(self, name: str, days: list):
+        """A cycle of template names (one per day) starting on a Monday."""
+        unknown = sorted({d for d in days if self._resolve(d) not in self._names})
+        if not days or unknown:
+            raise ValueError(f"Pattern {name!r} needs known templates, got: {unknown or 'no days'}")
+        self.patterns[name] = [self._resolve(d) for d in days]
+
+    def add_override(self, user: str, date, shift_type: str):
+        """`user` works `shift_type` on `date`, whatever their pattern says."""
+        if self._resolve(shift_type) not in self._names:
+            raise KeyError(f"Unknown shift template: {shift_type}")
+        self._overrides[(user, pd.Timestamp(date).normalize())] = self._resolve(shift_type)
+
+    @property
+    def templates(self) -> list:
+        return list(self._names)
+
+    # ---- lookups ----
+    def _resolve(self, name: str) -> str:
+        name = name.lower().strip()
+        return self.aliases.get(name, name)
+
+    def normalize(self, shift_type: pd.Series) -> pd.Series:
+        """Lower-cased, alias-resolved names ('unknown' for missing values)."""
+        st = shift_type.astype("string").fillna(UNKNOWN).str.lower().str.strip()
+        return st.replace(self.aliases) if self.aliases else st
+
+    def codes(self, names) -> np.ndarray:
+        """Template index per name; -1 for names that are not templates."""
+        return pd.Categorical(names, categories=self._names).codes.astype("int64")
+
+    def _windows(self, codes: np.ndarray) -> tuple:
+        # a trailing NaT slot serves code -1
+        start = np.array(self._start + [_NAT], dtype="timedelta64[ns]")
+        length = np.array(self._length + [_NAT], dtype="timedelta64[ns]")
+        return start[codes], length[codes]
+
+    def intervals(self, dates: pd.Series, shift_type: pd.Series) -> tuple:
+        """
+        (shift_start, shift_end) for shifts of the given types starting on
+        the given dates (times are dropped); NaT where the type has no window.
+        """
+        start, length = self._windows(self.codes(self.normalize(shift_type)))
+        day = pd.to_datetime(dates).dt.normalize()
+        shift_start = day + pd.to_timedelta(start)
+        shift_end = shift_start + pd.to_timedelta(length)
+        return shift_start.rename(None), shift_end.rename(None)
+
+    # ---- expansion ----
+    def expand(self, start, end, assignments: dict) -> pd.DataFrame:
+        """
+        One row per person and day from `start` to `end` (inclusive), following
+        `assignments` {user: pattern name} with overrides applied. Columns match
+        roster_join.build_shift_datetimes: date, shift_type, shift_start_dt,
+        shift_end_dt, work_hours, user_id.
+        """
+        if not assignments:
+            raise ValueError("No users to expand shifts for.")
+        missing = sorted(set(assignments.values()) - set(self.patterns))
+        if missing:
+            raise KeyError(f"Unknown pattern(s): {', '.join(missing)}")
+        dates = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq="D")
+        users = list(assignments)
+        n_days, n_users = len(dates), len(users)
+
+        # patterns as a padded code matrix, indexed by (pattern, day in cycle)
+        pattern_names = sorted(set(assignments.values()))
+        cycles = [self.codes(self.patterns[p]) for p in pattern_names]
+        period = np.array([len(c) for c in cycles])
+        matrix = np.full((len(cycles), period.max()), -1)
+        for i, c in enumerate(cycles):
+            matrix[i, :len(c)] = c
+
+        pat = np.repeat(pd.Categorical([assignments[u] for u in users], categories=pattern_names).codes, n_days)
+        day_no = np.tile((dates - _CYCLE_ANCHOR).days.to_numpy(), n_users)
+        codes = matrix[pat, day_no % period[pat]]
+
+        if self._overrides:
+            ov = pd.DataFrame(list(self._overrides), columns=["user", "date"])
+            ov["code"] = self.codes(list(self._overrides.values()))
+            ov["u"] = pd.Categorical(ov["user"], categories=users).codes.astype("int64")
+            ov["d"] = (ov["date"] - dates[0]).dt.days if n_days else -1
+            ov = ov[(ov["u"] >= 0) & ov["d"].between(0, n_days - 1)]
+            codes[ov["u"].to_numpy() * n_days + ov["d"].to_numpy()] = ov["code"].to_numpy()
+
+        begin, length = self._windows(codes)
+        day = np.tile(dates.to_numpy(), n_users)
+        shift_start = pd.Series(day + begin)
+        return pd.DataFrame({
+            "date": day.astype("datetime64[D]").astype(object),
+            "shift_type": np.asarray(self._names + [UNKNOWN], dtype=object)[codes],
+            "shift_start_dt": shift_start,
+            "shift_end_dt": shift_start + pd.to_timedelta(length),
+            "work_hours": pd.to_timedelta(length).total_seconds() / 3600,
+            USER_COL: np.repeat(np.asarray(users, dtype=object), n_days),
+        }).fillna({"work_hours": 0.0})
+
+
+def default_calendar() -> ShiftCalendar:
+    """A calendar with the roster's built-in TEMPLATES and ALIASES."""
+    return ShiftCalendar(TEMPLATES, ALIASES)
@@ -0,0 +1,245 @@
+"""
+Table I/O shared by the pipeline stages.
+
+Stages keep addressing tables by their CSV path (data/derived/fact_orders.csv);
+the on-disk format is chosen with the TAKEAWAY_TABLE_FORMAT env var:
+
+- "csv"     (default) CSV only, exactly what the scripts always wrote
+- "parquet" Parquet only, typed with the declared schema in common.schemas
+- "both"    Parquet for the pipeline, CSV alongside for Excel / Power BI
+
+Parquet needs pyarrow.
+"""
+import datetime as _dt
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from common import backend, metrics  # noqa: F401 (backend: Copy-on-Write on pandas < 3)
+from common.datetimes import KNOWN_FORMATS, parse_datetimes
+from common.schemas import table_schema, CSV_DATETIME_FORMATS
+
+FORMATS = ("csv", "parquet", "both")
+TABLE_FORMAT = os.environ.get("TAKEAWAY_TABLE_FORMAT", "csv").lower()
+if TABLE_FORMAT not in FORMATS:
+    raise ValueError(f"TAKEAWAY_TABLE_FORMAT must be one of {FORMATS}, got {TABLE_FORMAT!r}")
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "Parquet storage needs pyarrow (pip install pyarrow), "
+            "or set TAKEAWAY_TABLE_FORMAT=csv."
+        ) from e
+
+
+def table_name(path) -> str:
+    return Path(path).stem
+
+
+def parquet_path(path) -> Path:
+    return Path(path).with_suffix(".parquet")
+
+
+def stored_paths(path, fmt: str = None) -> list:
+    """Files that `write_table(df, path)` produces under the given format."""
+    fmt = fmt or TABLE_FORMAT
+    path = Path(path)
+    return {
+        "csv": [path],
+        "parquet": [parquet_path(path)],
+        "both": [parquet_path(path), path],
+    }[fmt]
+
+
+def _to_bool(s: pd.Series) -> pd.Series:
+    if s.dtype == bool:
+        return s
+    if s.dtype == object or pd.api.types.is_string_dtype(s):
+        s = s.map({"True": True, "False": False, "true": True, "false": False,
+                   True: True, False: False, 1: True, 0: False})
+    return s.astype("boolean")
+
+
+_INT_DTYPES = {"id": "Int32", "int": "Int16"}
+
+
+def apply_schema(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    """Coerce the declared columns of table `name` to their storage / in-memory types."""
+    df = df.copy(deep=False)
+    for col, kind in table_schema(name, df.columns).items():
+        if col not in df.columns:
+            continue
+        s = df[col]
+        if kind == "datetime":
+            df[col] = parse_datetimes(s, formats=[CSV_DATETIME_FORMATS.get(name, "%Y-%m-%d %H:%M:%S")] + KNOWN_FORMATS)
+        elif kind == "date":
+            df[col] = pd.to_datetime(s, errors="coerce").dt.date
+        elif kind == "bool":
+            df[col] = _to_bool(s)
+        elif kind == "flag":
+            if s.dtype == object or pd.api.types.is_bool_dtype(s) or pd.api.types.is_string_dtype(s):
+                s = _to_bool(s)
+            df[col] = pd.to_numeric(s, errors="coerce").round().astype("Int8")
+        elif kind in ("id", "int"):
+            df[col] = pd.to_numeric(s, errors="coerce").round().astype(_INT_DTYPES[kind])
+        elif kind in ("float", "float32"):
+            df[col] = pd.to_numeric(s, errors="coerce").astype("float64" if kind == "float" else "float32")
+        elif kind == "category":
+            if not isinstance(s.dtype, pd.CategoricalDtype):
+                df[col] = s.astype("string").replace({"nan": pd.NA}).astype("category")
+        elif kind == "str":
+            df[col] = s.astype("string").replace({"nan": pd.NA})
+    return df
+
+
+def _parquet_ready(df: pd.DataFrame) -> pd.DataFrame:
+    # pyarrow refuses object columns with mixed python types (e.g. str + float NaN)
+    df = df.copy(deep=False)
+    df.columns = [str(c) for c in df.columns]
+    for col in df.columns:
+        if df[col].dtype == object:
+            sample = df[col].dropna()
+            kinds = {type(v) for v in sample.head(1000)}
+            if len(kinds) > 1 or (kinds and not kinds <= {str, bool, _dt.date}):
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def write_table(df: pd.DataFrame, path, index: bool = False):
+    """Write `df` to `path` (a .csv path) in the configured format(s)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with metrics.step("write_table"):
+        if TABLE_FORMAT in ("parquet", "both"):
+            _require_pyarrow()
+            typed = _parquet_ready(apply_schema(df, table_name(path)))
+            typed.to_parquet(parquet_path(path), index=index)
+        if TABLE_FORMAT in ("csv", "both"):
+            df.to_csv(path, index=index, date_format=CSV_DATETIME_FORMATS.get(table_name(path)))
+    for p in stored_paths(path):
+        metrics.record_write(p, len(df))
+
+
+def table_exists(path) -> bool:
+    return any(p.exists() for p in stored_paths(path))
+
+
+def table_columns(path) -> list:
+    """Column names of a stored table without loading its rows."""
+    path = Path(path)
+    pq = parquet_path(path)
+    if pq.exists() and (TABLE_FORMAT != "csv" or not path.exists()):
+        _require_pyarrow()
+        import pyarrow.parquet as papq
+        return list(papq.read_schema(pq).names)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def append_table(df: pd.DataFrame, path):
+    """
+    Append rows to an existing table (same column layout as `df`).
+    CSV is appended in place; a Parquet file cannot be extended, so it is
+    rewritten with the new rows at the end.
+    """
+    path = Path(path)
+    before = {p: metrics.file_size(p) for p in stored_paths(path)}
+    with metrics.step("write_table"):
+        if TABLE_FORMAT in ("parquet", "both"):
+            _require_pyarrow()
+            pq = parquet_path(path)
+            typed = _parquet_ready(apply_schema(df, table_name(path)))
+            if pq.exists():
+                typed = pd.concat([pd.read_parquet(pq), typed], ignore_index=True)
+            typed.to_parquet(pq, index=False)
+        if TABLE_FORMAT in ("csv", "both"):
+            df.to_csv(
+                path, index=False, mode="a" if path.exists() else "w", header=not path.exists(),
+                date_format=CSV_DATETIME_FORMATS.get(table_name(path)),
+            )
+    for p, size in before.items():
+        metrics.record_write(p, len(df), nbytes=max(metrics.file_size(p) - size, 0))
+
+
+def read_table(path, columns=None, **csv_kwargs) -> pd.DataFrame:
+    """
+    Read a table written by `write_table`.
+
+    Parquet is preferred whenever the configured format produces it. Either
+    way the table's declared schema is applied on load (datetimes parsed with
+    their known format, compact dtypes), so callers get a ready-typed frame.
+    `columns` projects the read; requested columns that don't exist are ignored.
+    """
+    path = Path(path)
+    pq = parquet_path(path)
+    use_parquet = pq.exists() and (TABLE_FORMAT != "csv" or not path.exists())
+
+    with metrics.step("read_table"):
+        if use_parquet:
+            _require_pyarrow()
+            if columns is not None:
+                import pyarrow.parquet as papq
+                present = set(papq.read_schema(pq).names)
+                columns = [c for c in columns if c in present]
+            df = pd.read_parquet(pq, columns=columns)
+        else:
+            if columns is not None:
+                wanted = set(columns)
+                csv_kwargs["usecols"] = lambda c: c in wanted
+            df = pd.read_csv(path, **csv_kwargs)
+        df = apply_schema(df, table_name(path))
+
+    metrics.record_read(pq if use_parquet else path, len(df))
+    return df
+
+
+class TableWriter:
+    """
+    Incremental counterpart of write_table: append DataFrame chunks to a
+    table without holding it in memory. All chunks must share one column
+    layout. Use as a context manager.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.name = table_name(self.path)
+        self._pq_writer = None
+        self._csv_started = False
+        self.rows = 0
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        return self
+
+    @metrics.timed("write_table")
+    def write(self, df: pd.DataFrame):
+        if TABLE_FORMAT in ("parquet", "both"):
+            _require_pyarrow()
+            import pyarrow as pa
+            import pyarrow.parquet as papq
+
+            typed = _parquet_ready(apply_schema(df, self.name))
+            if self._pq_writer is None:
+                table = pa.Table.from_pandas(typed, preserve_index=False)
+                self._pq_writer = papq.ParquetWriter(parquet_path(self.path), table.schema)
+            else:
+                table = pa.Table.from_pandas(typed, schema=self._pq_writer.schema, preserve_index=False)
+            self._pq_writer.write_table(table)
+        if TABLE_FORMAT in ("csv", "both"):
+            df.to_csv(
+                self.path, index=False,
+                mode="a" if self._csv_started else "w", header=not self._csv_started,
+                date_format=CSV_DATETIME_FORMATS.get(self.name),
+            )
+            self._csv_started = True
+        self.rows += len(df)
+
+    def __exit__(self, *exc):
+        if self._pq_writer is not None:
+            self._pq_writer.close()
+        for p in stored_paths(self.path):
+            metrics.record_write(p, self.rows)
+        return False
@@ -0,0 +1,74 @@
+"""
+User (tenant) key for running the pipeline over many people's orders.
+
+Raw exports and roster.csv may carry a `user` / `user_id` column; rows
+without one belong to DEFAULT_USER, so a single-person setup works exactly
+as before. The key is carried as `user_id` through orders_clean, fact_orders
+and everything derived from them.
+
+Per-user work (the roster join, finance features, KPI cell builds) is split
+into one partition per user with `split_by_user` and spread over
+TAKEAWAY_USER_WORKERS processes by `map_partitions` (default 1: in-process).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+USER_COL = "user_id"
+DEFAULT_USER = "default"
+WORKERS = int(os.environ.get("TAKEAWAY_USER_WORKERS", "1"))
+
+# accepted spellings of the user column (after column-name normalization)
+USER_ALIASES = ["user_id", "user", "tenant_id", "tenant"]
+
+
+def with_user(df: pd.DataFrame) -> pd.DataFrame:
+    """`df` with a string `user_id` column (from an alias column, else DEFAULT_USER)."""
+    src = next((c for c in USER_ALIASES if c in df.columns), None)
+    if src is None:
+        df[USER_COL] = DEFAULT_USER
+        return df
+    users = df[src].astype("string").str.strip().replace("", pd.NA).fillna(DEFAULT_USER)
+    if src != USER_COL:
+        df = df.rename(columns={src: USER_COL})
+    df[USER_COL] = users.astype(object)
+    return df
+
+
+def scoped(keys: pd.Series, users: pd.Series) -> pd.Series:
+    """
+    Prefix natural keys with their user, except DEFAULT_USER's: single-user
+    keys (order ids, watermarks) stay what they were before users existed.
+    """
+    users = users.astype("string").fillna(DEFAULT_USER)
+    keys = keys.astype("string")
+    return keys.where(users.eq(DEFAULT_USER), users + "|" + keys)
+
+
+def split_by_user(df: pd.DataFrame) -> list:
+    """[(user, rows)] in sorted user order (a frame without users is one partition)."""
+    if USER_COL not in df.columns:
+        return [(DEFAULT_USER, df)]
+    users = df[USER_COL].astype("string").fillna(DEFAULT_USER)
+    return [(u, df[users.eq(u).to_numpy()]) for u in sorted(users.unique())]
+
+
+def map_partitions(fn, tasks: list, workers: int = None) -> list:
+    """
+    [fn(*task) for task in tasks], using up to `workers` processes when there
+    is more than one task. `fn` must be a module-level function.
+    """
+    workers = WORKERS if workers is None else workers
+    if workers <= 1 or len(tasks) <= 1:
+        return [fn(*t) for t in tasks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        return list(pool.map(fn, *zip(*tasks)))
+
+
+def apply_by_user(fn, df: pd.DataFrame) -> pd.DataFrame:
+    """fn(rows) for each user's rows (see map_partitions), concatenated back in `df` order."""
+    parts = split_by_user(df)
+    if len(parts) == 1:
+        return fn(df)
+    return pd.concat(map_partitions(fn, [(rows,) for _, rows in parts])).sort_index(kind="stable")
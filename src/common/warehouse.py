@@ -0,0 +1,156 @@
+"""
+Optional embedded warehouse for the star schema (single-file SQLite).
+
+Enabled with TAKEAWAY_WAREHOUSE=1 (or a path to the .sqlite file). When on,
+build_star_schema also loads dim_platform / dim_date / dim_restaurant /
+fact_orders into WAREHOUSE_PATH with primary keys, foreign keys and indexes
+on platform_id, restaurant_id, date_id and ordered_time. The eda scripts then
+read their column projections with SQL instead of parsing the CSVs, and
+eda_kpi counts the top restaurant in SQL on the restaurant_id index. The
+per-day cells are still built in pandas: they carry delivery-time sketches
+and are refreshed per changed date partition. Power BI can connect to the
+same file through an SQLite ODBC driver.
+
+Every query is recorded as a read of WAREHOUSE_PATH in metrics (rows
+returned; bytes are left at 0, since SQLite does not report the pages it
+touched).
+
+SQLite ships with Python, so no extra dependency is needed.
+"""
+import os
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+import pandas as pd
+
+from common import metrics
+from common.schemas import table_schema
+from common.storage import apply_schema
+
+_SETTING = os.environ.get("TAKEAWAY_WAREHOUSE", "")
+ENABLED = _SETTING not in ("", "0")
+WAREHOUSE_PATH = Path(_SETTING) if _SETTING not in ("", "0", "1") else Path("data/derived/warehouse.sqlite")
+
+DIMENSIONS = {
+    # table: (surrogate key, natural key)
+    "dim_platform": ("platform_id", "platform"),
+    "dim_date": ("date_id", "date"),
+    "dim_restaurant": ("restaurant_id", "restaurant"),
+}
+
+FACT_KEY = "order_id"
+FACT_INDEXES = ["platform_id", "restaurant_id", "date_id", "ordered_time"]
+
+_SQL_TYPES = {
+    "datetime": "TEXT", "date": "TEXT", "bool": "INTEGER", "flag": "INTEGER",
+    "id": "INTEGER", "int": "INTEGER", "float": "REAL", "float32": "REAL",
+    "category": "TEXT", "str": "TEXT",
+}
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def available() -> bool:
+    return ENABLED and WAREHOUSE_PATH.exists()
+
+
+def connect(path: Path = None) -> sqlite3.Connection:
+    return sqlite3.connect(path or WAREHOUSE_PATH)
+
+
+def _column_type(name: str, col: str, s: pd.Series) -> str:
+    kind = table_schema(name, [col]).get(col)
+    if kind:
+        return _SQL_TYPES[kind]
+    if pd.api.types.is_integer_dtype(s) or pd.api.types.is_bool_dtype(s):
+        return "INTEGER"
+    if pd.api.types.is_numeric_dtype(s):
+        return "REAL"
+    return "TEXT"
+
+
+def _sql_ready(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    """Timestamps/dates as ISO text and flags as 0/1, the way SQLite stores them."""
+    df = df.copy(deep=False)
+    schema = table_schema(name, df.columns)
+    for col in df.columns:
+        s = df[col]
+        kind = schema.get(col)
+        if pd.api.types.is_datetime64_any_dtype(s):
+            df[col] = s.dt.strftime("%Y-%m-%d %H:%M:%S").astype(object).where(s.notna(), None)
+        elif kind == "date":
+            df[col] = pd.to_datetime(s, errors="coerce").dt.strftime("%Y-%m-%d").astype(object)
+        elif kind == "bool" or pd.api.types.is_bool_dtype(s):
+            df[col] = s.map({True: 1, False: 0, "True": 1, "False": 0, 1: 1, 0: 0}).astype("Int64")
+    return df.astype(object).where(df.notna(), None)
+
+
+def _create_table(con, name: str, df: pd.DataFrame, key: str, references=None):
+    cols = []
+    for col in df.columns:
+        decl = f"{_quote(col)} {_column_type(name, col, df[col])}"
+        if col == key:
+            decl += " PRIMARY KEY"
+        elif references and col in references:
+            decl += f" REFERENCES {references[col]}({col})"
+        cols.append(decl)
+    con.execute(f'CREATE TABLE "{name}" ({", ".join(cols)})')
+
+
+def _insert(con, name: str, df: pd.DataFrame, verb: str = "INSERT"):
+    cols = ", ".join(map(_quote, df.columns))
+    marks = ", ".join("?" for _ in df.columns)
+    con.executemany(
+        f'{verb} INTO "{name}" ({cols}) VALUES ({marks})',
+        _sql_ready(df, name).itertuples(index=False, name=None),
+    )
+
+
+@metrics.timed("warehouse:load")
+def load_star_schema(dims: dict, fact: pd.DataFrame, path: Path = None):
+    """
+    Load the star schema in one transaction. Dimensions are upserted on their
+    surrogate key (ids are stable across runs); fact_orders is replaced.
+    """
+    path = Path(path or WAREHOUSE_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with closing(connect(path)) as con, con:
+        existing = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        for name, df in dims.items():
+            key, natural = DIMENSIONS[name]
+            layout = [r[1] for r in con.execute(f'PRAGMA table_info("{name}")')]
+            if name in existing and layout != list(df.columns):
+                con.execute(f'DROP TABLE "{name}"')
+                existing.discard(name)
+            if name not in existing:
+                _create_table(con, name, df, key)
+                con.execute(f'CREATE UNIQUE INDEX "ux_{name}_{natural}" ON "{name}"("{natural}")')
+            _insert(con, name, df, verb="INSERT OR REPLACE")
+
+        con.execute('DROP TABLE IF EXISTS "fact_orders"')
+        refs = {key: name for name, (key, _) in DIMENSIONS.items() if key in fact.columns}
+        _create_table(con, "fact_orders", fact, FACT_KEY if fact[FACT_KEY].is_unique else None, refs)
+        _insert(con, "fact_orders", fact)
+        for col in FACT_INDEXES:
+            if col in fact.columns:
+                con.execute(f'CREATE INDEX "ix_fact_orders_{col}" ON "fact_orders"("{col}")')
+
+
+@metrics.timed("warehouse:query")
+def query(sql: str, params=(), table: str = None) -> pd.DataFrame:
+    """Run `sql` against the warehouse; with `table`, its declared schema is applied."""
+    with closing(connect()) as con:
+        df = pd.read_sql_query(sql, con, params=params)
+    metrics.record_read(WAREHOUSE_PATH, len(df), nbytes=0, source="warehouse")
+    return apply_schema(df, table) if table else df
+
+
+def read_columns(table: str, columns=None) -> pd.DataFrame:
+    """SELECT a projection of `table`; requested columns that don't exist are ignored."""
+    with closing(connect()) as con:
+        present = [r[1] for r in con.execute(f'PRAGMA table_info("{table}")')]
+    cols = present if columns is None else [c for c in columns if c in present]
+    return query(f'SELECT {", ".join(map(_quote, cols))} FROM {_quote(table)}', table=table)
@@ -0,0 +1,164 @@
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # src/
+from common import metrics  # noqa: E402
+from common.loader import load_table  # noqa: E402
+from common.storage import write_table  # noqa: E402
+from common.users import USER_COL, with_user  # noqa: E402
+
+# ----------------------------
+# Config
+# ----------------------------
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+IN_PATH = PROJECT_ROOT / "data" / "derived" / "orders_enriched_roster.csv"
+OUT_PATH = PROJECT_ROOT / "data" / "derived" / "orders_behavior_features.csv"
+
+# rolling windows (days); each covers (ordered_time - window, ordered_time]
+WINDOWS = [7, 30]
+RESTAURANT_WINDOW = 30
+DAY_S = 86_400
+
+COUNT_FEATURES = [f"orders_{n}d" for n in WINDOWS] + [
+    "order_day_streak", f"restaurant_orders_{RESTAURANT_WINDOW}d", "restaurant_repeat_streak",
+]
+FEATURES = [c for n in WINDOWS for c in (f"orders_{n}d", f"spend_{n}d")] + [
+    "days_since_last_order", "order_day_streak",
+    f"restaurant_orders_{RESTAURANT_WINDOW}d", "days_since_last_order_restaurant", "restaurant_repeat_streak",
+]
+
+
+def _group_codes(df: pd.DataFrame, cols: list) -> np.ndarray:
+    return df.groupby(cols, sort=False, dropna=False, observed=True).ngroup().to_numpy()
+
+
+class SortedOrders:
+    """
+    Orders sorted by (group, ordered_time, original position), with a single
+    int64 key group * span + seconds, so one searchsorted call finds the
+    start of every order's time window inside its own group.
+    """
+
+    def __init__(self, group: np.ndarray, seconds: np.ndarray, max_window_s: int):
+        self.order = np.lexsort((np.arange(len(group)), seconds, group))
+        self.group = group[self.order]
+        self.seconds = seconds[self.order]
+        span = (int(self.seconds.max()) if len(seconds) else 0) + max_window_s + 1
+        self.key = self.group * span + self.seconds
+        self.pos = np.arange(len(group))
+        self.same_group = np.r_[False, self.group[1:] == self.group[:-1]]
+
+    def window_start(self, window_s: int) -> np.ndarray:
+        return np.searchsorted(self.key, self.key - window_s, side="right")
+
+    def rolling(self, values: np.ndarray, window_s: int) -> tuple:
+        """(sum, count) over each order's window, including the order itself; NaN values add 0."""
+        left = self.window_start(window_s)
+        csum = np.r_[0.0, np.cumsum(np.nan_to_num(values[self.order].astype("float64")))]
+        return csum[self.pos + 1] - csum[left], self.pos + 1 - left
+
+    def since_previous(self) -> np.ndarray:
+        """Days since the previous order of the same group (NaN for its first order)."""
+        gap = np.r_[np.nan, np.diff(self.seconds).astype("float64")] / DAY_S
+        return np.where(self.same_group, gap, np.nan)
+
+    def run_length(self, value: np.ndarray, step: int = 0) -> np.ndarray:
+        """
+        Length of the run ending at each order, where a run continues while
+        the group stays the same and `value` moves by exactly `step` (0: same
+        value again, 1: next day). Orders repeating the previous value keep
+        its run length when step > 0.
+        """
+        v = value[self.order]
+        if not len(v):
+            return np.zeros(0, dtype="int64")
+        prev = np.r_[v[:1], v[:-1]]
+        repeat = self.same_group & (v == prev)
+        if step:
+            # runs over distinct values: repeats are folded into the previous entry
+            first = ~repeat
+            idx = np.flatnonzero(first)
+            fv, fg = v[idx], self.same_group[idx]
+            cont = fg & (fv - np.r_[fv[:1], fv[:-1]] == step)
+            cont[0] = False
+            n = np.arange(len(idx))
+            start = np.maximum.accumulate(np.where(cont, 0, n))
+            return (n - start + 1)[np.cumsum(first) - 1]
+        start = np.maximum.accumulate(np.where(repeat, 0, self.pos))
+        return self.pos - start + 1
+
+    def unsort(self, values: np.ndarray) -> np.ndarray:
+        out = np.empty_like(values)
+        out[self.order] = values
+        return out
+
+
+@metrics.timed("behavior_features")
+def add_behavior_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-order behavioral features over each user's order history:
+    - orders_<n>d / spend_<n>d: orders and total_paid in the last n days
+      (the order itself included), for n in WINDOWS;
+    - restaurant_orders_30d: the same count for the order's restaurant;
+    - days_since_last_order (any restaurant) and
+      days_since_last_order_restaurant (same restaurant);
+    - order_day_streak: consecutive calendar days with orders, up to this
+      order's day;
+    - restaurant_repeat_streak: consecutive orders from this restaurant.
+    Orders without ordered_time get NaN. Everything is computed on sorted
+    arrays with cumulative sums and binary search: O(n log n), no per-group
+    Python loops.
+    """
+    df = with_user(df)
+    t = pd.to_datetime(df["ordered_time"], errors="coerce")
+    ok = t.notna().to_numpy()
+    rows = df[ok]
+    seconds = ((t[ok] - t[ok].min()) // pd.Timedelta(seconds=1)).to_numpy(dtype="int64")
+    spend = (
+        pd.to_numeric(rows["total_paid"], errors="coerce").to_numpy(dtype="float64")
+        if "total_paid" in rows.columns else np.zeros(len(rows))
+    )
+    has_restaurant = "restaurant_id" in rows.columns
+    max_window_s = max(WINDOWS + [RESTAURANT_WINDOW]) * DAY_S
+
+    out = {}
+    by_user = SortedOrders(_group_codes(rows, [USER_COL]), seconds, max_window_s)
+    for n in WINDOWS:
+        total, count = by_user.rolling(spend, n * DAY_S)
+        out[f"orders_{n}d"] = by_user.unsort(count)
+        out[f"spend_{n}d"] = by_user.unsort(np.round(total, 2))
+    out["days_since_last_order"] = by_user.unsort(by_user.since_previous())
+    day = (t[ok].dt.normalize() - pd.Timestamp(0)) // pd.Timedelta(days=1)
+    out["order_day_streak"] = by_user.unsort(by_user.run_length(day.to_numpy(dtype="int64"), step=1))
+
+    if has_restaurant:
+        known = rows["restaurant_id"].notna().to_numpy()
+        rest = rows["restaurant_id"].astype("float64").fillna(-1).to_numpy(dtype="int64")
+        by_rest = SortedOrders(_group_codes(rows, [USER_COL, "restaurant_id"]), seconds, max_window_s)
+        _, count = by_rest.rolling(np.zeros(len(rows)), RESTAURANT_WINDOW * DAY_S)
+        out[f"restaurant_orders_{RESTAURANT_WINDOW}d"] = np.where(known, by_rest.unsort(count.astype("float64")), np.nan)
+        out["days_since_last_order_restaurant"] = np.where(known, by_rest.unsort(by_rest.since_previous()), np.nan)
+        streak = by_user.unsort(by_user.run_length(rest).astype("float64"))
+        out["restaurant_repeat_streak"] = np.where(known, streak, np.nan)
+
+    for col, values in out.items():
+        full = pd.Series(np.nan, index=df.index)
+        full[ok] = values
+        if col in COUNT_FEATURES:
+            full = full.astype("Int32")
+        df[col] = full
+    return df
+
+
+def main():
+    df = load_table(IN_PATH)
+    df = add_behavior_features(df)
+    write_table(df, OUT_PATH)
+    print(f"Saved: {OUT_PATH}")
+    print(df[["ordered_time"] + [c for c in FEATURES if c in df.columns]].head(10))
+
+
+if __name__ == "__main__":
+    main()
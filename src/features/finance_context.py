@@ -1,6 +1,12 @@
+import sys
 import pandas as pd
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # src/
+from common import backend, metrics  # noqa: E402
+from common.storage import read_table, write_table  # noqa: E402
+from common.users import apply_by_user  # noqa: E402
+
 # ----------------------------
 # Config
 # ----------------------------
@@ -8,6 +14,7 @@ PROJECT_ROOT = Path(__file__).resolve().parents[2]
 IN_PATH = PROJECT_ROOT / "data" / "derived" / "orders_enriched_roster.csv"
 OUT_PATH = PROJECT_ROOT / "data" / "derived" / "orders_finance_context.csv"
 
+@metrics.timed("finance_features")
 def add_finance_features(df: pd.DataFrame) -> pd.DataFrame:
     # Ensure order_date exists
     if "order_date" not in df.columns:
@@ -40,16 +47,45 @@ def add_finance_features(df: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
+@backend.transform("finance_features")
+def finance_features_by_user(df: pd.DataFrame) -> pd.DataFrame:
+    # row-level features, computed per user partition
+    return apply_by_user(add_finance_features, df)
+
+@backend.transform("finance_features", engine="polars", inputs=["order_date", "ordered_time"])
+def finance_features_polars(lf, pl):
+    # same columns as add_finance_features; flags are 0 (not null) for missing dates
+    if "order_date" not in lf.collect_schema().names():
+        lf = lf.with_columns(pl.col("ordered_time").cast(pl.Datetime("us"), strict=False).dt.date().alias("order_date"))
+    date = pl.col("order_date").cast(pl.Date, strict=False)
+    weekday = date.dt.weekday() - 1  # polars: Monday=1
+    day = date.dt.day()
+
+    def flag(cond):
+        return cond.fill_null(False).cast(pl.Int64)
+
+    return lf.select(
+        pl.col("order_date"),
+        date.cast(pl.Datetime("us")).alias("order_date_dt"),
+        weekday.alias("weekday"),
+        flag(weekday == 4).alias("is_payday"),
+        ((weekday + 3) % 7).alias("days_since_payday"),
+        day.alias("day_of_month"),
+        flag(day == 30).alias("is_rent_due"),
+        (30 - day).alias("days_to_rent_due"),
+        flag(day.is_in([27, 28, 29, 30])).alias("is_near_rent_due"),
+    )
+
 def main():
-    df = pd.read_csv(IN_PATH)
+    df = read_table(IN_PATH)
 
     # Safety: make sure key money fields are numeric
     for c in ["total_paid", "food_cost", "delivery_fee", "service_fee"]:
         if c in df.columns:
             df[c] = pd.to_numeric(df[c], errors="coerce")
 
-    df2 = add_finance_features(df)
-    df2.to_csv(OUT_PATH, index=False)
+    df2 = backend.derive(df, "finance_features")
+    write_table(df2, OUT_PATH)
     print(f"Saved: {OUT_PATH}")
     print(df2[["order_date", "weekday", "is_payday", "days_since_payday",
                "day_of_month", "is_rent_due", "days_to_rent_due", "is_near_rent_due"]].head(10))
@@ -1,48 +1,37 @@
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # src/
+from common import metrics  # noqa: E402
+from common.shift_calendar import default_calendar  # noqa: E402
+from common.storage import read_table, write_table  # noqa: E402
+
 IN_PATH = Path("data/derived/orders_roster_nlp.csv")
 OUT_PATH = Path("data/derived/orders_roster_nlp_fixed.csv")
 
+CALENDAR = default_calendar()
+
 def parse_dt(s):
     # 兼容各种乱格式
     return pd.to_datetime(s, errors="coerce")
 
+@metrics.timed("roster:shift_datetimes")
 def build_shift_datetimes(order_dt: pd.Series, shift_type: pd.Series):
     """
     shift_type expects values like:
     'morning shift', 'evenning shift', 'evening shift', 'night shift', 'day off', 'Unknown'
-    """
-    # 统一命名
-    st = shift_type.fillna("Unknown").str.lower().str.strip()
-    st = st.replace({"evenning shift": "evening shift"})  # 你数据里拼写错了
-
-    order_date = order_dt.dt.normalize()  # 当天 00:00
-
-    # 默认 Unknown/day off -> NaT
-    shift_start = pd.Series(pd.NaT, index=order_dt.index)
-    shift_end = pd.Series(pd.NaT, index=order_dt.index)
-
-    # morning 07-15
-    m = st.eq("morning shift")
-    shift_start.loc[m] = order_date.loc[m] + pd.Timedelta(hours=7)
-    shift_end.loc[m] = order_date.loc[m] + pd.Timedelta(hours=15)
-
-    # evening 15-23
-    e = st.eq("evening shift")
-    shift_start.loc[e] = order_date.loc[e] + pd.Timedelta(hours=15)
-    shift_end.loc[e] = order_date.loc[e] + pd.Timedelta(hours=23)
-
-    # night 23-07 next day
-    n = st.eq("night shift")
-    shift_start.loc[n] = order_date.loc[n] + pd.Timedelta(hours=23)
-    shift_end.loc[n] = order_date.loc[n] + pd.Timedelta(days=1, hours=7)
 
+    Shift windows (and the spelling fixes) come from the shift calendar's
+    templates; Unknown/day off -> NaT.
+    """
+    st = CALENDAR.normalize(shift_type)
+    shift_start, shift_end = CALENDAR.intervals(order_dt, st)
     return shift_start, shift_end, st
 
 def main():
-    df = pd.read_csv(IN_PATH)
+    df = read_table(IN_PATH)
 
     # 1) 找到订单时间列
     time_col = None
@@ -85,7 +74,7 @@ def main():
     print("Non-null shift_end_dt:", int(df["shift_end_dt"].notna().sum()))
     print("is_after_shift_fixed=1:", int((df["is_after_shift_fixed"] == 1).sum()))
 
-    df.to_csv(OUT_PATH, index=False)
+    write_table(df, OUT_PATH)
     print("🎯 Output:", OUT_PATH.as_posix())
 
 if __name__ == "__main__":
@@ -1,12 +1,32 @@
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # src/
+from common import backend, metrics, warehouse  # noqa: E402
+from common.datetimes import parse_datetimes  # noqa: E402
+from common.restaurant_names import RestaurantResolver, ALIASES_PATH  # noqa: E402
+from common.storage import apply_schema, read_table, table_exists, write_table  # noqa: E402
+from common.order_keys import key_parts, occurrence  # noqa: E402
+from common.users import with_user  # noqa: E402
+
 IN_PATH = Path("data/clean/orders_clean.csv")
 OUT_DIR = Path("data/derived")
 
+FACT_COLUMNS = [
+    "order_id", "user_id", "platform_id", "restaurant_id", "date_id",
+    "ordered_time", "delivered_time",
+    "order_date", "order_hour", "order_weekday",
+    "food_cost", "delivery_fee", "service_fee", "total_paid",
+    "delivery_minutes", "total_fees", "fees_ratio",
+    "delivery_time_bad", "delivery_minutes_outlier",
+    "is_weekend"
+]
+
 def parse_dt(s):
-    return pd.to_datetime(s, errors="coerce", dayfirst=True)
+    # day-first export layouts; a no-op when the column is already typed
+    return parse_datetimes(s, repair=lambda x: pd.to_datetime(x, errors="coerce", dayfirst=True))
 
 def standardize_platform(s: pd.Series) -> pd.Series:
     return (
@@ -20,11 +40,14 @@ def standardize_platform(s: pd.Series) -> pd.Series:
          })
     )
 
-def standardize_restaurant(df: pd.DataFrame) -> pd.Series:
+def standardize_restaurant(df: pd.DataFrame, resolver: RestaurantResolver = None) -> pd.Series:
     """
     Create ONE canonical restaurant column for modeling.
     Preference order:
     restaurant_name_std > restaurant_name > restaurant
+
+    With a resolver, spelling variants across platforms are folded into one
+    canonical name (see common.restaurant_names).
     """
     src_col = None
     for c in ["restaurant_name_std", "restaurant_name", "restaurant"]:
@@ -40,12 +63,75 @@ def standardize_restaurant(df: pd.DataFrame) -> pd.Series:
     out = out.astype(str).str.strip()
     out.loc[out.isin(["", "nan", "None"])] = np.nan
     out = out.fillna("Unknown")
+    if resolver is not None:
+        out = resolver.resolve(out)
     return out
 
-def main():
-    df = pd.read_csv(IN_PATH)
+def load_dim(name: str, key: str, id_col: str) -> pd.DataFrame:
+    """Previously published dimension (empty if none), keyed the way upsert_dim expects."""
+    path = OUT_DIR / f"{name}.csv"
+    if not table_exists(path):
+        return pd.DataFrame(columns=[key, id_col])
+    dim = read_table(path)
+    if key == "date":
+        dim[key] = pd.to_datetime(dim[key], errors="coerce").dt.date
+    else:
+        dim[key] = dim[key].astype(str)
+    dim[id_col] = pd.to_numeric(dim[id_col], errors="coerce")
+    return dim.dropna(subset=[key, id_col])
 
-    # Re-parse datetime
+def upsert_dim(existing: pd.DataFrame, members: pd.Series, key: str, id_col: str) -> pd.DataFrame:
+    """
+    Keep every published (key, id) pair and append unseen members with ids
+    after the current maximum, in order of first appearance. Members that no
+    longer occur keep their row, so a surrogate key is never reused.
+    """
+    dim = existing[[key, id_col]].astype({id_col: "int64"})
+    new = members.drop_duplicates()
+    new = new[~new.isin(dim[key])]
+    start = int(dim[id_col].max()) + 1 if len(dim) else 1
+    added = pd.DataFrame({key: new.to_numpy(), id_col: range(start, start + len(new))})
+    return pd.concat([dim, added], ignore_index=True) if len(dim) else added
+
+def natural_order_ids(df: pd.DataFrame) -> pd.Series:
+    """
+    Deterministic order_id: hash of the natural key parts and occurrence
+    (common.order_keys), so the id does not change when a fee or a derived
+    column is corrected.
+    """
+    # undated rows keep "" (not clean_orders' "NaT"): ids are unchanged from before
+    keys = key_parts(df)
+    keys["seq"] = occurrence(keys)
+    return pd.util.hash_pandas_object(keys, index=False).astype("int64").astype(str)
+
+@backend.transform("dimension_keys")
+def dimension_keys(fact: pd.DataFrame, dim_platform, dim_date, dim_restaurant) -> pd.DataFrame:
+    """platform_id, date_id and restaurant_id of every fact row (left joins on the dimensions)."""
+    fact = fact.merge(dim_platform, on="platform", how="left")
+    if "ordered_time" in fact.columns:
+        fact["date"] = fact["ordered_time"].dt.date
+        fact = fact.merge(dim_date[["date_id", "date"]], on="date", how="left")
+    else:
+        fact["date_id"] = np.nan
+    return fact.merge(dim_restaurant, on="restaurant", how="left")
+
+@backend.transform("dimension_keys", engine="polars", inputs=["platform", "restaurant", "ordered_time"])
+def dimension_keys_polars(lf, pl, dim_platform, dim_date, dim_restaurant):
+    lf = lf.with_row_index("_row").with_columns(pl.col("platform").cast(pl.String), pl.col("restaurant").cast(pl.String))
+    lf = lf.join(dim_platform.select(pl.col("platform").cast(pl.String), "platform_id"), on="platform", how="left")
+    if "ordered_time" in lf.collect_schema().names():
+        dates = dim_date.select(pl.col("date").cast(pl.Date), "date_id")
+        lf = lf.with_columns(pl.col("ordered_time").dt.date().alias("date")).join(dates, on="date", how="left")
+    else:
+        lf = lf.with_columns(pl.lit(None, dtype=pl.Float64).alias("date_id"))
+    restaurants = dim_restaurant.select(pl.col("restaurant").cast(pl.String), "restaurant_id")
+    lf = lf.join(restaurants, on="restaurant", how="left")
+    # joins may reorder rows: back to input order
+    return lf.sort("_row").select("platform_id", "date_id", "restaurant_id")
+
+def prepare_fact_rows(df: pd.DataFrame, resolver: RestaurantResolver) -> pd.DataFrame:
+    """Row-level fact columns of cleaned orders: typed times, fees, weekend flag, platform, restaurant."""
+    # Re-parse datetime (no-op when the table was stored typed)
     if "ordered_time" in df.columns:
         df["ordered_time"] = parse_dt(df["ordered_time"])
     if "delivered_time" in df.columns:
@@ -74,25 +160,30 @@ def main():
     else:
         df["platform"] = "Unknown"
 
-    # Canonical restaurant (ONE column)
-    df["restaurant"] = standardize_restaurant(df)
+    # Canonical restaurant (ONE column); only names unseen in earlier runs get scored
+    df["restaurant"] = standardize_restaurant(df, resolver)
+    return df
+
+def main():
+    df = with_user(read_table(IN_PATH))
+    resolver = RestaurantResolver.load(ALIASES_PATH)
+    df = prepare_fact_rows(df, resolver)
 
     OUT_DIR.mkdir(parents=True, exist_ok=True)
 
+    # Dimensions are upserted: published surrogate keys never change between runs
     # -------- dim_platform --------
-    dim_platform = df[["platform"]].drop_duplicates().reset_index(drop=True)
-    dim_platform["platform_id"] = range(1, len(dim_platform) + 1)
+    dim_platform = upsert_dim(
+        load_dim("dim_platform", "platform", "platform_id"), df["platform"], "platform", "platform_id"
+    )
 
     # -------- dim_date (exclude NaT) --------
     if "ordered_time" in df.columns:
-        dim_date = (
-            df.loc[df["ordered_time"].notna(), "ordered_time"]
-              .dt.date
-              .drop_duplicates()
-              .reset_index(drop=True)
-              .to_frame(name="date")
+        dim_date = upsert_dim(
+            load_dim("dim_date", "date", "date_id"),
+            df.loc[df["ordered_time"].notna(), "ordered_time"].dt.date,
+            "date", "date_id",
         )
-        dim_date["date_id"] = range(1, len(dim_date) + 1)
         dt = pd.to_datetime(dim_date["date"])
         dim_date["year"] = dt.dt.year
         dim_date["month"] = dt.dt.month
@@ -102,47 +193,38 @@ def main():
         dim_date = pd.DataFrame(columns=["date","date_id","year","month","weekday","is_weekend"])
 
     # -------- dim_restaurant (no blanks, includes Unknown if needed) --------
-    dim_restaurant = df[["restaurant"]].drop_duplicates().reset_index(drop=True)
-    dim_restaurant["restaurant_id"] = range(1, len(dim_restaurant) + 1)
+    dim_restaurant = upsert_dim(
+        load_dim("dim_restaurant", "restaurant", "restaurant_id"), df["restaurant"], "restaurant", "restaurant_id"
+    )
 
     # -------- fact_orders --------
-    fact = df.copy()
-
-    fact = fact.merge(dim_platform, on="platform", how="left")
-
-    if "ordered_time" in fact.columns:
-        fact["date"] = fact["ordered_time"].dt.date
-        fact = fact.merge(dim_date[["date_id", "date"]], on="date", how="left")
-    else:
-        fact["date_id"] = np.nan
-
-    fact = fact.merge(dim_restaurant, on="restaurant", how="left")
+    with metrics.step("merge:dimensions"):
+        fact = backend.derive(
+            df, "dimension_keys",
+            dim_platform=dim_platform, dim_date=dim_date[["date_id", "date"]], dim_restaurant=dim_restaurant,
+        )
 
     if "order_id" not in fact.columns:
-        fact["order_id"] = (
-            pd.util.hash_pandas_object(fact.fillna(""), index=False)
-              .astype("int64")
-              .astype(str)
-        )
+        fact["order_id"] = natural_order_ids(fact)
 
-    keep_cols = [
-        "order_id", "platform_id", "restaurant_id", "date_id",
-        "ordered_time", "delivered_time",
-        "order_date", "order_hour", "order_weekday",
-        "food_cost", "delivery_fee", "service_fee", "total_paid",
-        "delivery_minutes", "total_fees", "fees_ratio",
-        "delivery_time_bad", "delivery_minutes_outlier",
-        "is_weekend"
-    ]
-    keep_cols = [c for c in keep_cols if c in fact.columns]
-    fact_orders = fact[keep_cols].copy()
+    keep_cols = [c for c in FACT_COLUMNS if c in fact.columns]
+    # declared compact dtypes (e.g. date_id as Int32, not 1.0 after the merge)
+    fact_orders = apply_schema(fact[keep_cols], "fact_orders")
 
     # -------- Save --------
     # 提醒：如果 Excel/PowerBI 正在打开这些文件，会 Permission denied
-    dim_platform.to_csv(OUT_DIR / "dim_platform.csv", index=False)
-    dim_date.to_csv(OUT_DIR / "dim_date.csv", index=False)
-    dim_restaurant.to_csv(OUT_DIR / "dim_restaurant.csv", index=False)
-    fact_orders.to_csv(OUT_DIR / "fact_orders.csv", index=False)
+    write_table(dim_platform, OUT_DIR / "dim_platform.csv")
+    write_table(dim_date, OUT_DIR / "dim_date.csv")
+    write_table(dim_restaurant, OUT_DIR / "dim_restaurant.csv")
+    write_table(fact_orders, OUT_DIR / "fact_orders.csv")
+    resolver.save(ALIASES_PATH)
+
+    if warehouse.ENABLED:
+        warehouse.load_star_schema(
+            {"dim_platform": dim_platform, "dim_date": dim_date, "dim_restaurant": dim_restaurant},
+            fact_orders,
+        )
+        print(f"✅ Star schema loaded into {warehouse.WAREHOUSE_PATH}")
 
     print("✅ Star schema saved to data/derived")
 
@@ -1,52 +1,76 @@
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # src/
+from common import backend, rollups, warehouse  # noqa: E402
+from common.partitions import PartitionedPartials  # noqa: E402
+from common.loader import load_table  # noqa: E402
+from common.metrics import record_write  # noqa: E402
+from common.users import with_user  # noqa: E402
+
 FACT_PATH = Path("data/derived/fact_orders.csv")
 OUT_DIR = Path("data/derived")
 REPORTS_DIR = Path("reports")
 
-def main():
-    df = pd.read_csv(FACT_PATH)
+FACT_COLUMNS = [
+    "order_id", "user_id", "restaurant_id", "ordered_time", "items_count",
+    "food_cost", "total_paid", "delivery_minutes", "fees_ratio",
+]
 
-    # ---- datetime ----
-    df["ordered_time"] = pd.to_datetime(df["ordered_time"], errors="coerce")
-    df = df[df["ordered_time"].notna()].copy()
+CELL_KEYS = ["order_date", "user_id", "restaurant_id"]
+MEASURES = ["is_dinner", "is_late_night", "cost_per_item", "fees_ratio", "mins_per_currency", "has_order_id"]
 
+@backend.transform("behavior_time_features")
+def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
     df["order_date"] = df["ordered_time"].dt.date
     df["order_hour"] = df["ordered_time"].dt.hour
-    df["order_week"] = df["ordered_time"].dt.to_period("W").astype(str)
-
-    # ---- frequency ----
-    weekly_orders = (
-        df.groupby("order_week")["order_id"]
-          .nunique()
-          .mean()
+    df["is_dinner"] = df["order_hour"].between(18, 21).astype(int)
+    df["is_late_night"] = df["order_hour"].isin([22,23,0,1,2,3,4,5]).astype(int)
+    return df
+
+@backend.transform("behavior_time_features", engine="polars", inputs=["ordered_time"])
+def time_features_polars(lf, pl):
+    hour = pl.col("ordered_time").dt.hour()
+    return lf.select(
+        pl.col("ordered_time").dt.date().alias("order_date"),
+        hour.alias("order_hour"),
+        hour.is_between(18, 21).fill_null(False).cast(pl.Int64).alias("is_dinner"),
+        hour.is_in([22, 23, 0, 1, 2, 3, 4, 5]).fill_null(False).cast(pl.Int64).alias("is_late_night"),
     )
 
-    dinner_share = df["order_hour"].between(18, 21).mean()
-    late_night_share = df["order_hour"].isin([22,23,0,1,2,3,4,5]).mean()
+def build_cells(df: pd.DataFrame) -> pd.DataFrame:
+    """Mergeable partials per (date, user, restaurant); first/last order time feed the repurchase gap.
 
-    # ---- repeat purchase & interval ----
-    repeat_stats = None
-    avg_repurchase_gap = np.nan
+    order_id is unique in fact_orders, so orders are counted exactly as the sum
+    of has_order_id (as in eda_kpi) rather than with a distinct sketch.
+    """
+    has_id = df["order_id"].notna() if "order_id" in df.columns else pd.Series(True, index=df.index)
+    return rollups.partial_aggregates(
+        df.assign(has_order_id=has_id.astype("int64")), CELL_KEYS, measures=MEASURES, extremes=["ordered_time"],
+    )
 
-    if "restaurant_id" in df.columns:
-        df_sorted = df.sort_values(["restaurant_id", "ordered_time"])
-        df_sorted["prev_time"] = df_sorted.groupby("restaurant_id")["ordered_time"].shift(1)
-        df_sorted["repurchase_gap_days"] = (
-            (df_sorted["ordered_time"] - df_sorted["prev_time"])
-            .dt.total_seconds() / (3600 * 24)
-        )
+def weekly_order_counts(cells: pd.DataFrame) -> pd.Series:
+    """Orders per ISO week, merged from the day cells."""
+    days = rollups.merge_partials(cells, ["order_date"])
+    days["order_week"] = pd.to_datetime(days["order_date"]).dt.to_period("W").astype(str)
+    weeks = rollups.merge_partials(days, ["order_week"])
+    return weeks.set_index("order_week")["has_order_id_sum"].astype("int64")
+
+def main():
+    if warehouse.available():
+        df = warehouse.read_columns("fact_orders", FACT_COLUMNS)
+    else:
+        df = load_table(FACT_PATH, columns=FACT_COLUMNS)
 
-        repeat_stats = (
-            df.groupby("restaurant_id")["order_id"]
-              .nunique()
-              .reset_index(name="orders_cnt")
-              .sort_values("orders_cnt", ascending=False)
-        )
+    # ---- datetime ----
+    df["ordered_time"] = pd.to_datetime(df["ordered_time"], errors="coerce")
+    df = with_user(df[df["ordered_time"].notna()])
 
-        avg_repurchase_gap = df_sorted["repurchase_gap_days"].mean()
+    df = backend.derive(df, "behavior_time_features")
+    if "restaurant_id" not in df.columns:
+        df["restaurant_id"] = np.nan
 
     # ---- value for money ----
     if "items_count" in df.columns:
@@ -56,15 +80,39 @@ def main():
 
     df["mins_per_currency"] = df["delivery_minutes"] / df["total_paid"]
 
+    # ---- partials: only dates whose orders changed are re-aggregated ----
+    digest_cols = [c for c in FACT_COLUMNS if c in df.columns]
+    store = PartitionedPartials("eda_behavior_metrics", {"keys": CELL_KEYS, "measures": MEASURES, "columns": digest_cols})
+    cells, changed = store.refresh(df, "order_date", digest_cols, build_cells)
+    overall = rollups.merge_partials(cells, []).iloc[0]
+
+    def overall_mean(col):
+        return overall[f"{col}_sum"] / overall[f"{col}_n"] if overall[f"{col}_n"] else np.nan
+
+    # ---- frequency ----
+    weekly_orders = weekly_order_counts(cells).mean()
+
+    dinner_share = overall_mean("is_dinner")
+    late_night_share = overall_mean("is_late_night")
+
+    # ---- repeat purchase & interval ----
+    # mean gap between a user's consecutive orders of a restaurant = (last - first) / (orders - 1), pooled
+    avg_repurchase_gap = np.nan
+    rest = rollups.merge_partials(cells.dropna(subset=["restaurant_id"]), ["user_id", "restaurant_id"])
+    n_gaps = (rest["rows"] - 1).sum()
+    if n_gaps > 0:
+        span_days = (rest["ordered_time_max"] - rest["ordered_time_min"]).dt.total_seconds() / (3600 * 24)
+        avg_repurchase_gap = span_days.sum() / n_gaps
+
     # ---- summary table ----
     metrics = {
         "avg_orders_per_week": weekly_orders,
         "dinner_share": dinner_share,
         "late_night_share": late_night_share,
         "avg_repurchase_gap_days": avg_repurchase_gap,
-        "avg_cost_per_item": df["cost_per_item"].mean(),
-        "avg_fees_ratio": df["fees_ratio"].mean(),
-        "avg_mins_per_currency": df["mins_per_currency"].mean(),
+        "avg_cost_per_item": overall_mean("cost_per_item"),
+        "avg_fees_ratio": overall_mean("fees_ratio"),
+        "avg_mins_per_currency": overall_mean("mins_per_currency"),
     }
 
     metrics_df = pd.DataFrame(
@@ -75,6 +123,7 @@ def main():
     REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 
     metrics_df.to_csv(OUT_DIR / "behavior_metrics.csv", index=False)
+    record_write(OUT_DIR / "behavior_metrics.csv", len(metrics_df))
 
     # ---- insights report ----
     lines = [
@@ -83,15 +132,15 @@ def main():
         f"- Dinner order share (18–22): {dinner_share:.2%}",
         f"- Late-night order share (22–05): {late_night_share:.2%}",
         f"- Average repurchase gap (days): {avg_repurchase_gap:.1f}" if not np.isnan(avg_repurchase_gap) else "- Repurchase gap: n/a",
-        f"- Average cost per item: {df['cost_per_item'].mean():.2f}",
-        f"- Average fees ratio: {df['fees_ratio'].mean():.2%}",
-        f"- Delivery minutes per currency unit: {df['mins_per_currency'].mean():.2f}",
+        f"- Average cost per item: {metrics['avg_cost_per_item']:.2f}",
+        f"- Average fees ratio: {metrics['avg_fees_ratio']:.2%}",
+        f"- Delivery minutes per currency unit: {metrics['avg_mins_per_currency']:.2f}",
     ]
 
     with open(REPORTS_DIR / "behavior_insights.md", "w", encoding="utf-8") as f:
         f.write("\n".join(lines))
 
-    print("✅ Behavior metrics generated.")
+    print(f"✅ Behavior metrics generated ({len(changed)} date partition(s) recomputed).")
 
 if __name__ == "__main__":
     main()
@@ -1,98 +1,196 @@
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # src/
+from common import backend, metrics, rollups, warehouse  # noqa: E402
+from common.partitions import PartitionedPartials  # noqa: E402
+from common.loader import load_table  # noqa: E402
+from common.storage import table_exists  # noqa: E402
+from common.users import with_user  # noqa: E402
+
 FACT_PATH = Path("data/derived/fact_orders.csv")
+ROSTER_PATH = Path("data/derived/orders_enriched_roster.csv")  # optional: shift_type per order
 OUT_DIR = Path("data/derived")
 REPORTS_DIR = Path("reports")
 
+FACT_COLUMNS = [
+    "order_id", "user_id", "platform_id", "restaurant_id", "ordered_time", "is_weekend",
+    "total_paid", "delivery_minutes", "fees_ratio", "total_fees",
+]
+
+# Finest grain scanned from the fact table; every KPI table is merged from it
+CELL_KEYS = ["order_date", "user_id", "platform_id", "shift_type"]
+MEASURES = ["total_paid", "fees_ratio", "is_late_night", "is_weekend"]
+# fact order_id is unique per row, so orders are counted exactly, not with a distinct sketch
+CELL_MEASURES = MEASURES + ["has_order_id"]
+
+def build_cells(df: pd.DataFrame, keys: list = CELL_KEYS) -> pd.DataFrame:
+    """Single scan: mergeable partials per (date, user, platform, shift type)."""
+    has_id = df["order_id"].notna() if "order_id" in df.columns else pd.Series(True, index=df.index)
+    return rollups.partial_aggregates(
+        df.assign(has_order_id=has_id.astype("int64")), keys, measures=CELL_MEASURES,
+        quantiles="delivery_minutes",
+    )
+
+@backend.transform("kpi_time_features")
+def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Time features from ordered_time (no dependency on order_hour/order_weekday columns)."""
+    df["order_date"] = df["ordered_time"].dt.date
+    # undated rows are month "NaT", as in the monthly table
+    df["order_month"] = df["ordered_time"].dt.to_period("M").astype(str).fillna("NaT")
+    df["order_hour"] = df["ordered_time"].dt.hour
+    df["order_weekday"] = df["ordered_time"].dt.weekday  # 0=Mon
+    df["is_late_night"] = df["order_hour"].isin([22, 23, 0, 1, 2, 3, 4, 5]).astype(int)
+
+    # if is_weekend missing or has NaN, recompute
+    if "is_weekend" not in df.columns:
+        df["is_weekend"] = (df["order_weekday"] >= 5).astype(int)
+    else:
+        df["is_weekend"] = pd.to_numeric(df["is_weekend"], errors="coerce")
+        df.loc[df["is_weekend"].isna(), "is_weekend"] = (df.loc[df["is_weekend"].isna(), "order_weekday"] >= 5).astype(int)
+    return df
+
+@backend.transform("kpi_time_features", engine="polars", inputs=["ordered_time", "is_weekend"])
+def time_features_polars(lf, pl):
+    t = pl.col("ordered_time")
+    weekday = t.dt.weekday() - 1  # polars: Monday=1
+    weekend = (weekday >= 5).fill_null(False).cast(pl.Int64)
+    if "is_weekend" in lf.collect_schema().names():
+        weekend = pl.col("is_weekend").cast(pl.Float64, strict=False).fill_null(weekend)
+    return lf.select(
+        t.dt.date().alias("order_date"),
+        t.dt.strftime("%Y-%m").fill_null("NaT").alias("order_month"),
+        t.dt.hour().alias("order_hour"),
+        weekday.alias("order_weekday"),
+        t.dt.hour().is_in([22, 23, 0, 1, 2, 3, 4, 5]).fill_null(False).cast(pl.Int64).alias("is_late_night"),
+        weekend.alias("is_weekend"),
+    )
+
+def kpi_table(parts: pd.DataFrame) -> pd.DataFrame:
+    """Finalize merged partials into the KPI columns."""
+    out = pd.DataFrame(index=parts.index)
+    out["orders_cnt"] = parts["has_order_id_sum"].astype("int64")
+    out["total_spend"] = parts["total_paid_sum"]
+    out["aov"] = rollups.mean(parts, "total_paid")
+    out["median_delivery"] = rollups.quantile(parts, "delivery_minutes", 0.5)
+    out["p90_delivery"] = rollups.quantile(parts, "delivery_minutes", 0.9)
+    out["avg_fees_ratio"] = rollups.mean(parts, "fees_ratio")
+    out["late_night_share"] = rollups.mean(parts, "is_late_night")
+    out["weekend_share"] = rollups.mean(parts, "is_weekend")
+    return out
+
+def rollup(parts: pd.DataFrame, keys: list) -> pd.DataFrame:
+    merged = rollups.merge_partials(parts, keys)
+    return pd.concat([merged[keys], kpi_table(merged)], axis=1)
+
+def kpi_outputs(cells: pd.DataFrame) -> dict:
+    """{file name: KPI table} for every grain, all merged from the same cells."""
+    # --- Daily KPI (day cells merged over platform / shift type) ---
+    days = rollups.merge_partials(cells.dropna(subset=["order_date"]), ["order_date"])
+    kpi_daily = pd.concat([days[["order_date"]], kpi_table(days)], axis=1).rename(columns={"order_date": "date"})
+
+    # --- Weekly / Monthly KPI: merged from the day partials, not the rows ---
+    day_ts = pd.to_datetime(days["order_date"])
+    days["week"] = (day_ts - pd.to_timedelta(day_ts.dt.weekday, unit="D")).dt.date
+    days["month"] = day_ts.dt.to_period("M").astype(str)
+    kpi_weekly = rollup(days, ["week"])
+    # undated orders stay in the monthly table as month "NaT"
+    months = days
+    undated = cells[cells["order_date"].isna()]
+    if len(undated):
+        months = pd.concat([days, rollups.merge_partials(undated, []).assign(month="NaT")], ignore_index=True)
+    kpi_monthly = rollup(months, ["month"])[
+        ["month", "orders_cnt", "total_spend", "aov", "median_delivery", "avg_fees_ratio"]
+    ]
+
+    # --- Platform / shift type / user KPI ---
+    return {
+        "kpi_orders_daily.csv": kpi_daily,
+        "kpi_orders_weekly.csv": kpi_weekly,
+        "kpi_orders_monthly.csv": kpi_monthly,
+        "kpi_orders_platform.csv": rollup(cells, ["platform_id"]),
+        "kpi_orders_shift_type.csv": rollup(cells, ["shift_type"]),
+        "kpi_orders_user.csv": rollup(cells, ["user_id"]),
+    }
+
 def main():
-    if not FACT_PATH.exists():
+    if not table_exists(FACT_PATH):
         raise FileNotFoundError(f"Cannot find {FACT_PATH}. Please run your star schema script first.")
 
     OUT_DIR.mkdir(parents=True, exist_ok=True)
     REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 
-    df = pd.read_csv(FACT_PATH)
+    if warehouse.available():
+        df = warehouse.read_columns("fact_orders", FACT_COLUMNS)
+    else:
+        df = load_table(FACT_PATH, columns=FACT_COLUMNS)
 
     # --- parse datetime safely ---
     if "ordered_time" not in df.columns:
         raise ValueError("fact_orders.csv must contain 'ordered_time'.")
 
     df["ordered_time"] = pd.to_datetime(df["ordered_time"], errors="coerce")
+    df = with_user(df)  # no-op unless fact_orders predates the user key
 
     # --- must-have numeric cols (fill if missing) ---
     for c in ["total_paid", "delivery_minutes", "fees_ratio", "total_fees"]:
         if c not in df.columns:
             df[c] = np.nan
 
-    # --- derive time features from ordered_time (no dependency on order_hour/order_weekday columns) ---
-    df["order_date"] = df["ordered_time"].dt.date
-    df["order_month"] = df["ordered_time"].dt.to_period("M").astype(str)
-    df["order_hour"] = df["ordered_time"].dt.hour
-    df["order_weekday"] = df["ordered_time"].dt.weekday  # 0=Mon
-    df["is_late_night"] = df["order_hour"].isin([22, 23, 0, 1, 2, 3, 4, 5]).astype(int)
+    # --- derive time features from ordered_time ---
+    df = backend.derive(df, "kpi_time_features")
 
-    # if is_weekend missing or has NaN, recompute
-    if "is_weekend" not in df.columns:
-        df["is_weekend"] = (df["order_weekday"] >= 5).astype(int)
+    # shift_type comes from the roster join when it has been run
+    if table_exists(ROSTER_PATH):
+        shifts = load_table(ROSTER_PATH, columns=["order_id", "shift_type"]).drop_duplicates("order_id")
+        # ids come back as text from the warehouse and as numbers from CSV
+        by_order = pd.Series(shifts["shift_type"].to_numpy(), index=shifts["order_id"].astype(str))
+        df["shift_type"] = df["order_id"].astype(str).map(by_order)
     else:
-        df["is_weekend"] = pd.to_numeric(df["is_weekend"], errors="coerce")
-        df.loc[df["is_weekend"].isna(), "is_weekend"] = (df.loc[df["is_weekend"].isna(), "order_weekday"] >= 5).astype(int)
+        df["shift_type"] = np.nan
 
-    # --- Daily KPI ---
-    kpi_daily = (
-        df.groupby("order_date", dropna=True)
-          .agg(
-              orders_cnt=("order_id", "nunique") if "order_id" in df.columns else ("ordered_time", "count"),
-              total_spend=("total_paid", "sum"),
-              aov=("total_paid", "mean"),
-              median_delivery=("delivery_minutes", "median"),
-              p90_delivery=("delivery_minutes", lambda x: np.nanpercentile(x.dropna(), 90) if x.dropna().shape[0] else np.nan),
-              avg_fees_ratio=("fees_ratio", "mean"),
-              late_night_share=("is_late_night", "mean"),
-              weekend_share=("is_weekend", "mean"),
-          )
-          .reset_index()
-          .rename(columns={"order_date": "date"})
-    )
-
-    # --- Monthly KPI ---
-    kpi_monthly = (
-        df.groupby("order_month", dropna=True)
-          .agg(
-              orders_cnt=("order_id", "nunique") if "order_id" in df.columns else ("ordered_time", "count"),
-              total_spend=("total_paid", "sum"),
-              aov=("total_paid", "mean"),
-              median_delivery=("delivery_minutes", "median"),
-              avg_fees_ratio=("fees_ratio", "mean"),
-          )
-          .reset_index()
-          .rename(columns={"order_month": "month"})
-    )
+    # Only dates whose orders changed since the last run are re-aggregated
+    digest_cols = [c for c in ["order_id", "delivery_minutes"] if c in df.columns] + CELL_KEYS + MEASURES
+    store = PartitionedPartials("eda_kpi", {"keys": CELL_KEYS, "measures": CELL_MEASURES, "columns": digest_cols})
+    cells, changed = store.refresh(df, "order_date", digest_cols, build_cells)
 
     # --- Save KPIs ---
-    kpi_daily.to_csv(OUT_DIR / "kpi_orders_daily.csv", index=False)
-    kpi_monthly.to_csv(OUT_DIR / "kpi_orders_monthly.csv", index=False)
+    outputs = kpi_outputs(cells)
+    kpi_platform = outputs["kpi_orders_platform.csv"]
+    for file_name, table in outputs.items():
+        table.to_csv(OUT_DIR / file_name, index=False)
+        metrics.record_write(OUT_DIR / file_name, len(table))
 
     # --- Basic insights text (8-12 bullets) ---
     # Keep it simple and robust to missing values
-    total_orders = int(df["order_id"].nunique()) if "order_id" in df.columns else int(df.shape[0])
-    total_spend = float(np.nan_to_num(df["total_paid"]).sum())
-    aov = float(np.nanmean(df["total_paid"])) if df["total_paid"].notna().any() else np.nan
-    median_delivery = float(np.nanmedian(df["delivery_minutes"])) if df["delivery_minutes"].notna().any() else np.nan
-    avg_fees_ratio = float(np.nanmean(df["fees_ratio"])) if df["fees_ratio"].notna().any() else np.nan
-    late_night_share = float(df["is_late_night"].mean()) if df["is_late_night"].notna().any() else np.nan
-    weekend_share = float(df["is_weekend"].mean()) if df["is_weekend"].notna().any() else np.nan
+    # Headline numbers are the grand total of the same partials
+    overall = kpi_table(rollups.merge_partials(cells, [])).iloc[0]
+    total_orders = int(overall["orders_cnt"])
+    total_spend = float(overall["total_spend"])
+    aov = float(overall["aov"])
+    median_delivery = float(overall["median_delivery"])
+    avg_fees_ratio = float(overall["avg_fees_ratio"])
+    late_night_share = float(overall["late_night_share"])
+    weekend_share = float(overall["weekend_share"])
 
     # Top restaurant (by orders) if restaurant_id exists
     top_restaurant_line = ""
-    if "restaurant_id" in df.columns:
+    if warehouse.available():
+        # pushed down: counted on the restaurant_id index
+        top_rest = warehouse.query(
+            "SELECT restaurant_id, COUNT(*) AS n FROM fact_orders WHERE restaurant_id IS NOT NULL "
+            "GROUP BY restaurant_id ORDER BY n DESC, restaurant_id LIMIT 1"
+        ).set_index("restaurant_id")["n"]
+    elif "restaurant_id" in df.columns:
         top_rest = df.groupby("restaurant_id").size().sort_values(ascending=False).head(1)
-        if len(top_rest):
-            rid = int(top_rest.index[0])
-            cnt = int(top_rest.iloc[0])
-            top_restaurant_line = f"- Top restaurant_id by orders: restaurant_id={rid} ({cnt} orders)"
+    else:
+        top_rest = pd.Series(dtype="int64")
+    if len(top_rest):
+        rid = int(top_rest.index[0])
+        cnt = int(top_rest.iloc[0])
+        top_restaurant_line = f"- Top restaurant_id by orders: restaurant_id={rid} ({cnt} orders)"
 
     insights = [
         f"- Total orders: {total_orders}",
@@ -108,8 +206,11 @@ def main():
 
     # Add platform split if platform_id exists
     if "platform_id" in df.columns:
-        plat = df.groupby("platform_id").agg(orders=("order_id","nunique") if "order_id" in df.columns else ("ordered_time","count"),
-                                             spend=("total_paid","sum")).reset_index()
+        plat = (
+            kpi_platform.dropna(subset=["platform_id"])
+                        .rename(columns={"orders_cnt": "orders", "total_spend": "spend"})
+                        [["platform_id", "orders", "spend"]]
+        )
         plat = plat.sort_values("orders", ascending=False)
         insights.append(f"- Platform split (platform_id): {plat.to_dict(orient='records')}")
 
@@ -119,9 +220,12 @@ def main():
         f.write("\n".join(insights))
         f.write("\n")
 
-    print("✅ Step D done.")
+    print(f"✅ Step D done ({len(changed)} date partition(s) recomputed).")
     print(f" - Saved: {OUT_DIR / 'kpi_orders_daily.csv'}")
+    print(f" - Saved: {OUT_DIR / 'kpi_orders_weekly.csv'}")
     print(f" - Saved: {OUT_DIR / 'kpi_orders_monthly.csv'}")
+    print(f" - Saved: {OUT_DIR / 'kpi_orders_platform.csv'}")
+    print(f" - Saved: {OUT_DIR / 'kpi_orders_shift_type.csv'}")
     print(f" - Saved: {report_path}")
 
 if __name__ == "__main__":
@@ -1,48 +1,77 @@
+import sys
 import pandas as pd
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # src/
+from common import metrics, rollups  # noqa: E402
+from common.partitions import PartitionedPartials  # noqa: E402
+from common.storage import read_table  # noqa: E402
+from common.users import with_user  # noqa: E402
+
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 IN_PATH = PROJECT_ROOT / "data" / "derived" / "orders_finance_context.csv"
 OUT_DIR = PROJECT_ROOT / "data" / "derived" / "kpi"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
-def summarize(df, group_col, value_col):
-    return (df.groupby(group_col)[value_col]
-              .agg(orders="count", mean="mean", median="median", sum="sum")
-              .reset_index()
-            )
+GROUP_COLS = ["is_payday", "days_since_payday", "is_near_rent_due", "day_of_month"]
+VALUE_COLS = ["total_paid", "food_cost"]
+IN_COLUMNS = ["order_date", "user_id"] + VALUE_COLS + GROUP_COLS
+
+def build_cells(df):
+    # every group column is a function of the date, so this is one cell per user and day
+    return rollups.partial_aggregates(df, ["order_date", "user_id"] + GROUP_COLS, measures=VALUE_COLS, quantiles=VALUE_COLS)
+
+def summarize(cells, group_col, value_col):
+    g = rollups.merge_partials(cells.dropna(subset=[group_col]), [group_col])
+    return pd.DataFrame({
+        group_col: g[group_col],
+        "orders": g[f"{value_col}_n"],
+        "mean": rollups.mean(g, value_col),
+        "median": rollups.quantile(g, value_col, 0.5),
+        "sum": g[f"{value_col}_sum"],
+    })
 
 def main():
-    df = pd.read_csv(IN_PATH)
+    df = with_user(read_table(IN_PATH, columns=IN_COLUMNS))
 
     # Focus on valid amounts
     df["total_paid"] = pd.to_numeric(df["total_paid"], errors="coerce")
     df["food_cost"] = pd.to_numeric(df["food_cost"], errors="coerce")
 
+    # Only dates whose orders changed since the last run are re-aggregated
+    store = PartitionedPartials("eda_payday_rent", {"columns": IN_COLUMNS})
+    cells, changed = store.refresh(df, "order_date", IN_COLUMNS, build_cells)
+    print(f"{len(changed)} date partition(s) recomputed")
+
     # 1) Payday vs non-payday
-    payday_total = summarize(df, "is_payday", "total_paid")
-    payday_food  = summarize(df, "is_payday", "food_cost")
+    payday_total = summarize(cells, "is_payday", "total_paid")
+    payday_food  = summarize(cells, "is_payday", "food_cost")
 
     # 2) Days since payday (0-6)
-    cycle_total = summarize(df, "days_since_payday", "total_paid")
-    cycle_food  = summarize(df, "days_since_payday", "food_cost")
+    cycle_total = summarize(cells, "days_since_payday", "total_paid")
+    cycle_food  = summarize(cells, "days_since_payday", "food_cost")
 
     # 3) Near rent due vs not (27-30 vs others)
-    near_rent_total = summarize(df, "is_near_rent_due", "total_paid")
-    near_rent_food  = summarize(df, "is_near_rent_due", "food_cost")
+    near_rent_total = summarize(cells, "is_near_rent_due", "total_paid")
+    near_rent_food  = summarize(cells, "is_near_rent_due", "food_cost")
 
     # 4) Day of month trend (看看月末是否最低)
-    dom_total = summarize(df, "day_of_month", "total_paid")
-    dom_food  = summarize(df, "day_of_month", "food_cost")
-
-    payday_total.to_csv(OUT_DIR / "kpi_payday_total_paid.csv", index=False)
-    payday_food.to_csv(OUT_DIR / "kpi_payday_food_cost.csv", index=False)
-    cycle_total.to_csv(OUT_DIR / "kpi_paycycle_total_paid.csv", index=False)
-    cycle_food.to_csv(OUT_DIR / "kpi_paycycle_food_cost.csv", index=False)
-    near_rent_total.to_csv(OUT_DIR / "kpi_near_rent_total_paid.csv", index=False)
-    near_rent_food.to_csv(OUT_DIR / "kpi_near_rent_food_cost.csv", index=False)
-    dom_total.to_csv(OUT_DIR / "kpi_day_of_month_total_paid.csv", index=False)
-    dom_food.to_csv(OUT_DIR / "kpi_day_of_month_food_cost.csv", index=False)
+    dom_total = summarize(cells, "day_of_month", "total_paid")
+    dom_food  = summarize(cells, "day_of_month", "food_cost")
+
+    outputs = {
+        "kpi_payday_total_paid.csv": payday_total,
+        "kpi_payday_food_cost.csv": payday_food,
+        "kpi_paycycle_total_paid.csv": cycle_total,
+        "kpi_paycycle_food_cost.csv": cycle_food,
+        "kpi_near_rent_total_paid.csv": near_rent_total,
+        "kpi_near_rent_food_cost.csv": near_rent_food,
+        "kpi_day_of_month_total_paid.csv": dom_total,
+        "kpi_day_of_month_food_cost.csv": dom_food,
+    }
+    for file_name, table in outputs.items():
+        table.to_csv(OUT_DIR / file_name, index=False)
+        metrics.record_write(OUT_DIR / file_name, len(table))
 
     print("\n=== Payday vs Non-payday (total_paid) ===")
     print(payday_total)
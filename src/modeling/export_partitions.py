@@ -0,0 +1,159 @@
+"""
+Month-partitioned export of the row-level tables for BI refreshes.
+
+Each table in EXPORT_TABLES is published under data/export/ as one file per
+month of ordered_time (undated orders go to month=unknown):
+
+    data/export/fact_orders/month=2025-11/fact_orders.csv
+    data/export/fact_orders/month=2025-12/fact_orders.csv
+    data/export/manifest.json
+
+Only months whose rows changed are written (per-month digests, as for the KPI
+partials), so history is not rewritten and files a BI tool holds open are
+left alone. Changed files are written to data/export/.staging/ first and
+then moved into place. A partition that cannot be replaced, e.g. a file
+locked by Excel or Power BI, is reported and retried on the next run.
+
+manifest.json lists every partition (rows, digest, files, the run that last
+wrote it) and, per run, the partitions that changed, were removed or failed,
+so a refresh only has to reload `runs[-1]["changed"]`.
+"""
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # src/
+from common import metrics  # noqa: E402
+from common.loader import load_table  # noqa: E402
+from common.partitions import partition_digests, partition_keys  # noqa: E402
+from common.storage import TABLE_FORMAT, stored_paths, table_exists, write_table  # noqa: E402
+
+DERIVED = Path("data/derived")
+EXPORT_DIR = Path("data/export")
+STAGING_DIR = EXPORT_DIR / ".staging"
+MANIFEST_PATH = EXPORT_DIR / "manifest.json"
+
+EXPORT_TABLES = ["fact_orders", "orders_roster_nlp_fixed", "orders_finance_context", "orders_behavior_features"]
+PARTITION_COL = "_month"
+UNDATED = "unknown"
+KEEP_RUNS = 50
+
+
+def run_id() -> str:
+    """The pipeline run this stage belongs to (its metrics file's folder), else a timestamp."""
+    if metrics.METRICS_PATH:
+        return Path(metrics.METRICS_PATH).parent.name
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+def load_manifest() -> dict:
+    if MANIFEST_PATH.exists():
+        return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    return {"tables": {}, "runs": []}
+
+
+def save_manifest(manifest: dict):
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = MANIFEST_PATH.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def month_keys(df: pd.DataFrame) -> pd.Series:
+    """'YYYY-MM' of ordered_time per row; UNDATED where it is missing."""
+    t = pd.to_datetime(df["ordered_time"], errors="coerce")
+    return partition_keys(t.dt.strftime("%Y-%m")).replace("<NA>", UNDATED)
+
+
+def partition_dir(table: str, month: str) -> Path:
+    return EXPORT_DIR / table / f"month={month}"
+
+
+def publish_partition(rows: pd.DataFrame, table: str, month: str) -> list:
+    """Write one month via the staging folder and move its files into place."""
+    staged = STAGING_DIR / table / f"month={month}" / f"{table}.csv"
+    write_table(rows, staged)
+    target = partition_dir(table, month)
+    target.mkdir(parents=True, exist_ok=True)
+    files = []
+    for src in stored_paths(staged):
+        os.replace(src, target / src.name)  # PermissionError while the file is open elsewhere
+        files.append((target / src.name).relative_to(EXPORT_DIR).as_posix())
+    # files of a previous TAKEAWAY_TABLE_FORMAT
+    for old in target.glob(f"{table}.*"):
+        if old.relative_to(EXPORT_DIR).as_posix() not in files:
+            old.unlink()
+    return files
+
+
+@metrics.timed("export:table")
+def export_table(table: str, manifest: dict, run: dict):
+    df = load_table(DERIVED / f"{table}.csv")
+    columns = list(df.columns)
+    df[PARTITION_COL] = month_keys(df)
+    digests = partition_digests(df, PARTITION_COL, columns)
+
+    previous = manifest["tables"].get(table, {})
+    stored = previous.get("partitions", {})
+    if previous.get("columns") != columns or previous.get("format") != TABLE_FORMAT:
+        stored = {}  # layout changed: every month is rewritten once
+
+    partitions = {}
+    rows_by_month = df.groupby(PARTITION_COL, sort=True).indices
+    for month, digest in digests.items():
+        entry = stored.get(month)
+        up_to_date = entry is not None and entry["digest"] == digest and all(
+            (EXPORT_DIR / f).exists() for f in entry["files"]
+        )
+        if up_to_date:
+            partitions[month] = entry
+            continue
+        try:
+            files = publish_partition(df.iloc[rows_by_month[month]][columns], table, month)
+        except PermissionError as e:
+            print(f"⚠️  {table} {month} not replaced ({e}); it will be retried on the next run")
+            run["failed"].setdefault(table, []).append(month)
+            if entry is not None:
+                partitions[month] = {**entry, "digest": None}
+            continue
+        partitions[month] = {"rows": len(rows_by_month[month]), "digest": digest, "files": files, "run_id": run["run_id"]}
+        run["changed"].setdefault(table, []).append(month)
+
+    for month in sorted(set(previous.get("partitions", {})) - set(digests.index)):
+        shutil.rmtree(partition_dir(table, month), ignore_errors=True)
+        run["removed"].setdefault(table, []).append(month)
+
+    manifest["tables"][table] = {"columns": columns, "format": TABLE_FORMAT, "partitions": partitions}
+
+
+def main():
+    manifest = load_manifest()
+    run = {"run_id": run_id(), "finished": None, "changed": {}, "removed": {}, "failed": {}}
+
+    for table in EXPORT_TABLES:
+        if not table_exists(DERIVED / f"{table}.csv"):
+            print(f"ℹ️  {table} not found, skipped")
+            continue
+        export_table(table, manifest, run)
+    shutil.rmtree(STAGING_DIR, ignore_errors=True)
+
+    run["finished"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    manifest["runs"] = (manifest["runs"] + [run])[-KEEP_RUNS:]
+    save_manifest(manifest)
+
+    changed = sum(len(v) for v in run["changed"].values())
+    total = sum(len(t["partitions"]) for t in manifest["tables"].values())
+    print(f"✅ Export: {changed} of {total} month partition(s) written to {EXPORT_DIR}")
+    for table, months in run["changed"].items():
+        print(f"   {table}: {', '.join(months)}")
+    if run["failed"]:
+        print(f"⚠️  Not replaced (file in use?): {run['failed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
+import sys
 import pandas as pd
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # src/
+from common import metrics  # noqa: E402
+from common.restaurant_names import RestaurantResolver, ALIASES_PATH  # noqa: E402
+from common.storage import read_table, write_table  # noqa: E402
+
 ROSTER_ENRICHED_PATH = Path("data/derived/orders_enriched_roster.csv")
 DIM_RESTAURANT_PATH = Path("data/derived/dim_restaurant.csv")
 REST_PROFILE_PATH = Path("data/derived/restaurant_profile.csv")
@@ -8,9 +14,9 @@ REST_PROFILE_PATH = Path("data/derived/restaurant_profile.csv")
 OUT_DIR = Path("data/derived")
 
 def main():
-    roster = pd.read_csv(ROSTER_ENRICHED_PATH)
-    dim_rest = pd.read_csv(DIM_RESTAURANT_PATH)
-    rest_prof = pd.read_csv(REST_PROFILE_PATH)
+    roster = read_table(ROSTER_ENRICHED_PATH)
+    dim_rest = read_table(DIM_RESTAURANT_PATH)
+    rest_prof = read_table(REST_PROFILE_PATH)
 
     # 防止列名有空格（你之前 roster 就出现过）
     roster.columns = [c.strip() for c in roster.columns]
@@ -25,16 +31,22 @@ def main():
     if "is_workday" not in roster.columns:
         raise ValueError(f"orders_enriched_roster must have is_workday. Found: {list(roster.columns)}")
 
-    # restaurant_id -> restaurant name
-    out = roster.merge(dim_rest[["restaurant_id", "restaurant"]], on="restaurant_id", how="left")
+    # menu spellings -> canonical dim_restaurant names (read-only: no new aliases learned here)
+    resolver = RestaurantResolver.load(ALIASES_PATH)
+    rest_prof["restaurant"] = resolver.resolve(rest_prof["restaurant"].astype(str).str.strip(), learn=False)
+    rest_prof = rest_prof.groupby("restaurant", as_index=False, sort=False).mean(numeric_only=True)
+
+    with metrics.step("merge:restaurant_profile"):
+        # restaurant_id -> restaurant name
+        out = roster.merge(dim_rest[["restaurant_id", "restaurant"]], on="restaurant_id", how="left")
 
-    # join NLP restaurant profile
-    out = out.merge(rest_prof, on="restaurant", how="left")
+        # join NLP restaurant profile
+        out = out.merge(rest_prof, on="restaurant", how="left")
 
     OUT_DIR.mkdir(parents=True, exist_ok=True)
 
     out_path = OUT_DIR / "orders_roster_nlp.csv"
-    out.to_csv(out_path, index=False)
+    write_table(out, out_path)
 
     # KPI：workday vs non-workday 的口味均值（ratio 列）
     ratio_cols = [c for c in rest_prof.columns if c.endswith("_ratio")]
@@ -45,6 +57,7 @@ def main():
     )
     kpi_path = OUT_DIR / "kpi_workday_foodprefs.csv"
     kpi.to_csv(kpi_path, index=False)
+    metrics.record_write(kpi_path, len(kpi))
 
     print("✅ Step F (join roster + NLP) done.")
     print(f" - Saved: {out_path}")
@@ -1,7 +1,13 @@
+import re
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # src/
+from common import metrics  # noqa: E402
+from common.storage import write_table  # noqa: E402
+
 # -------- Paths --------
 IN_PATH = Path("data/clean/menu_items.csv")
 OUT_DIR = Path("data/derived")
@@ -16,11 +22,75 @@ KEYWORDS = {
     "vegan": ["vegan", "vegetarian", "tofu", "plant"]
 }
 
-def flag_keywords(text: str, keywords: list) -> int:
-    if pd.isna(text):
-        return 0
-    t = text.lower()
-    return int(any(k in t for k in keywords))
+SYNONYMS_PATH = Path("data/clean/menu_synonyms.csv")
+
+def load_synonyms(path: Path = SYNONYMS_PATH) -> dict:
+    """
+    Optional user dictionary, one row per term: term,label
+    (e.g. "chow mein,noodles"). Returns {label: [terms]}.
+    """
+    if not path.exists():
+        return {}
+    syn = pd.read_csv(path)
+    syn.columns = [c.strip().lower() for c in syn.columns]
+    syn = syn.dropna(subset=["term", "label"])
+    out = {}
+    for term, label in zip(syn["term"].astype(str), syn["label"].astype(str)):
+        out.setdefault(label.strip().lower(), []).append(term.strip().lower())
+    return out
+
+def merge_keywords(base: dict, extra: dict) -> dict:
+    merged = {k: list(v) for k, v in base.items()}
+    for label, terms in extra.items():
+        merged.setdefault(label, [])
+        merged[label] += [t for t in terms if t not in merged[label]]
+    return merged
+
+def _term_regex(term: str) -> str:
+    # multi-word terms allow any whitespace between words
+    return r"\s+".join(map(re.escape, term.split()))
+
+def build_matcher(keywords: dict):
+    """
+    Compile all labels' terms into one alternation (longest first), matched
+    on word boundaries with an optional plural -s/-es, so "hot" no longer
+    fires on "shot" nor "rice" on "price".
+
+    Returns (pattern, {term: labels}). Because matches don't overlap, a
+    phrase like "fried rice" would hide the "fried" inside it, so each term
+    also carries the labels of any shorter term it contains.
+    """
+    term_labels = {}
+    for label, terms in keywords.items():
+        for t in terms:
+            term_labels.setdefault(" ".join(t.lower().split()), set()).add(label)
+
+    for t in term_labels:
+        for inner, inner_labels in list(term_labels.items()):
+            if inner != t and re.search(rf"\b{_term_regex(inner)}(?:e?s)?\b", t):
+                term_labels[t] = term_labels[t] | inner_labels
+
+    alts = sorted(term_labels, key=len, reverse=True)
+    pattern = re.compile(r"\b(" + "|".join(map(_term_regex, alts)) + r")(?:e?s)?\b")
+    return pattern, term_labels
+
+@metrics.timed("tag_keywords")
+def tag_keywords(text: pd.Series, keywords: dict) -> pd.DataFrame:
+    """
+    0/1 flag per label for every text. Each distinct text is scanned once
+    by the combined regex; flags are mapped back by position.
+    """
+    pattern, term_labels = build_matcher(keywords)
+    labels = list(keywords)
+    col = {label: i for i, label in enumerate(labels)}
+
+    codes, uniques = pd.factorize(text)
+    found = pd.Series(uniques, dtype=object).str.findall(pattern).explode().dropna()
+    hit = found.map(lambda m: [col[l] for l in term_labels[" ".join(m.split())]]).explode()
+
+    flags = np.zeros((len(uniques) + 1, len(labels)), dtype=int)  # last row: missing text
+    flags[hit.index.to_numpy(dtype=int), hit.to_numpy(dtype=int)] = 1
+    return pd.DataFrame(flags[codes], index=text.index, columns=labels)
 
 def main():
     if not IN_PATH.exists():
@@ -29,6 +99,7 @@ def main():
     OUT_DIR.mkdir(parents=True, exist_ok=True)
 
     df = pd.read_csv(IN_PATH, encoding="latin1")
+    metrics.record_read(IN_PATH, len(df))
 
 
     # ---- basic cleaning ----
@@ -43,18 +114,19 @@ def main():
     text_col = (df["item_name"] + " " + df["tags"]).str.lower()
 
     # ---- item-level NLP features ----
-    for label, keys in KEYWORDS.items():
-        df[label] = text_col.apply(lambda x: flag_keywords(x, keys))
+    keywords = merge_keywords(KEYWORDS, load_synonyms())
+    labels = list(keywords)
+    df[labels] = tag_keywords(text_col, keywords)
 
     df["item_price"] = pd.to_numeric(df.get("price"), errors="coerce")
 
     menu_features = df[
         ["restaurant", "item_name", "item_price"]
-        + list(KEYWORDS.keys())
-    ].copy()
+        + labels
+    ]
 
     # ---- restaurant-level profile ----
-    agg_rules = {k: "mean" for k in KEYWORDS.keys()}
+    agg_rules = {k: "mean" for k in labels}
     agg_rules["item_price"] = "mean"
 
     restaurant_profile = (
@@ -63,13 +135,13 @@ def main():
         .agg(agg_rules)
         .rename(columns={
             "item_price": "avg_item_price",
-            **{k: f"{k}_ratio" for k in KEYWORDS.keys()}
+            **{k: f"{k}_ratio" for k in labels}
         })
     )
 
     # ---- save ----
-    menu_features.to_csv(OUT_DIR / "menu_features.csv", index=False)
-    restaurant_profile.to_csv(OUT_DIR / "restaurant_profile.csv", index=False)
+    write_table(menu_features, OUT_DIR / "menu_features.csv")
+    write_table(restaurant_profile, OUT_DIR / "restaurant_profile.csv")
 
     print("✅ NLP Step F done.")
     print(" - Saved: data/derived/menu_features.csv")
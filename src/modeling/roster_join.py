@@ -1,12 +1,22 @@
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # src/
+from common import metrics  # noqa: E402
+from common.loader import load_table  # noqa: E402
+from common.storage import table_exists, write_table  # noqa: E402
+from common.users import USER_ALIASES, USER_COL, map_partitions, split_by_user, with_user  # noqa: E402
+
 FACT_PATH = Path("data/derived/fact_orders.csv")
 ROSTER_PATH = Path("data/clean/roster.csv")  
 OUT_DIR = Path("data/derived")
 REPORTS_DIR = Path("reports")
 
+# orders up to this long after a shift ends count as post-shift
+POST_SHIFT_WINDOW = pd.Timedelta(hours=12)
+
 
 def normalize_cols(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -15,7 +25,7 @@ def normalize_cols(df: pd.DataFrame) -> pd.DataFrame:
     - lower
     - replace spaces with underscore
     """
-    df = df.copy()
+    df = df.copy(deep=False)
     df.columns = (
         df.columns.astype(str)
         .str.strip()
@@ -25,6 +35,18 @@ def normalize_cols(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def _resolve_time_token(s: str):
+    """Resolve an already-normalized token to a datetime.time (or NaT)."""
+    for candidate in [s, "2000-01-01 " + s]:
+        try:
+            dt = pd.to_datetime(candidate, errors="raise")
+            return dt.time()
+        except Exception:
+            continue
+
+    return pd.NaT
+
+
 def parse_time_token(t):
     """
     Parse time tokens like:
@@ -43,27 +65,42 @@ def parse_time_token(t):
     s = s.replace(" a.m", "am").replace(" p.m", "pm")
     s = s.replace("am", " am").replace("pm", " pm").strip()  # helps parser sometimes
 
-    # try parse directly
-    for candidate in [s, "2000-01-01 " + s]:
-        try:
-            dt = pd.to_datetime(candidate, errors="raise")
-            return dt.time()
-        except Exception:
-            continue
+    return _resolve_time_token(s)
 
-    return pd.NaT
+
+def parse_time_tokens(tokens: pd.Series) -> pd.Series:
+    """
+    Vectorized parse_time_token for a whole column.
+
+    Rosters only use a handful of distinct tokens ('3pm', '07:30', '11 pm'),
+    so normalize with string ops, resolve each distinct token once and map
+    the results back by position. Same semantics as parse_time_token.
+    """
+    s = tokens.astype("string").str.strip().str.lower()
+    s = s.mask(s.isin(["", "nan", "none"]))
+
+    # normalize common variants (same steps as parse_time_token)
+    s = s.str.replace(".", "", regex=False)
+    s = s.str.replace(" a m", "am", regex=False).str.replace(" p m", "pm", regex=False)
+    s = s.str.replace("am", " am", regex=False).str.replace("pm", " pm", regex=False).str.strip()
+
+    codes, uniques = pd.factorize(s)
+    resolved = np.array([_resolve_time_token(u) for u in uniques] + [pd.NaT], dtype=object)
+    # code -1 (missing) picks the trailing NaT
+    return pd.Series(resolved[codes], index=tokens.index, dtype=object)
 
 
 def pick_roster_columns(r: pd.DataFrame) -> pd.DataFrame:
     """
     Ensure we end up with canonical columns:
-    date, shift_start, shift_end, shift_type, hours
+    date, shift_start, shift_end, shift_type, hours (+ user_id when the
+    roster covers several people)
 
     Your file may include:
     shift_start.1, shift_end.1, shift_type.1
     We'll prefer base names; fallback to *.1 if needed.
     """
-    r = r.copy()
+    r = r.copy(deep=False)
 
     def pick(base: str):
         if base in r.columns:
@@ -98,16 +135,20 @@ def pick_roster_columns(r: pd.DataFrame) -> pd.DataFrame:
     else:
         out["hours"] = np.nan
 
+    if any(c in r.columns for c in USER_ALIASES):
+        out[USER_COL] = with_user(r)[USER_COL]
+
     return out
 
 
+@metrics.timed("roster:shift_datetimes")
 def build_shift_datetimes(roster: pd.DataFrame) -> pd.DataFrame:
     """
     Build shift_start_dt and shift_end_dt from date + shift_start/shift_end strings.
     Night shift crosses midnight: if end <= start, add +1 day to end.
     Day off: keep datetimes NaT.
     """
-    r = roster.copy()
+    r = roster.copy(deep=False)
 
     # date
    
@@ -122,8 +163,8 @@ def build_shift_datetimes(roster: pd.DataFrame) -> pd.DataFrame:
     )
 
     # parse times
-    r["shift_start_time"] = r["shift_start"].apply(parse_time_token)
-    r["shift_end_time"] = r["shift_end"].apply(parse_time_token)
+    r["shift_start_time"] = parse_time_tokens(r["shift_start"])
+    r["shift_end_time"] = parse_time_tokens(r["shift_end"])
 
     base_date = pd.to_datetime(r["date"], errors="coerce")
     r["shift_start_dt"] = pd.NaT
@@ -151,80 +192,119 @@ def build_shift_datetimes(roster: pd.DataFrame) -> pd.DataFrame:
     )
 
     keep = ["date", "shift_type", "shift_start_dt", "shift_end_dt", "work_hours"]
+    keep += [USER_COL] if USER_COL in r.columns else []
     r = r[keep].dropna(subset=["date"]).drop_duplicates()
 
     return r
 
 
-def join_orders_to_roster(orders: pd.DataFrame, roster: pd.DataFrame) -> pd.DataFrame:
-    """
-    Join rules:
-    - Workday: ordered_time within [shift_start_dt, shift_end_dt] on same date
-    - Day off: match only by order_date == date
-    """
-    o = orders.copy()
-    if "ordered_time" not in o.columns:
-        raise ValueError("fact_orders.csv must contain 'ordered_time'.")
-
-    o["ordered_time"] = pd.to_datetime(o["ordered_time"], errors="coerce")
-    o = o[o["ordered_time"].notna()].copy()
-    o["order_date"] = o["ordered_time"].dt.date
+def _as_ns(s: pd.Series) -> np.ndarray:
+    """datetime-like Series -> int64 nanoseconds (NaT -> min int64)."""
+    return pd.to_datetime(s, errors="coerce").astype("datetime64[ns]").to_numpy().view("int64")
 
-    # split roster
-    r_work = roster[roster["shift_type"].ne("day off")].copy()
-    r_off = roster[roster["shift_type"].eq("day off")].copy()
 
-    # workday: merge on date then filter by window
-    tmp = o.merge(r_work, left_on="order_date", right_on="date", how="left")
+def assign_shifts(order_ns: np.ndarray, start_ns: np.ndarray, end_ns: np.ndarray) -> np.ndarray:
+    """
+    Sorted-interval lookup: for each order time, the position of the shift
+    [start, end] containing it, or -1. Shifts must be sorted by start.
 
-    in_window = (
-        tmp["shift_start_dt"].notna() &
-        tmp["shift_end_dt"].notna() &
-        (tmp["ordered_time"] >= tmp["shift_start_dt"]) &
-        (tmp["ordered_time"] <= tmp["shift_end_dt"])
-    )
-    matched_work = tmp[in_window].copy()
+    When several shifts contain an order, the one with the latest start
+    (closest shift_start) wins.
+    """
+    if not len(start_ns):
+        return np.full(len(order_ns), -1)
+    pos = np.searchsorted(start_ns, order_ns, side="right") - 1
+    cand = pos.clip(0)
+    hit = (pos >= 0) & (order_ns <= end_ns[cand])
+    out = np.where(hit, pos, -1)
+
+    # an earlier, longer shift can still contain the order (overlapping
+    # rows in the roster); only then walk back, which is rare
+    reach = np.maximum.accumulate(end_ns) if len(end_ns) else end_ns
+    nested = np.flatnonzero((pos >= 0) & ~hit & (reach[cand] >= order_ns))
+    for i in nested:
+        for j in range(pos[i] - 1, -1, -1):
+            if reach[j] < order_ns[i]:
+                break
+            if end_ns[j] >= order_ns[i]:
+                out[i] = j
+                break
+    return out
 
-    # if multiple matches, choose closest shift_start
-    matched_work["gap_to_start_min"] = (matched_work["ordered_time"] - matched_work["shift_start_dt"]).dt.total_seconds() / 60
-    if "order_id" in matched_work.columns:
-        matched_work = matched_work.sort_values(["order_id", "gap_to_start_min"]).drop_duplicates("order_id")
 
-    # day off: date-only merge
-    off_join = o.merge(r_off, left_on="order_date", right_on="date", how="left")
+def preceding_shift_end(order_ns: np.ndarray, end_ns_sorted: np.ndarray, window: pd.Timedelta) -> np.ndarray:
+    """For each order time, the latest shift end strictly before it within `window`, else NaT (as int64)."""
+    nat = np.iinfo("int64").min
+    if not len(end_ns_sorted):
+        return np.full(len(order_ns), nat)
+    pos = np.searchsorted(end_ns_sorted, order_ns, side="left") - 1
+    prev = np.where(pos >= 0, end_ns_sorted[pos.clip(0)], nat)
+    ok = (pos >= 0) & (order_ns - prev <= window.value)
+    return np.where(ok, prev, nat)
 
-    # combine: prefer work match, else day off, else empty
-    if "order_id" in o.columns:
-        combined = o.merge(
-            matched_work[["order_id", "shift_type", "shift_start_dt", "shift_end_dt", "work_hours"]],
-            on="order_id", how="left"
-        )
 
-        combined = combined.merge(
-            off_join[["order_id", "shift_type", "shift_start_dt", "shift_end_dt", "work_hours"]],
-            on="order_id", how="left", suffixes=("", "_off")
-        )
+@metrics.timed("merge:orders_roster")
+def join_orders_to_roster(orders: pd.DataFrame, roster: pd.DataFrame) -> pd.DataFrame:
+    """
+    Join rules:
+    - Workday: ordered_time within [shift_start_dt, shift_end_dt]; night
+      shifts that run past midnight also cover orders on the next date
+    - Day off: match only by order_date == date
+    - Post-shift features: measured against the containing shift, else the
+      nearest preceding shift end within POST_SHIFT_WINDOW
 
-        combined["shift_type"] = combined["shift_type"].fillna(combined["shift_type_off"])
-        combined["shift_start_dt"] = combined["shift_start_dt"].fillna(combined["shift_start_dt_off"])
-        combined["shift_end_dt"] = combined["shift_end_dt"].fillna(combined["shift_end_dt_off"])
-        combined["work_hours"] = combined["work_hours"].fillna(combined["work_hours_off"])
-        combined = combined.drop(columns=[c for c in combined.columns if c.endswith("_off")])
+    Shifts are looked up by binary search on start/end times, so the cost is
+    O(orders * log(shifts)) with no order x shift intermediate frame.
+    """
+    if "ordered_time" not in orders.columns:
+        raise ValueError("fact_orders.csv must contain 'ordered_time'.")
 
-    else:
-        # fallback (shouldn't happen in your fact table)
-        combined = o.copy()
-        combined["shift_type"] = np.nan
-        combined["shift_start_dt"] = pd.NaT
-        combined["shift_end_dt"] = pd.NaT
-        combined["work_hours"] = np.nan
+    o = orders.copy(deep=False)
+    o["ordered_time"] = pd.to_datetime(o["ordered_time"], errors="coerce")
+    o = o[o["ordered_time"].notna()]
+    o["order_date"] = o["ordered_time"].dt.date
+    t = _as_ns(o["ordered_time"])
+
+    # workday shifts, sorted by start
+    r_work = roster[roster["shift_type"].ne("day off")]
+    r_work = r_work[r_work["shift_start_dt"].notna() & r_work["shift_end_dt"].notna()]
+    r_work = r_work.sort_values("shift_start_dt", kind="stable")
+    start_ns = _as_ns(r_work["shift_start_dt"])
+    end_ns = _as_ns(r_work["shift_end_dt"])
+
+    hit = assign_shifts(t, start_ns, end_ns)
+    matched = hit >= 0
+    take = hit.clip(0)
+
+    shift_cols = ["shift_type", "shift_start_dt", "shift_end_dt", "work_hours"]
+    out = {}
+    for c in shift_cols:
+        vals = r_work[c].to_numpy()[take] if len(r_work) else np.full(len(o), np.nan, dtype=object)
+        out[c] = pd.Series(vals, index=o.index).where(matched)
+
+    # day off: date-only lookup for orders without a containing shift
+    r_off = roster[roster["shift_type"].eq("day off")].drop_duplicates("date").set_index("date")
+    off = ~matched & o["order_date"].isin(r_off.index).to_numpy()
+    for c in shift_cols:
+        out[c] = out[c].where(~off, o["order_date"].map(r_off[c]))
+
+    combined = o
+    combined["shift_type"] = out["shift_type"]
+    combined["shift_start_dt"] = pd.to_datetime(out["shift_start_dt"])
+    combined["shift_end_dt"] = pd.to_datetime(out["shift_end_dt"])
+    combined["work_hours"] = pd.to_numeric(out["work_hours"], errors="coerce")
 
     # derived fields
     combined["is_workday"] = combined["shift_type"].fillna("unknown").ne("day off").astype(int)
 
+    ref_end = _as_ns(combined["shift_end_dt"])
+    prev_end = preceding_shift_end(t, np.sort(end_ns), POST_SHIFT_WINDOW)
+    nat = np.iinfo("int64").min
+    ref_end = np.where(ref_end != nat, ref_end, prev_end)
+
     combined["mins_after_shift_end"] = np.where(
-        combined["shift_end_dt"].notna(),
-        (combined["ordered_time"] - combined["shift_end_dt"]).dt.total_seconds() / 60,
+        ref_end != nat,
+        (t - ref_end) / 60e9,
         np.nan
     )
     combined["is_after_shift"] = np.where(
@@ -236,16 +316,33 @@ def join_orders_to_roster(orders: pd.DataFrame, roster: pd.DataFrame) -> pd.Data
     return combined
 
 
+def join_by_user(orders: pd.DataFrame, roster: pd.DataFrame) -> pd.DataFrame:
+    """
+    join_orders_to_roster per user partition, spread over the user workers:
+    each user's orders are only matched against that user's shifts. A roster
+    without a user column is shared by every user. Rows come back in
+    fact_orders order.
+    """
+    parts = split_by_user(orders)
+    if USER_COL in roster.columns:
+        rosters = dict(split_by_user(roster))
+        tasks = [(o, rosters.get(u, roster.iloc[0:0])) for u, o in parts]
+    else:
+        tasks = [(o, roster) for _, o in parts]
+    joined = map_partitions(join_orders_to_roster, tasks)
+    return joined[0] if len(joined) == 1 else pd.concat(joined).sort_index(kind="stable")
+
+
 def write_insights(enriched: pd.DataFrame, path: Path):
-    df = enriched.copy()
+    df = enriched.copy(deep=False)
     df["total_paid"] = pd.to_numeric(df.get("total_paid"), errors="coerce")
     df["delivery_minutes"] = pd.to_numeric(df.get("delivery_minutes"), errors="coerce")
 
     total_orders = df["order_id"].nunique() if "order_id" in df.columns else len(df)
     share_workday = df["is_workday"].mean() if "is_workday" in df.columns else np.nan
 
-    after = df[df["mins_after_shift_end"].notna()].copy()
-    after_pos = after[after["mins_after_shift_end"] >= 0].copy()
+    after = df[df["mins_after_shift_end"].notna()]
+    after_pos = after[after["mins_after_shift_end"] >= 0]
 
     def fmt(x, p=2):
         return "n/a" if pd.isna(x) else f"{x:.{p}f}"
@@ -289,21 +386,10 @@ def write_insights(enriched: pd.DataFrame, path: Path):
         f.write("\n")
 
 
-# -----------------------------
-# main
-# -----------------------------
-def main():
-    if not FACT_PATH.exists():
-        raise FileNotFoundError(f"Missing {FACT_PATH}. Run star schema first.")
-    if not ROSTER_PATH.exists():
-        raise FileNotFoundError(f"Missing {ROSTER_PATH}. Put roster.csv under data/clean/roster.csv")
-
-    OUT_DIR.mkdir(parents=True, exist_ok=True)
-    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
-
-    orders = pd.read_csv(FACT_PATH)
-
-    roster_raw = pd.read_csv(ROSTER_PATH)
+def load_roster(path: Path = ROSTER_PATH) -> pd.DataFrame:
+    """roster.csv as one row per shift with start/end datetimes (see build_shift_datetimes)."""
+    roster_raw = pd.read_csv(path)
+    metrics.record_read(path, len(roster_raw))
 
     roster_raw.columns = roster_raw.columns.astype(str).str.strip()
     roster_raw.columns = roster_raw.columns.str.lower()
@@ -315,11 +401,27 @@ def main():
 
     roster_base = pick_roster_columns(roster_raw)
 
-    roster = build_shift_datetimes(roster_base)
-    enriched = join_orders_to_roster(orders, roster)
+    return build_shift_datetimes(roster_base)
+
+
+# -----------------------------
+# main
+# -----------------------------
+def main():
+    if not table_exists(FACT_PATH):
+        raise FileNotFoundError(f"Missing {FACT_PATH}. Run star schema first.")
+    if not ROSTER_PATH.exists():
+        raise FileNotFoundError(f"Missing {ROSTER_PATH}. Put roster.csv under data/clean/roster.csv")
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+
+    orders = load_table(FACT_PATH)
+    roster = load_roster(ROSTER_PATH)
+    enriched = join_by_user(orders, roster)
 
     out_path = OUT_DIR / "orders_enriched_roster.csv"
-    enriched.to_csv(out_path, index=False)
+    write_table(enriched, out_path)
 
     report_path = REPORTS_DIR / "work_roster_insights.md"
     write_insights(enriched, report_path)
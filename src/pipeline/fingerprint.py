@@ -0,0 +1,88 @@
+"""
+Content fingerprints for stage inputs/code and the persisted run state.
+
+Hashing a multi-hundred-MB CSV is not free, so file digests are memoized in
+the state file keyed by (size, mtime_ns): an untouched file is never re-read.
+"""
+import hashlib
+import json
+from pathlib import Path
+
+from common import warehouse
+from common.storage import TABLE_FORMAT
+from pipeline.stages import PROJECT_ROOT, STAGES, stage_code, stage_inputs, stored_files
+
+STATE_PATH = PROJECT_ROOT / ".pipeline" / "state.json"
+CHUNK = 1 << 20
+
+
+def load_state(path: Path = STATE_PATH) -> dict:
+    if not path.exists():
+        return {"files": {}, "stages": {}}
+    state = json.loads(path.read_text(encoding="utf-8"))
+    state.setdefault("files", {})
+    state.setdefault("stages", {})
+    return state
+
+
+def save_state(state: dict, path: Path = STATE_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2, sort_keys=True), encoding="utf-8")
+    tmp.replace(path)
+
+
+def file_digest(rel: str, state: dict):
+    """sha256 of a project file, or None if it does not exist."""
+    path = PROJECT_ROOT / rel
+    if not path.exists():
+        return None
+    st = path.stat()
+    cached = state["files"].get(rel)
+    if cached and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+        return cached["sha256"]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    state["files"][rel] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+    return digest
+
+
+def stage_fingerprint(name: str, state: dict) -> dict:
+    """Digests of everything a stage's result depends on."""
+    return {
+        # an absent optional input is recorded as None, so adding it reruns the stage
+        "inputs": {p: file_digest(p, state) for p in stored_files(stage_inputs(name), on_disk=True)},
+        "code": {p: file_digest(p, state) for p in stage_code(name)},
+        "table_format": TABLE_FORMAT,
+        # only stages that use the warehouse rerun when it is switched on/off
+        "warehouse": (
+            str(warehouse.WAREHOUSE_PATH)
+            if warehouse.ENABLED and "src/common/warehouse.py" in stage_code(name) else None
+        ),
+    }
+
+
+def outputs_digest(name: str, state: dict) -> dict:
+    return {p: file_digest(p, state) for p in stored_files(STAGES[name]["outputs"])}
+
+
+def is_up_to_date(name: str, fingerprint: dict, state: dict) -> bool:
+    """
+    A stage can be skipped when its inputs and code match the last
+    successful run and its outputs are still the files that run wrote.
+    """
+    last = state["stages"].get(name)
+    if not last or last.get("fingerprint") != fingerprint:
+        return False
+    return last.get("outputs") == outputs_digest(name, state)
+
+
+def record_run(name: str, fingerprint: dict, state: dict):
+    state["stages"][name] = {
+        "fingerprint": fingerprint,
+        "outputs": outputs_digest(name, state),
+    }
@@ -0,0 +1,163 @@
+"""
+Run manifests: one machine-readable record per refresh.
+
+run_pipeline writes .pipeline/runs/<run id>/manifest.json with, for every
+selected stage, its status and (for stages that ran) wall time, CPU time,
+peak memory, rows and bytes read/written and the time spent in sub-steps
+(see common.metrics). Per-stage metrics files and optional cProfile output
+(<stage>.prof plus a <stage>.prof.txt summary) sit next to it. The newest
+KEEP_RUNS runs are kept.
+
+Comparing two runs shows which stage (and which sub-step) got slower:
+    python src/pipeline/manifest.py                  # latest vs previous run
+    python src/pipeline/manifest.py RUN_A RUN_B
+"""
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # src/
+from pipeline.stages import PROJECT_ROOT  # noqa: E402
+
+RUNS_DIR = PROJECT_ROOT / ".pipeline" / "runs"
+KEEP_RUNS = 50
+
+
+def new_run_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+
+
+def run_dir(run_id: str) -> Path:
+    return RUNS_DIR / run_id
+
+
+def metrics_path(run_id: str, stage: str) -> Path:
+    return run_dir(run_id) / f"{stage}.metrics.json"
+
+
+def profile_path(run_id: str, stage: str) -> Path:
+    return run_dir(run_id) / f"{stage}.prof"
+
+
+def start_manifest(run_id: str, argv: list, jobs: int) -> dict:
+    return {
+        "run_id": run_id,
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "argv": argv,
+        "jobs": jobs,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "env": {k: v for k, v in os.environ.items() if k.startswith("TAKEAWAY_")},
+        "stages": {},
+    }
+
+
+def stage_entry(run_id: str, stage: str, status: str, wall_s: float = None) -> dict:
+    """Status plus whatever metrics the stage process left behind."""
+    entry = {"status": status}
+    if wall_s is not None:
+        entry["wall_s"] = round(wall_s, 3)
+    m = metrics_path(run_id, stage)
+    if m.exists():
+        entry.update(json.loads(m.read_text(encoding="utf-8")))
+    prof = profile_path(run_id, stage)
+    if prof.exists():
+        entry["profile"] = prof.relative_to(PROJECT_ROOT).as_posix()
+    return entry
+
+
+def write_profile_summary(prof: Path, top: int = 30):
+    """Human-readable top functions (by cumulative time) next to the .prof file."""
+    import io
+    import pstats
+
+    out = io.StringIO()
+    pstats.Stats(str(prof), stream=out).sort_stats("cumulative").print_stats(top)
+    prof.with_name(prof.name + ".txt").write_text(out.getvalue(), encoding="utf-8")
+
+
+def save_manifest(manifest: dict) -> Path:
+    manifest["finished"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    stages = manifest["stages"].values()
+    manifest["totals"] = {
+        key: round(sum(s.get(key) or 0 for s in stages), 3)
+        for key in ["wall_s", "cpu_s", "rows_in", "rows_out", "bytes_read", "bytes_written"]
+    }
+    path = run_dir(manifest["run_id"]) / "manifest.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    prune_runs()
+    return path
+
+
+def list_runs() -> list:
+    """Run ids with a manifest, oldest first."""
+    if not RUNS_DIR.exists():
+        return []
+    return sorted(p.parent.name for p in RUNS_DIR.glob("*/manifest.json"))
+
+
+def prune_runs(keep: int = KEEP_RUNS):
+    runs = sorted(p for p in RUNS_DIR.iterdir() if p.is_dir())
+    for old in runs[:-keep]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def load_manifest(run_id: str) -> dict:
+    return json.loads((run_dir(run_id) / "manifest.json").read_text(encoding="utf-8"))
+
+
+def stage_table(manifest: dict) -> pd.DataFrame:
+    rows = [
+        {"stage": name, "status": s["status"], "wall_s": s.get("wall_s"), "cpu_s": s.get("cpu_s"),
+         "peak_mb": s.get("peak_mb"), "rows_in": s.get("rows_in"), "rows_out": s.get("rows_out")}
+        for name, s in manifest["stages"].items()
+    ]
+    return pd.DataFrame(rows, columns=["stage", "status", "wall_s", "cpu_s", "peak_mb", "rows_in", "rows_out"])
+
+
+def compare(old: dict, new: dict) -> tuple:
+    """(per-stage table, per-step table) of `new` vs `old`, biggest slowdowns first."""
+    a, b = stage_table(old).set_index("stage"), stage_table(new).set_index("stage")
+    stages = b.join(a[["wall_s", "peak_mb", "rows_in"]], rsuffix="_before", how="left")
+    stages["wall_ratio"] = (stages["wall_s"] / stages["wall_s_before"]).round(2)
+    stages = stages.sort_values("wall_ratio", ascending=False, na_position="last")
+
+    steps = []
+    for name, s in new["stages"].items():
+        before = old["stages"].get(name, {}).get("steps", {})
+        for step, v in s.get("steps", {}).items():
+            prev = before.get(step, {}).get("seconds")
+            steps.append({"stage": name, "step": step, "seconds": v["seconds"], "seconds_before": prev,
+                          "delta_s": None if prev is None else round(v["seconds"] - prev, 3)})
+    steps = pd.DataFrame(steps, columns=["stage", "step", "seconds", "seconds_before", "delta_s"])
+    steps = steps.sort_values("delta_s", ascending=False, na_position="last")
+    return stages.reset_index(), steps
+
+
+def main():
+    runs = list_runs()
+    args = sys.argv[1:]
+    if len(args) == 2:
+        old_id, new_id = args
+    elif len(runs) >= 2:
+        old_id, new_id = runs[-2], runs[-1]
+    else:
+        print("Need two runs to compare (run the pipeline twice, or pass two run ids).")
+        sys.exit(1)
+
+    stages, steps = compare(load_manifest(old_id), load_manifest(new_id))
+    print(f"=== {new_id} vs {old_id} ===")
+    print(stages.to_string(index=False))
+    print("\n=== Sub-steps, largest slowdown first ===")
+    print(steps.head(15).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
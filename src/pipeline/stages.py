@@ -0,0 +1,221 @@
+"""
+Stage registry for the refresh pipeline.
+
+Every stage is one of the scripts under src/ plus the files it reads and
+writes (paths relative to the project root). The run order and the
+dependencies between stages are derived from these input/output lists, so
+adding a stage only means adding an entry here. Files a stage reads only
+when they exist go in "optional_inputs": they are fingerprinted when present
+but never reported as missing.
+"""
+from pathlib import Path
+
+from common.storage import stored_paths
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+# Shared modules every stage imports; a change to them invalidates all stages
+SHARED_CODE = [
+    "src/common/storage.py", "src/common/schemas.py", "src/common/backend.py", "src/common/metrics.py",
+    "src/common/datetimes.py",
+]
+
+# Outputs written through common.storage.write_table. Their files on disk
+# depend on TAKEAWAY_TABLE_FORMAT (.csv, .parquet or both).
+TABLE_OUTPUTS = {
+    "data/clean/orders_clean.csv",
+    "data/derived/dim_platform.csv",
+    "data/derived/dim_date.csv",
+    "data/derived/dim_restaurant.csv",
+    "data/derived/fact_orders.csv",
+    "data/derived/orders_enriched_roster.csv",
+    "data/derived/menu_features.csv",
+    "data/derived/restaurant_profile.csv",
+    "data/derived/orders_roster_nlp.csv",
+    "data/derived/orders_roster_nlp_fixed.csv",
+    "data/derived/orders_finance_context.csv",
+    "data/derived/orders_behavior_features.csv",
+}
+
+STAGES = {
+    "clean_orders": {
+        "script": "src/clean_orders.py",
+        "inputs": ["data/raw/deliveroo.csv", "data/raw/hungry panda.csv"],
+        "outputs": ["data/clean/orders_clean.csv", "reports/data_quality_report.md"],
+        "code": ["src/common/users.py", "src/common/order_keys.py", "src/common/rollups.py"],
+    },
+    "build_star_schema": {
+        "script": "src/modeling/build_star_schema.py",
+        "inputs": ["data/clean/orders_clean.csv"],
+        "outputs": [
+            "data/derived/dim_platform.csv",
+            "data/derived/dim_date.csv",
+            "data/derived/dim_restaurant.csv",
+            "data/derived/fact_orders.csv",
+            "data/derived/restaurant_aliases.csv",
+        ],
+        "code": [
+            "src/common/restaurant_names.py", "src/common/warehouse.py", "src/common/users.py",
+            "src/common/order_keys.py",
+        ],
+    },
+    "roster_join": {
+        "script": "src/modeling/roster_join.py",
+        "inputs": ["data/derived/fact_orders.csv", "data/clean/roster.csv"],
+        "outputs": ["data/derived/orders_enriched_roster.csv", "reports/work_roster_insights.md"],
+        "code": ["src/common/loader.py", "src/common/users.py"],
+    },
+    "nlp_menu_features": {
+        "script": "src/modeling/nlp_menu_features.py",
+        "inputs": ["data/clean/menu_items.csv"],
+        "optional_inputs": ["data/clean/menu_synonyms.csv"],
+        "outputs": ["data/derived/menu_features.csv", "data/derived/restaurant_profile.csv"],
+    },
+    "join_roster_nlp": {
+        "script": "src/modeling/join_roster_nlp.py",
+        "inputs": [
+            "data/derived/orders_enriched_roster.csv",
+            "data/derived/dim_restaurant.csv",
+            "data/derived/restaurant_profile.csv",
+            "data/derived/restaurant_aliases.csv",
+        ],
+        "outputs": ["data/derived/orders_roster_nlp.csv", "data/derived/kpi_workday_foodprefs.csv"],
+        "code": ["src/common/restaurant_names.py"],
+    },
+    "fix_shift_timing": {
+        "script": "src/modeling/00_fix_shift_timing.py",
+        "inputs": ["data/derived/orders_roster_nlp.csv"],
+        "outputs": ["data/derived/orders_roster_nlp_fixed.csv"],
+        "code": ["src/common/shift_calendar.py", "src/common/users.py"],
+    },
+    "finance_context": {
+        "script": "src/features/finance_context.py",
+        "inputs": ["data/derived/orders_enriched_roster.csv"],
+        "outputs": ["data/derived/orders_finance_context.csv"],
+        "code": ["src/common/users.py"],
+    },
+    "behavior_features": {
+        "script": "src/features/behavior_features.py",
+        "inputs": ["data/derived/orders_enriched_roster.csv"],
+        "outputs": ["data/derived/orders_behavior_features.csv"],
+        "code": ["src/common/loader.py", "src/common/users.py"],
+    },
+    "eda_kpi": {
+        "script": "src/modeling/eda_kpi.py",
+        "inputs": ["data/derived/fact_orders.csv", "data/derived/orders_enriched_roster.csv"],
+        "outputs": [
+            "data/derived/kpi_orders_daily.csv",
+            "data/derived/kpi_orders_weekly.csv",
+            "data/derived/kpi_orders_monthly.csv",
+            "data/derived/kpi_orders_platform.csv",
+            "data/derived/kpi_orders_shift_type.csv",
+            "data/derived/kpi_orders_user.csv",
+            "reports/insights_summary.md",
+        ],
+        "code": ["src/common/rollups.py", "src/common/partitions.py", "src/common/warehouse.py", "src/common/loader.py",
+                 "src/common/users.py"],
+    },
+    "eda_behavior_metrics": {
+        "script": "src/modeling/eda_behavior_metrics.py",
+        "inputs": ["data/derived/fact_orders.csv"],
+        "outputs": ["data/derived/behavior_metrics.csv", "reports/behavior_insights.md"],
+        "code": ["src/common/rollups.py", "src/common/partitions.py", "src/common/warehouse.py", "src/common/loader.py",
+                 "src/common/users.py"],
+    },
+    "eda_payday_rent": {
+        "script": "src/modeling/eda_payday_rent.py",
+        "inputs": ["data/derived/orders_finance_context.csv"],
+        "outputs": [
+            f"data/derived/kpi/kpi_{name}_{value}.csv"
+            for name in ["payday", "paycycle", "near_rent", "day_of_month"]
+            for value in ["total_paid", "food_cost"]
+        ],
+        "code": ["src/common/rollups.py", "src/common/partitions.py", "src/common/users.py"],
+    },
+    "export_partitions": {
+        "script": "src/modeling/export_partitions.py",
+        "inputs": [
+            "data/derived/fact_orders.csv",
+            "data/derived/orders_roster_nlp_fixed.csv",
+            "data/derived/orders_finance_context.csv",
+            "data/derived/orders_behavior_features.csv",
+        ],
+        "outputs": ["data/export/manifest.json"],
+        "code": ["src/common/partitions.py", "src/common/loader.py"],
+    },
+}
+
+
+def stage_code(name: str) -> list:
+    """Source files whose content is part of a stage's fingerprint."""
+    stage = STAGES[name]
+    return [stage["script"]] + list(stage.get("code", [])) + SHARED_CODE
+
+
+def stage_inputs(name: str) -> list:
+    """Required plus optional inputs of a stage."""
+    stage = STAGES[name]
+    return list(stage["inputs"]) + list(stage.get("optional_inputs", []))
+
+
+def stored_files(paths, on_disk: bool = False) -> list:
+    """
+    Expand table paths to the files written under the current format.
+    With `on_disk`, return whichever stored forms exist instead, since
+    common.storage.read_table falls back to the other format.
+    """
+    out = []
+    for rel in paths:
+        if rel not in TABLE_OUTPUTS:
+            out.append(rel)
+            continue
+        files = [Path(p).as_posix() for p in stored_paths(rel)]
+        if on_disk:
+            present = [Path(p).as_posix() for p in stored_paths(rel, "both") if (PROJECT_ROOT / p).exists()]
+            files = present or files
+        out.extend(files)
+    return out
+
+
+def upstream(name: str) -> list:
+    """Stages that produce any of the inputs of `name`."""
+    inputs = set(stage_inputs(name))
+    return [other for other, st in STAGES.items() if other != name and inputs & set(st["outputs"])]
+
+
+def topo_order(names=None) -> list:
+    """
+    Dependency-respecting run order. Registry order is kept wherever the
+    graph allows it, so the result matches the manual refresh order.
+    """
+    names = list(STAGES) if names is None else list(names)
+    wanted = set(names)
+    order, done = [], set()
+
+    def visit(n, path=()):
+        if n in done:
+            return
+        if n in path:
+            raise ValueError(f"Cycle in stage graph: {' -> '.join(path + (n,))}")
+        for dep in upstream(n):
+            if dep in wanted:
+                visit(dep, path + (n,))
+        done.add(n)
+        order.append(n)
+
+    for n in names:
+        visit(n)
+    return order
+
+
+def downstream(names) -> list:
+    """All stages that (transitively) consume outputs of `names`, including `names`."""
+    out = set(names)
+    changed = True
+    while changed:
+        changed = False
+        for n in STAGES:
+            if n not in out and set(upstream(n)) & out:
+                out.add(n)
+                changed = True
+    return [n for n in STAGES if n in out]
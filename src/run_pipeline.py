@@ -0,0 +1,226 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from pipeline.stages import PROJECT_ROOT, STAGES, topo_order, downstream, stored_files, upstream
+from pipeline.fingerprint import (
+    load_state, save_state, stage_fingerprint, is_up_to_date, record_run,
+)
+from pipeline.manifest import (
+    metrics_path, new_run_id, profile_path, save_manifest, stage_entry, start_manifest,
+    write_profile_summary,
+)
+
+
+LOG_DIR = PROJECT_ROOT / ".pipeline" / "logs"
+
+# statuses after which dependants may start / must not start
+DONE = {"ran", "skipped", "stale", "no-input"}
+FAILED = {"failed", "blocked"}
+
+
+def missing_inputs(name: str) -> list:
+    return [p for p in stored_files(STAGES[name]["inputs"], on_disk=True) if not (PROJECT_ROOT / p).exists()]
+
+
+def log_path(name: str) -> Path:
+    return LOG_DIR / f"{name}.log"
+
+
+def run_stage(name: str, run_id: str, profile: bool = False):
+    """
+    Run one stage script, its stdout/stderr going to .pipeline/logs/<stage>.log
+    and its metrics (common.metrics) to the run directory. With `profile`,
+    the script runs under cProfile.
+    """
+    script = PROJECT_ROOT / STAGES[name]["script"]
+    cmd = [sys.executable, str(script)]
+    if profile:
+        prof = profile_path(run_id, name)
+        prof.parent.mkdir(parents=True, exist_ok=True)
+        cmd = [sys.executable, "-m", "cProfile", "-o", str(prof), str(script)]
+    env = {**os.environ, "TAKEAWAY_METRICS_FILE": str(metrics_path(run_id, name))}
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    with open(log_path(name), "w", encoding="utf-8") as log:
+        # scripts use project-relative paths, so always run from the project root
+        subprocess.run(cmd, cwd=PROJECT_ROOT, check=True, env=env, stdout=log, stderr=subprocess.STDOUT)
+    if profile:
+        write_profile_summary(prof)
+
+
+def show_log(name: str, tail: int = None):
+    lines = log_path(name).read_text(encoding="utf-8", errors="replace").splitlines()
+    for line in lines[-tail:] if tail else lines:
+        print(f"   {line}")
+
+
+def check_stage(name: str, state: dict, force: bool, dry_run: bool, stale_upstream=()):
+    """
+    (status, fingerprint): status is None when the stage has to run.
+    `stale_upstream` are upstream stages a dry run reported as stale; their
+    new outputs would make this stage run too.
+    """
+    fp = stage_fingerprint(name, state)
+
+    if dry_run and stale_upstream:
+        print(f"🔁 {name}: would run (after {', '.join(stale_upstream)})")
+        return "stale", fp
+
+    missing = missing_inputs(name)
+    if missing:
+        outputs = stored_files(STAGES[name]["outputs"], on_disk=True)
+        if all((PROJECT_ROOT / p).exists() for p in outputs):
+            # e.g. data/raw is private and not checked in: keep published outputs
+            print(f"⏭️  {name}: inputs missing ({', '.join(missing)}), keeping existing outputs")
+            return "no-input", fp
+        print(f"❌ {name}: missing inputs {missing}")
+        return "failed", fp
+
+    if not force and is_up_to_date(name, fp, state):
+        print(f"⏭️  {name}: up to date")
+        return "skipped", fp
+
+    if dry_run:
+        print(f"🔁 {name}: would run")
+        return "stale", fp
+    return None, fp
+
+
+def run(stages=None, force=False, dry_run=False, jobs=1, profile=(), manifest=None):
+    """
+    Run `stages` (default: all) in dependency order, skipping every stage
+    whose inputs, code and outputs are unchanged since its last run.
+    Stages in `profile` always run, under cProfile.
+
+    Up to `jobs` stages whose upstream stages are done run at the same time,
+    each in its own process. A failing stage only blocks its dependants;
+    independent stages still run.
+    Returns {stage: "ran" | "skipped" | "stale" | "no-input" | "failed" | "blocked"};
+    with `manifest` (see pipeline.manifest), each stage's entry is added to it.
+    """
+    run_id = manifest["run_id"] if manifest else new_run_id()
+    state = load_state()
+    order = topo_order(stages)
+    deps = {n: [d for d in upstream(n) if d in order] for n in order}
+    status = {}
+    running = {}  # future -> (stage, fingerprint, start time)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while len(status) < len(order):
+            for name in order:
+                if name in status or any(name == r[0] for r in running.values()):
+                    continue
+                if any(status.get(d) in FAILED for d in deps[name]):
+                    print(f"⛔ {name}: blocked by failed upstream stage")
+                    status[name] = "blocked"
+                    continue
+                if len(running) >= max(1, jobs) or not all(status.get(d) in DONE for d in deps[name]):
+                    continue
+                stale_upstream = [d for d in deps[name] if status.get(d) == "stale"]
+                result, fp = check_stage(name, state, force or name in profile, dry_run, stale_upstream)
+                if result:
+                    status[name] = result
+                    continue
+                print(f"▶️  {name}: running {STAGES[name]['script']}{' (profiled)' if name in profile else ''}")
+                running[pool.submit(run_stage, name, run_id, name in profile)] = (name, fp, time.perf_counter())
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name, fp, t0 = running.pop(fut)
+                wall = time.perf_counter() - t0
+                try:
+                    fut.result()
+                except subprocess.CalledProcessError as e:
+                    print(f"❌ {name} failed (exit {e.returncode}); log: {log_path(name).relative_to(PROJECT_ROOT)}")
+                    show_log(name, tail=20)
+                    status[name] = "failed"
+                    if manifest is not None:
+                        manifest["stages"][name] = stage_entry(run_id, name, "failed", wall)
+                    continue
+                if jobs <= 1:
+                    show_log(name)
+                record_run(name, fp, state)
+                save_state(state)
+                print(f"✅ {name} finished in {wall:.1f}s")
+                status[name] = "ran"
+                if manifest is not None:
+                    manifest["stages"][name] = stage_entry(run_id, name, "ran", wall)
+
+    save_state(state)
+    if manifest is not None:
+        for n in order:
+            manifest["stages"].setdefault(n, {"status": status[n]})
+        manifest["stages"] = {n: manifest["stages"][n] for n in order}
+    return {n: status[n] for n in order}
+
+
+def print_metrics(manifest: dict):
+    rows = [(n, s) for n, s in manifest["stages"].items() if "wall_s" in s]
+    if not rows:
+        return
+    print(f"\n{'stage':<22}{'wall s':>8}{'cpu s':>8}{'peak MB':>9}{'rows in':>11}{'rows out':>11}  slowest step")
+    for name, s in rows:
+        steps = s.get("steps") or {}
+        top = next(iter(steps.items()), None)
+        peak = f"{s['peak_mb']:.0f}" if s.get("peak_mb") is not None else "-"
+        print(
+            f"{name:<22}{s['wall_s']:>8.1f}{s.get('cpu_s', float('nan')):>8.1f}{peak:>9}"
+            f"{s.get('rows_in', 0):>11,}{s.get('rows_out', 0):>11,}"
+            + (f"  {top[0]} ({top[1]['seconds']:.1f}s)" if top else "")
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental refresh of data/clean and data/derived.")
+    parser.add_argument("stages", nargs="*", help=f"stages to run (default: all). Known: {', '.join(STAGES)}")
+    parser.add_argument("--downstream", action="store_true", help="also run every stage that consumes the selected ones")
+    parser.add_argument("--force", action="store_true", help="run selected stages even if up to date")
+    parser.add_argument("--dry-run", action="store_true", help="only report which stages are stale")
+    parser.add_argument(
+        "--profile", action="append", default=[], metavar="STAGE",
+        help="run STAGE under cProfile (always runs it); repeatable",
+    )
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=int(os.environ.get("TAKEAWAY_PIPELINE_JOBS", "1")),
+        help="stages to run concurrently when the dependency graph allows (default 1)",
+    )
+    args = parser.parse_args()
+
+    unknown = [s for s in args.stages + args.profile if s not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+
+    selected = args.stages or None
+    if selected and args.downstream:
+        selected = downstream(selected)
+
+    if selected and args.profile:
+        selected = list(dict.fromkeys(selected + args.profile))
+
+    manifest = None if args.dry_run else start_manifest(new_run_id(), sys.argv[1:], args.jobs)
+    status = run(selected, force=args.force, dry_run=args.dry_run, jobs=args.jobs,
+                 profile=set(args.profile), manifest=manifest)
+    ran = [n for n, s in status.items() if s == "ran"]
+    failed = [n for n, s in status.items() if s in FAILED]
+    if manifest is not None:
+        print_metrics(manifest)
+        path = save_manifest(manifest)
+        print(f"\n📄 Run manifest: {path.relative_to(PROJECT_ROOT)}")
+    if args.dry_run:
+        stale = [n for n, s in status.items() if s == "stale"]
+        print(f"\n🎯 Dry run: {len(stale)} would run, {len(status) - len(stale) - len(failed)} up to date, {len(failed)} failed.")
+    else:
+        print(f"\n🎯 Pipeline done: {len(ran)} ran, {len(status) - len(ran) - len(failed)} skipped, {len(failed)} failed.")
+    if failed:
+        print(f"❌ Failed or blocked: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Local HTTP/JSON KPI query service over the published order tables.
+
+Answers KPI queries on orders_finance_context (fact columns + shift context +
+payday flags) plus the orders streamed since the last batch run
+(orders_stream), so dashboards and tools stop re-reading and re-aggregating
+the CSVs themselves:
+
+    GET /kpi?start=2025-01-01&end=2025-06-30&platform=deliveroo&group_by=month,shift_type
+    GET /kpi?is_payday=1&shift_type=night shift&metrics=orders_cnt,aov
+    GET /filters      # values accepted by the filters, and the date range
+    GET /health       # data version, rows loaded, cache stats
+
+Filters: start / end (dates, inclusive), platform, shift_type, user,
+is_payday (0/1); several values are comma-separated. group_by takes any of
+GROUPS, metrics any of the eda_kpi KPI columns (default: all).
+
+Results are kept in an LRU cache (--cache-size entries, each valid for
+--ttl seconds). The tables are loaded once; when the pipeline (or the
+stream) publishes new versions of them, they are reloaded on the next query
+and the cache is cleared, so answers never mix old and new outputs.
+
+Usage:
+    python src/serve_kpi.py                 # http://127.0.0.1:8050
+    python src/serve_kpi.py --port 9000 --cache-size 512 --ttl 600
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent))  # src/
+from common import backend  # noqa: E402
+from common.loader import load_table, source_file  # noqa: E402
+from common.shift_calendar import default_calendar  # noqa: E402
+from common.storage import read_table, table_exists  # noqa: E402
+from common.users import with_user  # noqa: E402
+from modeling import eda_kpi  # noqa: E402
+
+DERIVED = Path("data/derived")
+ORDERS_PATH = DERIVED / "orders_finance_context.csv"
+STREAM_PATH = DERIVED / "orders_stream.csv"
+DIM_PATHS = {"platform": DERIVED / "dim_platform.csv", "restaurant": DERIVED / "dim_restaurant.csv"}
+
+COLUMNS = [
+    "order_id", "user_id", "platform_id", "restaurant_id", "ordered_time", "is_weekend",
+    "total_paid", "delivery_minutes", "fees_ratio", "total_fees", "shift_type", "is_payday",
+]
+
+# group_by name -> column
+GROUPS = {
+    "date": "order_date",
+    "week": "order_week",
+    "month": "order_month",
+    "weekday": "order_weekday",
+    "hour": "order_hour",
+    "platform": "platform",
+    "restaurant": "restaurant",
+    "shift_type": "shift_type",
+    "is_payday": "is_payday",
+    "user": "user_id",
+}
+# filter name -> column (start / end filter ordered_time)
+FILTERS = {"platform": "platform", "shift_type": "shift_type", "user": "user_id", "is_payday": "is_payday"}
+METRICS = ["orders_cnt", "total_spend", "aov", "median_delivery", "p90_delivery",
+           "avg_fees_ratio", "late_night_share", "weekend_share"]
+
+CACHE_SIZE = 256
+CACHE_TTL_S = 300.0
+VERSION_CHECK_S = 1.0  # stat the source files at most this often
+
+
+class QueryError(ValueError):
+    """A query the service cannot answer (answered with HTTP 400)."""
+
+
+class ResultCache:
+    """LRU cache whose entries also expire `ttl` seconds after they were stored."""
+
+    def __init__(self, size: int = CACHE_SIZE, ttl: float = CACHE_TTL_S):
+        self.size, self.ttl = size, ttl
+        self._entries = OrderedDict()  # key -> (stored at, value)
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "size": self.size, "ttl_s": self.ttl,
+                    "hits": self.hits, "misses": self.misses}
+
+
+def _split(values: list) -> list:
+    return [v.strip() for value in values for v in value.split(",") if v.strip()]
+
+
+def parse_query(params: dict) -> tuple:
+    """Normalized (filters, group_by, metrics) of a /kpi query string; also the cache key."""
+    unknown = sorted(set(params) - set(FILTERS) - {"start", "end", "group_by", "metrics"})
+    if unknown:
+        raise QueryError(f"Unknown parameter(s): {', '.join(unknown)}")
+    filters = []
+    for name in ["start", "end"]:
+        if name in params:
+            try:
+                filters.append((name, (pd.Timestamp(params[name][-1]).date().isoformat(),)))
+            except ValueError:
+                raise QueryError(f"{name} must be a date (YYYY-MM-DD)") from None
+    for name in FILTERS:
+        if name in params:
+            values = _split(params[name])
+            if name == "is_payday":
+                flags = {"1": 1, "true": 1, "0": 0, "false": 0}
+                if any(v.lower() not in flags for v in values):
+                    raise QueryError("is_payday must be 0 or 1")
+                values = [flags[v.lower()] for v in values]
+            else:
+                values = [v.lower() for v in values]
+            filters.append((name, tuple(sorted(set(values)))))
+
+    group_by = tuple(_split(params.get("group_by", [])))
+    bad = [g for g in group_by if g not in GROUPS]
+    if bad:
+        raise QueryError(f"Unknown group_by: {', '.join(bad)} (choose from {', '.join(GROUPS)})")
+    metrics = tuple(_split(params.get("metrics", []))) or tuple(METRICS)
+    bad = [m for m in metrics if m not in METRICS]
+    if bad:
+        raise QueryError(f"Unknown metrics: {', '.join(bad)} (choose from {', '.join(METRICS)})")
+    return tuple(filters), group_by, metrics
+
+
+class KpiService:
+    """The loaded order rows, their version, and the query cache."""
+
+    def __init__(self, cache: ResultCache):
+        self.cache = cache
+        self.data = None  # (orders, version, loaded_at), replaced as a whole on reload
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    # ---- data ----
+    @staticmethod
+    def source_version() -> tuple:
+        """(file, size, mtime_ns) of every table a query reads."""
+        stamps = []
+        for path in [ORDERS_PATH, STREAM_PATH, *DIM_PATHS.values()]:
+            src = source_file(path)
+            if src.exists():
+                st = src.stat()
+                stamps.append((str(src), st.st_size, st.st_mtime_ns))
+        return tuple(stamps)
+
+    @staticmethod
+    def load_orders() -> pd.DataFrame:
+        """Batch + streamed orders, with the filter and group-by columns ready."""
+        if not table_exists(ORDERS_PATH):
+            raise FileNotFoundError(f"Cannot find {ORDERS_PATH}. Please run the pipeline first.")
+        frames = [load_table(ORDERS_PATH, columns=COLUMNS)]
+        if table_exists(STREAM_PATH):
+            frames.append(read_table(STREAM_PATH, columns=COLUMNS))
+        df = with_user(pd.concat([f for f in frames if len(f)] or frames[:1], ignore_index=True))
+        df["ordered_time"] = pd.to_datetime(df["ordered_time"], errors="coerce")
+        df = backend.derive(df, "kpi_time_features")
+
+        day = df["ordered_time"].dt.normalize()
+        df["order_date"] = day.dt.strftime("%Y-%m-%d")
+        df["order_week"] = (day - pd.to_timedelta(day.dt.weekday, unit="D")).dt.strftime("%Y-%m-%d")
+        for name, path in DIM_PATHS.items():
+            id_col = f"{name}_id"
+            dim = read_table(path) if table_exists(path) else pd.DataFrame(columns=[name, id_col])
+            dim = dim.dropna(subset=[id_col])
+            names = pd.Series(dim[name].astype(str).to_numpy(), index=pd.to_numeric(dim[id_col]).astype("int64"))
+            df[name] = pd.to_numeric(df[id_col], errors="coerce").astype("Int64").map(names).astype("category")
+        df["shift_type"] = default_calendar().normalize(df["shift_type"]).astype("category")
+        df["is_payday"] = pd.to_numeric(df["is_payday"], errors="coerce").astype("Int8")
+        df["user_id"] = df["user_id"].astype("category")
+        return df
+
+    def ensure_current(self):
+        """Reload the tables (and drop cached results) when a newer version was published."""
+        now = time.monotonic()
+        if self.data is not None and now - self._checked < VERSION_CHECK_S:
+            return
+        with self._lock:
+            self._checked = now
+            version = self.source_version()
+            if self.data is not None and version == self.data[1]:
+                return
+            try:
+                orders = self.load_orders()
+            except Exception as e:
+                if self.data is None:
+                    raise
+                # a table may be mid-write; keep serving the last version and retry
+                print(f"⚠️  Reload failed, serving the previous version: {e}")
+                return
+            self.data = (orders, version, time.strftime("%Y-%m-%dT%H:%M:%S"))
+            self.cache.clear()
+            print(f"✅ Loaded {len(orders)} orders")
+
+    # ---- queries ----
+    def _mask(self, df: pd.DataFrame, filters: tuple) -> pd.Series:
+        mask = pd.Series(True, index=df.index)
+        for name, values in filters:
+            if name == "start":
+                mask &= df["ordered_time"] >= pd.Timestamp(values[0])
+            elif name == "end":
+                mask &= df["ordered_time"] < pd.Timestamp(values[0]) + pd.Timedelta(days=1)
+            elif name == "is_payday":
+                mask &= df["is_payday"].isin(values).fillna(False)
+            else:
+                mask &= df[FILTERS[name]].astype("string").str.lower().isin(values).fillna(False)
+        return mask
+
+    def kpi(self, df: pd.DataFrame, filters: tuple, group_by: tuple, metrics: tuple) -> list:
+        """KPI rows (eda_kpi definitions) of the filtered orders, one per group."""
+        rows = df[self._mask(df, filters).to_numpy()]
+        keys = [GROUPS[g] for g in group_by]
+        if not len(rows):
+            return []
+        if not keys:
+            rows = rows.assign(_all=0)
+        parts = eda_kpi.build_cells(rows, keys or ["_all"])
+        table = pd.concat([parts[keys], eda_kpi.kpi_table(parts)[list(metrics)]], axis=1)
+        table = table.rename(columns={GROUPS[g]: g for g in group_by})
+        return json.loads(table.to_json(orient="records", date_format="iso"))
+
+    def query(self, params: dict) -> dict:
+        t0 = time.perf_counter()
+        query = parse_query(params)
+        self.ensure_current()
+        data = self.data  # one version for the whole query, even if a reload swaps it meanwhile
+        orders, version, loaded_at = data
+        key = (version, query)
+        rows = self.cache.get(key)
+        cached = rows is not None
+        if not cached:
+            rows = self.kpi(orders, *query)
+            # a reload finished meanwhile: don't put an old-version result in the cleared cache
+            if self.data is data:
+                self.cache.put(key, rows)
+        return {"rows": rows, "cached": cached, "loaded_at": loaded_at,
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000, 3)}
+
+    def filter_values(self) -> dict:
+        self.ensure_current()
+        df = self.data[0]
+        return {
+            **{name: sorted(df[col].dropna().astype(str).unique().tolist()) for name, col in FILTERS.items()},
+            "start": df["order_date"].min(), "end": df["order_date"].max(),
+            "group_by": list(GROUPS), "metrics": METRICS,
+        }
+
+    def health(self) -> dict:
+        self.ensure_current()
+        orders, version, loaded_at = self.data
+        return {"status": "ok", "orders": len(orders), "loaded_at": loaded_at,
+                "sources": [s[0] for s in version], "cache": self.cache.stats()}
+
+
+class KpiHandler(BaseHTTPRequestHandler):
+    service: KpiService = None
+    routes = {"/kpi": "query", "/filters": "filter_values", "/health": "health"}
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        route = self.routes.get(url.path.rstrip("/") or "/")
+        if route is None:
+            self._send(404, {"error": f"Unknown path {url.path}", "paths": list(self.routes)})
+            return
+        try:
+            if route == "query":
+                payload = self.service.query(parse_qs(url.query))
+            else:
+                payload = getattr(self.service, route)()
+        except QueryError as e:
+            self._send(400, {"error": str(e)})
+        except FileNotFoundError as e:
+            self._send(503, {"error": str(e)})
+        else:
+            self._send(200, payload)
+
+    def log_message(self, format, *args):
+        pass  # one line per dashboard query would drown the reload messages
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve KPI queries over the published order tables.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8050)
+    ap.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="max cached query results")
+    ap.add_argument("--ttl", type=float, default=CACHE_TTL_S, help="seconds a cached result stays valid")
+    args = ap.parse_args()
+
+    KpiHandler.service = KpiService(ResultCache(args.cache_size, args.ttl))
+    KpiHandler.service.ensure_current()
+    server = ThreadingHTTPServer((args.host, args.port), KpiHandler)
+    print(f"📡 KPI queries on http://{args.host}:{args.port}/kpi (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 KPI service stopped")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
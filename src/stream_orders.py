@@ -0,0 +1,404 @@
+"""
+Streaming refresh: new order events show up in the KPI outputs within seconds.
+
+Events are JSON objects in the raw export layout ("Order Number",
+"Ordered Time", "Total Paid", ... plus "Platform" and optionally "User"),
+one per line, read from
+- a JSONL file that is tailed (default data/stream/orders.jsonl; the
+  read offset is kept in .pipeline/stream/state.json), and/or
+- a local TCP socket (--port), standing in for a platform webhook; every
+  line is answered with {"ok": true, ...} once its batch is published.
+
+Events are handled in micro-batches (up to --batch-size events or
+--batch-wait seconds) with the batch pipeline's own code:
+clean_orders cleaning rules (outlier cap of the last full clean) ->
+build_star_schema fact columns and published dimension ids ->
+roster_join shift context -> finance_context features -> eda_kpi cells.
+The new cells are merged with the cells of the last eda_kpi run and the
+eda_kpi CSVs are rewritten in place (atomically). Enriched events are
+appended to data/derived/orders_stream.csv.
+
+The batch refresh stays the source of truth: events at or before their
+platform's clean watermark are skipped as already loaded, and when a new
+batch run lands, the streamed orders it now covers are dropped from the
+stream, so nothing is counted twice. Ids of dimension members first seen
+in the stream (a new restaurant) stay empty until the next batch.
+
+Usage:
+    python src/stream_orders.py                       # tail data/stream/orders.jsonl
+    python src/stream_orders.py --port 8765           # also accept events on 127.0.0.1:8765
+    python src/stream_orders.py --once                # process what is in the file and exit
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent))  # src/
+import clean_orders as clean  # noqa: E402
+from common import metrics, rollups  # noqa: E402
+from common.partitions import STATE_DIR as KPI_STATE_DIR, stored_cells  # noqa: E402
+from common.restaurant_names import ALIASES_PATH, RestaurantResolver  # noqa: E402
+from common.storage import append_table, read_table, table_exists, write_table  # noqa: E402
+from common.users import USER_COL, with_user  # noqa: E402
+from features.finance_context import add_finance_features  # noqa: E402
+from modeling import build_star_schema as star  # noqa: E402
+from modeling import eda_kpi  # noqa: E402
+from modeling.roster_join import ROSTER_PATH, join_by_user, load_roster  # noqa: E402
+
+STREAM_FILE = Path("data/stream/orders.jsonl")
+OUT_STREAM = Path("data/derived/orders_stream.csv")
+STATE_PATH = Path(".pipeline/stream/state.json")
+REJECTED_PATH = Path(".pipeline/stream/rejected.jsonl")
+
+BATCH_SIZE = 500
+BATCH_WAIT_S = 1.0
+POLL_S = 0.5
+BATCH_CHECK_S = 5.0
+
+ROSTER_COLUMNS = ["shift_type", "shift_start_dt", "shift_end_dt", "work_hours",
+                  "is_workday", "mins_after_shift_end", "is_after_shift"]
+FINANCE_COLUMNS = ["order_date_dt", "weekday", "is_payday", "days_since_payday",
+                   "day_of_month", "is_rent_due", "days_to_rent_due", "is_near_rent_due"]
+# raw platform + order number + natural key: enough to re-check against a newer watermark;
+# the digest of the raw event tells a re-sent event from a new order with the same key
+EVENT_COLUMNS = ["platform_raw", "order_number", "event_key", "event_digest"]
+STREAM_COLUMNS = star.FACT_COLUMNS + ROSTER_COLUMNS + FINANCE_COLUMNS + EVENT_COLUMNS
+
+
+def _mtime(path: Path):
+    return path.stat().st_mtime_ns if path.exists() else None
+
+
+def event_digest(event: dict) -> str:
+    return hashlib.sha1(json.dumps(event, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def _replace_csv(df: pd.DataFrame, path: Path):
+    """Write a CSV next to `path` and swap it in, so readers never see half a file."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    metrics.record_write(path, len(df))
+
+
+class StreamProcessor:
+    """Stream state: the last batch run's context plus the orders streamed since."""
+
+    def __init__(self):
+        self.rows = None
+        self.load_batch_context()
+
+    def _batch_version(self) -> tuple:
+        return tuple(_mtime(p) for p in [
+            clean.WATERMARK_PATH, KPI_STATE_DIR / "eda_kpi.pkl", ROSTER_PATH,
+            star.OUT_DIR / "dim_platform.csv", star.OUT_DIR / "dim_restaurant.csv", star.OUT_DIR / "dim_date.csv",
+        ])
+
+    def load_batch_context(self):
+        """(Re)load what the last batch run published and drop streamed orders it now covers."""
+        self.version = self._batch_version()
+        self.watermarks = clean.load_watermarks() or clean.empty_watermarks()
+        self.cap = np.nan if self.watermarks.get("cap") is None else self.watermarks["cap"]
+        self.resolver = RestaurantResolver.load(ALIASES_PATH)
+        self.dims = {
+            key: star.load_dim(name, key, id_col).set_index(key)[id_col]
+            for name, key, id_col in [("dim_platform", "platform", "platform_id"),
+                                      ("dim_restaurant", "restaurant", "restaurant_id"),
+                                      ("dim_date", "date", "date_id")]
+        }
+        self.roster = load_roster(ROSTER_PATH) if ROSTER_PATH.exists() else None
+        batch = stored_cells("eda_kpi")
+        self.batch_cells = batch if batch is not None else pd.DataFrame()
+
+        rows = self.rows
+        if rows is None:
+            rows = read_table(OUT_STREAM) if table_exists(OUT_STREAM) else pd.DataFrame(columns=STREAM_COLUMNS)
+            rows = rows.reindex(columns=STREAM_COLUMNS)
+        if len(rows):
+            keys = pd.DataFrame({"platform": rows["platform_raw"], "order_number": rows["order_number"],
+                                 USER_COL: rows[USER_COL]})
+            still_new = clean.is_new(keys, pd.to_datetime(rows["ordered_time"]), self.watermarks)
+            if not still_new.all():
+                rows = rows[still_new.to_numpy()].reset_index(drop=True)
+                write_table(rows, OUT_STREAM)
+                print(f"ℹ️  Batch refresh landed: {int((~still_new).sum())} streamed order(s) now in the batch tables")
+        self.rows = rows
+        self.seen = set(rows["event_digest"].dropna().astype(str))
+        self.key_counts = clean.key_counts(rows["event_key"].dropna().astype(str))
+        self.stream_cells = self._cells(rows) if len(rows) else pd.DataFrame()
+
+    def refresh_if_changed(self) -> bool:
+        if self._batch_version() == self.version:
+            return False
+        self.load_batch_context()
+        self.publish()
+        return True
+
+    # ---- per batch ----
+    def _attach_ids(self, fact: pd.DataFrame) -> pd.DataFrame:
+        fact["platform_id"] = fact["platform"].map(self.dims["platform"])
+        fact["restaurant_id"] = fact["restaurant"].map(self.dims["restaurant"])
+        fact["date_id"] = fact["ordered_time"].dt.date.map(self.dims["date"])
+        fact["order_id"] = star.natural_order_ids(fact)
+        return fact
+
+    @staticmethod
+    def _cells(rows: pd.DataFrame) -> pd.DataFrame:
+        df = rows[["order_id", USER_COL, "platform_id", "ordered_time", "is_weekend", "total_paid",
+                   "delivery_minutes", "fees_ratio", "total_fees", "shift_type"]].copy(deep=False)
+        df["ordered_time"] = pd.to_datetime(df["ordered_time"], errors="coerce")
+        df = eda_kpi.add_time_features(df)
+        return eda_kpi.build_cells(df)
+
+    @metrics.timed("stream:batch")
+    def process(self, events: list) -> int:
+        """Clean, enrich and aggregate a batch of raw events; returns the number of new orders."""
+        self.refresh_if_changed()
+        df = clean.prepare_raw(pd.DataFrame(events), "unknown")
+        if "ordered_time" not in df.columns:
+            raise ValueError("Events need an 'Ordered Time'.")
+        t = clean.try_parse_datetime(df["ordered_time"])
+        digests = pd.Series([event_digest(e) for e in events], index=df.index)
+
+        # dropped events are reported, never skipped silently
+        repeated = (digests.isin(self.seen) | digests.duplicated()).to_numpy()
+        loaded = ~clean.is_new(df, t, self.watermarks).to_numpy() & ~repeated
+        for mask, reason in [(repeated, "duplicate event, already streamed"),
+                             (loaded, "order already loaded by the batch refresh")]:
+            if mask.any():
+                reject([json.dumps(e, default=str) for e, m in zip(events, mask) if m], reason)
+        new = ~(repeated | loaded)
+        if not new.any():
+            return 0
+        # same-minute orders without an order number get the next occurrence number
+        keys = clean.order_keys(df[new], t[new], self.key_counts)
+        df = df[new].reset_index(drop=True)
+        df["platform_raw"] = df["platform"]
+        df["event_key"] = keys.to_numpy()
+        df["event_digest"] = digests[new].to_numpy()
+
+        # the batch cleaning rules, with the outlier cap of the last full clean
+        df = clean.add_cross_field_checks(df)
+        if "delivery_minutes" in df.columns:
+            df = clean.flag_delivery_outliers(df, self.cap)
+        df = clean.add_numeric_and_calendar(df)
+
+        fact = self._attach_ids(star.prepare_fact_rows(with_user(df), self.resolver))
+        if self.roster is not None:
+            enriched = join_by_user(fact, self.roster)
+        else:
+            enriched = fact.reindex(columns=list(fact.columns) + ROSTER_COLUMNS)
+        enriched = add_finance_features(enriched).reindex(columns=STREAM_COLUMNS)
+
+        append_table(enriched, OUT_STREAM)
+        self.rows = pd.concat([self.rows, enriched], ignore_index=True) if len(self.rows) else enriched
+        self.seen.update(enriched["event_digest"])
+        for key, n in clean.key_counts(enriched["event_key"]).items():
+            self.key_counts[key] = self.key_counts.get(key, 0) + n
+
+        cells = self._cells(enriched)
+        if len(self.stream_cells):
+            cells = rollups.merge_partials(pd.concat([self.stream_cells, cells], ignore_index=True), eda_kpi.CELL_KEYS)
+        self.stream_cells = cells
+        self.publish()
+        return len(enriched)
+
+    def publish(self):
+        """Rewrite the eda_kpi outputs from the batch cells plus the streamed ones."""
+        parts = [c for c in [self.batch_cells, self.stream_cells] if len(c)]
+        if not parts:
+            return
+        with metrics.step("stream:publish"):
+            outputs = eda_kpi.kpi_outputs(pd.concat(parts, ignore_index=True))
+            eda_kpi.OUT_DIR.mkdir(parents=True, exist_ok=True)
+            for file_name, table in outputs.items():
+                _replace_csv(table, eda_kpi.OUT_DIR / file_name)
+
+
+# ----------------------------
+# Sources and the event loop
+# ----------------------------
+def load_state() -> dict:
+    if STATE_PATH.exists():
+        return json.loads(STATE_PATH.read_text(encoding="utf-8"))
+    return {"offsets": {}}
+
+
+def save_state(state: dict):
+    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    STATE_PATH.write_text(json.dumps(state, indent=2), encoding="utf-8")
+
+
+def reject(lines: list, error: str):
+    REJECTED_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(REJECTED_PATH, "a", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps({"error": error, "line": line}) + "\n")
+    print(f"⚠️  {len(lines)} event(s) rejected ({error}), see {REJECTED_PATH}")
+
+
+def read_new_lines(path: Path, offset: int) -> tuple:
+    """Complete lines appended to `path` since `offset` and the offset after them."""
+    if not path.exists():
+        return [], offset
+    if path.stat().st_size < offset:  # truncated or rotated
+        offset = 0
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    lines = [line.decode("utf-8") for line in data[:end].splitlines() if line.strip()]
+    return lines, offset + end
+
+
+def parse_events(lines: list) -> list:
+    events, bad = [], []
+    for line in lines:
+        try:
+            event = json.loads(line)
+            if not isinstance(event, dict):
+                raise ValueError("not an object")
+            events.append(event)
+        except ValueError:
+            bad.append(line)
+    if bad:
+        reject(bad, "invalid JSON object")
+    return events
+
+
+def run_batch(processor: StreamProcessor, events: list) -> dict:
+    t0 = time.perf_counter()
+    try:
+        added = processor.process(events) if events else 0
+    except Exception as e:  # one bad batch must not stop the stream
+        reject([json.dumps(event, default=str) for event in events], f"{type(e).__name__}: {e}")
+        return {"ok": False, "error": str(e)}
+    if added:
+        print(f"✅ {added} new order(s) published in {time.perf_counter() - t0:.2f}s")
+    return {"ok": True, "new_orders": added}
+
+
+def run_once(processor: StreamProcessor, path: Path, batch_size: int):
+    state = load_state()
+    lines, offset = read_new_lines(path, state["offsets"].get(str(path), 0))
+    for lo in range(0, len(lines), batch_size):
+        run_batch(processor, parse_events(lines[lo:lo + batch_size]))
+    state["offsets"][str(path)] = offset
+    save_state(state)
+    print(f"✅ Stream caught up: {len(lines)} line(s) from {path}")
+
+
+async def tail_file(path: Path, queue: asyncio.Queue, offset: int):
+    """Feed (line, offset after it, None) for every line appended to `path`."""
+    while True:
+        lines, end = read_new_lines(path, offset)
+        if lines:
+            # offsets are only advanced per whole read; the last line carries it
+            for line in lines[:-1]:
+                await queue.put((line, None, None))
+            await queue.put((lines[-1], end, None))
+        offset = end
+        await asyncio.sleep(POLL_S)
+
+
+async def serve_socket(host: str, port: int, queue: asyncio.Queue):
+    """One JSON event per line; each line is answered once its batch is published."""
+    async def handle(reader, writer):
+        loop = asyncio.get_running_loop()
+        while line := await reader.readline():
+            if not line.strip():
+                continue
+            ack = loop.create_future()
+            await queue.put((line.decode("utf-8"), None, ack))
+            writer.write((json.dumps(await ack) + "\n").encode("utf-8"))
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"📡 Listening for order events on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+async def consume(queue: asyncio.Queue, processor: StreamProcessor, path: Path, batch_size: int, batch_wait: float):
+    loop = asyncio.get_running_loop()
+    lock = asyncio.Lock()
+    state = load_state()
+
+    async def watch_batch():
+        while True:
+            await asyncio.sleep(BATCH_CHECK_S)
+            async with lock:
+                if await loop.run_in_executor(None, processor.refresh_if_changed):
+                    print("ℹ️  Reloaded batch outputs")
+
+    watcher = asyncio.create_task(watch_batch())
+    try:
+        while True:
+            items = [await queue.get()]
+            deadline = loop.time() + batch_wait
+            while len(items) < batch_size and (timeout := deadline - loop.time()) > 0:
+                try:
+                    items.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            events = parse_events([line for line, _, _ in items])
+            async with lock:
+                result = await loop.run_in_executor(None, run_batch, processor, events)
+
+            offsets = [o for _, o, _ in items if o is not None]
+            if offsets:
+                state["offsets"][str(path)] = offsets[-1]
+                save_state(state)
+            for _, _, ack in items:
+                if ack is not None and not ack.done():
+                    ack.set_result(result)
+    finally:
+        watcher.cancel()
+
+
+async def main_async(args):
+    processor = StreamProcessor()
+    processor.publish()
+    queue = asyncio.Queue(maxsize=10 * args.batch_size)
+    offset = load_state()["offsets"].get(str(args.file), 0)
+    tasks = [
+        consume(queue, processor, args.file, args.batch_size, args.batch_wait),
+        tail_file(args.file, queue, offset),
+    ]
+    if args.port:
+        tasks.append(serve_socket(args.host, args.port, queue))
+    print(f"👀 Tailing {args.file} (Ctrl+C to stop)")
+    await asyncio.gather(*tasks)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Stream new order events into the KPI outputs.")
+    ap.add_argument("--file", type=Path, default=STREAM_FILE, help="JSONL file of events to tail")
+    ap.add_argument("--port", type=int, help="also accept JSONL events on this local TCP port")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="max events per micro-batch")
+    ap.add_argument("--batch-wait", type=float, default=BATCH_WAIT_S, help="max seconds to wait for a batch to fill")
+    ap.add_argument("--once", action="store_true", help="process the events already in --file and exit")
+    args = ap.parse_args()
+
+    if args.once:
+        run_once(StreamProcessor(), args.file, args.batch_size)
+        return
+    try:
+        asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        print("\n👋 Stream stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Every transformation with a Polars version gives the pandas result."""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("polars")
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+from common import backend  # noqa: E402
+from features import finance_context  # noqa: E402, F401  (registers finance_features)
+from modeling import build_star_schema, eda_behavior_metrics, eda_kpi  # noqa: E402, F401
+
+DIMENSIONS = {
+    "dim_platform": pd.DataFrame({"platform": ["Deliveroo", "HungryPanda"], "platform_id": [1, 2]}),
+    "dim_date": pd.DataFrame({
+        "date": pd.date_range("2024-12-20", "2025-02-10").date,
+        "date_id": np.arange(1, 54),
+    }),
+    "dim_restaurant": pd.DataFrame({"restaurant": ["Charllies", "KFC", "Unknown"], "restaurant_id": [3, 1, 2]}),
+}
+TABLES = {"dimension_keys": DIMENSIONS}
+
+
+def orders(n: int = 400, seed: int = 3) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    t = pd.Series(pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 40 * 24 * 60, n), unit="min"))
+    t[rng.random(n) < 0.05] = pd.NaT
+    weekend = pd.Series(rng.integers(0, 2, n), dtype="float64").mask(rng.random(n) < 0.2)
+    return pd.DataFrame({
+        "user_id": rng.choice(["me", "user002"], n),
+        "ordered_time": t,
+        "is_weekend": weekend,
+        "platform": rng.choice(["Deliveroo", "HungryPanda"], n),
+        # a name missing from the dimension stays unmatched on both engines
+        "restaurant": rng.choice(["Charllies", "KFC", "Unknown", "Not In Dim"], n),
+    })
+
+
+def comparable(df: pd.DataFrame) -> pd.DataFrame:
+    """Numbers as float64 (nullable ints vs NaN floats), everything else as objects with None."""
+    out = {}
+    for c in df.columns:
+        s = df[c]
+        if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            out[c] = s.astype("float64")
+        else:
+            out[c] = s.astype(object).where(s.notna(), None)
+    return pd.DataFrame(out).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("name", sorted({n for n, engine in backend._transforms if engine == "polars"}))
+def test_polars_matches_pandas(name):
+    tables = TABLES.get(name, {})
+    expected = backend.derive(orders(), name, engine="pandas", **tables)
+    got = backend.derive(orders(), name, engine="polars", **tables)
+    new = [c for c in got.columns if c not in orders().columns or c == "is_weekend"]
+    pd.testing.assert_frame_equal(comparable(got[new]), comparable(expected[new]), check_dtype=False)
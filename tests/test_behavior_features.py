@@ -0,0 +1,49 @@
+"""Behavior features on a small history checked by hand."""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+from features.behavior_features import add_behavior_features  # noqa: E402
+
+NAN = np.nan
+
+# rows deliberately out of time order; "a" orders from restaurants 1, 1, 2, 1, 1
+ORDERS = pd.DataFrame([
+    # user, ordered_time,        restaurant_id, total_paid
+    ("a", "2025-01-05 12:00", 1, 15.0),
+    ("b", "2025-01-03 08:00", 1, 7.0),
+    ("a", "2025-01-01 12:00", 1, 10.0),
+    ("a", "2025-01-09 12:00", 1, 30.0),
+    ("a", None, 1, 99.0),
+    ("a", "2025-01-02 20:00", 2, 5.0),
+    ("a", "2025-01-02 09:00", 1, 20.0),
+], columns=["user_id", "ordered_time", "restaurant_id", "total_paid"])
+
+EXPECTED = pd.DataFrame([
+    # orders_7d, spend_7d, orders_30d, spend_30d, days_since, day_streak, rest_30d, days_since_rest, repeat_streak
+    (4, 50.0, 4, 50.0, 2 + 16 / 24, 1, 3, 3 + 3 / 24, 1),  # streak and repeat reset after 01-02 / restaurant 2
+    (1, 7.0, 1, 7.0, NAN, 1, 1, NAN, 1),                   # b's first order
+    (1, 10.0, 1, 10.0, NAN, 1, 1, NAN, 1),                 # a's first order
+    (3, 50.0, 5, 80.0, 4.0, 1, 4, 4.0, 2),                 # 7d window drops 01-01 and 01-02 09:00
+    (NAN, NAN, NAN, NAN, NAN, NAN, NAN, NAN, NAN),         # undated
+    (3, 35.0, 3, 35.0, 11 / 24, 2, 1, NAN, 1),             # same day as the previous order
+    (2, 30.0, 2, 30.0, 21 / 24, 2, 2, 21 / 24, 2),
+], columns=[
+    "orders_7d", "spend_7d", "orders_30d", "spend_30d", "days_since_last_order", "order_day_streak",
+    "restaurant_orders_30d", "days_since_last_order_restaurant", "restaurant_repeat_streak",
+])
+
+
+def test_hand_checked_history():
+    out = add_behavior_features(ORDERS.copy())
+    pd.testing.assert_frame_equal(out[EXPECTED.columns].astype("float64"), EXPECTED, check_exact=False)
+
+
+def test_counts_are_nullable_integers():
+    out = add_behavior_features(ORDERS.copy())
+    assert str(out["orders_7d"].dtype) == "Int32"
+    assert out["orders_7d"].isna().sum() == 1
+    assert out["user_id"].tolist() == ORDERS["user_id"].tolist()
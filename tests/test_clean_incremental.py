@@ -0,0 +1,55 @@
+"""Incremental cleaning must end with the same orders_clean as a full clean."""
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+sys.path.append(str(SRC))
+from clean_orders import try_parse_datetime  # noqa: E402
+
+RAW_FILES = ["deliveroo.csv", "hungry panda.csv"]
+# outlier flags of appended rows keep the cap of the last full clean (documented)
+CAP_COLUMNS = ["delivered_time", "delivery_minutes", "delivery_minutes_outlier"]
+
+
+def run(cwd: Path, *args):
+    subprocess.run([sys.executable, *map(str, args)], cwd=cwd, check=True, capture_output=True)
+
+
+def read_sorted(path: Path) -> pd.DataFrame:
+    df = pd.read_csv(path, dtype=str).drop(columns=CAP_COLUMNS, errors="ignore")
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def test_incremental_matches_full_clean(tmp_path):
+    # one year of dense history: HungryPanda has no order numbers, so orders share minutes
+    run(tmp_path, SRC / "bench" / "generate_data.py", "--orders", "20000", "--years", "1", "--out", tmp_path)
+    raw = tmp_path / "data" / "raw"
+    full = {f: (raw / f).read_text(encoding="utf-8").splitlines(keepends=True) for f in RAW_FILES}
+
+    # first refresh sees the orders before a cut-off minute (and the first 70% of the
+    # undated ones), the second one all of them, both in export order
+    for f, lines in full.items():
+        t = try_parse_datetime(pd.read_csv(raw / f, dtype=str)["Ordered Time"])
+        cutoff = t.quantile(0.7).floor("min")
+        early = (t < cutoff) | (t.isna() & (t.index < len(t) * 0.7))
+        (raw / f).write_text("".join([lines[0]] + [l for l, e in zip(lines[1:], early) if e]), encoding="utf-8")
+    run(tmp_path, SRC / "clean_orders.py")
+    for f, lines in full.items():
+        (raw / f).write_text("".join(lines), encoding="utf-8")
+    run(tmp_path, SRC / "clean_orders.py", "--incremental")
+    incremental = tmp_path / "incremental.csv"
+    shutil.copyfile(tmp_path / "data" / "clean" / "orders_clean.csv", incremental)
+
+    run(tmp_path, SRC / "clean_orders.py")
+    expected = read_sorted(tmp_path / "data" / "clean" / "orders_clean.csv")
+    got = read_sorted(incremental)
+    assert len(got) == len(expected) == 20000
+    pd.testing.assert_frame_equal(got, expected)
+
+    # nothing new: a second incremental run appends nothing
+    run(tmp_path, SRC / "clean_orders.py", "--incremental")
+    assert len(pd.read_csv(tmp_path / "data" / "clean" / "orders_clean.csv")) == 20000
@@ -0,0 +1,28 @@
+"""Timestamp parsing: the format sample only orders formats, it never drops one."""
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+from common.datetimes import SAMPLE_SIZE, parse_datetimes  # noqa: E402
+
+
+def test_minority_formats_after_the_sample_still_parse():
+    minutes = pd.date_range("2025-01-01", periods=SAMPLE_SIZE + 680, freq="min")
+    values = pd.Series(list(minutes.strftime("%d/%m/%Y %H:%M")) + ["05/02/2025 10:11:12", "2025-02-05"])
+    parsed = parse_datetimes(values)
+    assert parsed.notna().all()
+    assert parsed.iloc[-2] == pd.Timestamp("2025-02-05 10:11:12")
+    assert parsed.iloc[-1] == pd.Timestamp("2025-02-05")
+    assert parsed.iloc[0] == minutes[0]
+
+
+def test_unknown_strings_become_nat_or_go_to_repair():
+    values = pd.Series(["05/02/2025 10:11", "not a time", None])
+    parsed = parse_datetimes(values)
+    assert parsed.iloc[0] == pd.Timestamp("2025-02-05 10:11")
+    assert parsed.iloc[1:].isna().all()
+
+    repaired = parse_datetimes(values, repair=lambda s: pd.Series(pd.Timestamp("2025-01-01"), index=s.index))
+    assert repaired.iloc[1] == pd.Timestamp("2025-01-01") and pd.isna(repaired.iloc[2])
@@ -0,0 +1,65 @@
+"""KPI tables merged from partials: order counts are exact at every grain."""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+from common import rollups  # noqa: E402
+from modeling import eda_behavior_metrics, eda_kpi  # noqa: E402
+
+
+def orders(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    t = pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24 * 60, n), unit="min")
+    return pd.DataFrame({
+        "order_id": np.arange(1, n + 1),
+        "order_date": t.date,
+        "user_id": 1,
+        "platform_id": rng.integers(1, 4, n),
+        "shift_type": rng.choice(["Day", "Night"], n),
+        "total_paid": rng.uniform(10, 40, n).round(2),
+        "fees_ratio": rng.uniform(0, 0.2, n),
+        "is_late_night": rng.integers(0, 2, n),
+        "is_weekend": rng.integers(0, 2, n),
+        "delivery_minutes": rng.uniform(10, 60, n),
+    })
+
+
+def test_order_counts_are_exact():
+    cells = eda_kpi.build_cells(orders(6000))
+    overall = eda_kpi.kpi_table(rollups.merge_partials(cells, [])).iloc[0]
+    assert overall["orders_cnt"] == 6000
+
+    out = eda_kpi.kpi_outputs(cells)
+    for name in ["kpi_orders_monthly.csv", "kpi_orders_weekly.csv", "kpi_orders_platform.csv"]:
+        assert out[name]["orders_cnt"].sum() == 6000, name
+
+
+def test_distinct_estimate_never_exceeds_rows():
+    df = orders(6000).assign(_all=0)
+    parts = rollups.partial_aggregates(df, ["_all"], distinct="order_id")
+    assert rollups.distinct_count(parts, "order_id").iloc[0] <= 6000
+
+
+def test_undated_orders_keep_their_month_row():
+    df = orders(500)
+    df.loc[:9, "order_date"] = None
+    monthly = eda_kpi.kpi_outputs(eda_kpi.build_cells(df))["kpi_orders_monthly.csv"]
+    assert monthly["month"].iloc[-1] == "NaT"
+    assert monthly.set_index("month").loc["NaT", "orders_cnt"] == 10
+    assert monthly["orders_cnt"].sum() == 500
+
+
+def test_weekly_behavior_orders_are_exact():
+    df = orders(6000).assign(
+        restaurant_id=1, cost_per_item=1.0, mins_per_currency=1.0,
+        ordered_time=lambda d: pd.to_datetime(d["order_date"]),
+    )
+    df = eda_behavior_metrics.add_time_features(df)
+    weekly = eda_behavior_metrics.weekly_order_counts(eda_behavior_metrics.build_cells(df))
+
+    week = pd.to_datetime(df["order_date"]).dt.to_period("W").astype(str)
+    expected = df.groupby(week)["order_id"].nunique()
+    pd.testing.assert_series_equal(weekly, expected, check_names=False)
@@ -0,0 +1,37 @@
+"""One natural order key for incremental dedup (clean_orders) and order_id (star schema)."""
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+from clean_orders import order_keys  # noqa: E402
+from modeling.build_star_schema import natural_order_ids  # noqa: E402
+
+ORDERS = pd.DataFrame({
+    "platform": ["Deliveroo", "Deliveroo", "HungryPanda", "HungryPanda", "HungryPanda"],
+    "order_number": ["2204", "2204.0", None, None, None],
+    "ordered_time": pd.to_datetime(
+        ["2025-01-03 19:05:10", "2025-01-03 19:05:50", "2025-01-04 12:00:00", "2025-01-04 12:00:30", None]),
+    "total_paid": [12.5, 12.5, 8.0, 9.0, 7.0],
+})
+
+
+def test_both_keys_agree_on_duplicates_and_occurrences():
+    keys = order_keys(ORDERS, ORDERS["ordered_time"])
+    assert keys.tolist() == [
+        "Deliveroo|2204|2025-01-03 19:05|0",
+        "Deliveroo|2204|2025-01-03 19:05|1",
+        "HungryPanda||2025-01-04 12:00|0",
+        "HungryPanda||2025-01-04 12:00|1",
+        "HungryPanda||NaT|0",
+    ]
+    ids = natural_order_ids(ORDERS)
+    assert ids.is_unique
+
+
+def test_order_ids_ignore_non_key_columns():
+    corrected = ORDERS.assign(total_paid=ORDERS["total_paid"] + 1)
+    assert natural_order_ids(corrected).tolist() == natural_order_ids(ORDERS).tolist()
+    # a lone order keeps its id when another order is dropped
+    assert natural_order_ids(ORDERS.iloc[[0, 2]]).tolist() == natural_order_ids(ORDERS).iloc[[0, 2]].tolist()
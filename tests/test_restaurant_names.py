@@ -0,0 +1,53 @@
+"""Restaurant name matching: spelling variants merge, different branches never do."""
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+from bench.generate_data import restaurant_names  # noqa: E402
+from common.restaurant_names import RestaurantResolver  # noqa: E402
+
+
+@pytest.mark.parametrize("canonical, variant", [
+    ("Charllies", "charllies "),
+    ("Charllies", "Charllie's"),
+    ("McDonald's", "McDonalds"),
+    ("YGF Malatang", "YGF Mala Tang"),
+    ("Da Mimmo Pizza", "Da Mimmo Pizzas"),
+])
+def test_spelling_variants_merge(canonical, variant):
+    r = RestaurantResolver()
+    r.resolve(pd.Series([canonical]))
+    assert r.resolve_one(variant) == canonical
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Sushi King 2", "Sushi King 3"),
+    ("Xian Street Food", "Xian Street Food 2"),
+    ("Kitchen Dragon 10", "Dragon Kitchen 100"),
+    ("Dragon Kitchen", "Kitchen Dragon"),
+    ("Golden Wok", "Golden Work"),
+])
+def test_near_duplicates_stay_apart(first, second):
+    r = RestaurantResolver()
+    r.resolve(pd.Series([first]))
+    assert r.resolve_one(second) == second
+
+
+def test_generated_names_stay_distinct():
+    names = pd.Series(restaurant_names(400))
+    assert RestaurantResolver().resolve(names).nunique() == 400
+
+
+def test_cached_wrong_merge_is_resolved_again(tmp_path):
+    path = tmp_path / "restaurant_aliases.csv"
+    pd.DataFrame({
+        "alias": ["Sushi King 2", "Sushi King 3", "charllies "],
+        "canonical": ["Sushi King 2", "Sushi King 2", "Charllies"],
+        "score": [1.0, 0.82, 1.0],
+    }).to_csv(path, index=False)
+    r = RestaurantResolver.load(path)
+    assert r.resolve_one("Sushi King 3") == "Sushi King 3"
+    assert r.resolve_one("charllies ") == "Charllies"
@@ -0,0 +1,136 @@
+"""KPI service: result cache, query validation, and answers matching the batch KPI tables."""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+import serve_kpi  # noqa: E402
+from modeling import eda_kpi  # noqa: E402
+from serve_kpi import METRICS, KpiService, QueryError, ResultCache, parse_query  # noqa: E402
+
+
+class ReloadDuringQuery(KpiService):
+    """Publishes a new version while the first query is being computed."""
+
+    def kpi(self, df, *query):
+        if len(df) == 1:
+            self.data = (pd.DataFrame({"n": [1, 2]}), ("v2",), "t2")
+            self.cache.clear()
+        return [{"orders_cnt": len(df)}]
+
+
+def test_result_of_replaced_version_is_not_cached():
+    service = ReloadDuringQuery(ResultCache())
+    service.data = (pd.DataFrame({"n": [1]}), ("v1",), "t1")
+    service._checked = time.monotonic()
+
+    first = service.query({})
+    assert first["rows"] == [{"orders_cnt": 1}] and first["loaded_at"] == "t1"
+    assert service.cache.stats()["entries"] == 0
+
+    second = service.query({})
+    assert second["rows"] == [{"orders_cnt": 2}] and not second["cached"]
+    assert service.query({})["cached"]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ResultCache(size=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the oldest
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats() == {"entries": 2, "size": 2, "ttl_s": 60, "hits": 3, "misses": 1}
+
+
+def test_cache_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(serve_kpi.time, "monotonic", clock)
+    cache = ResultCache(size=4, ttl=10)
+    cache.put("a", 1)
+    clock.now += 10
+    assert cache.get("a") == 1
+    clock.now += 0.5  # ttl counts from the put, not from the last hit
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.parametrize("params, message", [
+    ({"platfrom": ["deliveroo"]}, "Unknown parameter"),
+    ({"start": ["2025-13-01"]}, "start must be a date"),
+    ({"end": ["soon"]}, "end must be a date"),
+    ({"is_payday": ["yes"]}, "is_payday must be 0 or 1"),
+    ({"group_by": ["month,restaurant_name"]}, "Unknown group_by: restaurant_name"),
+    ({"metrics": ["orders"]}, "Unknown metrics: orders"),
+])
+def test_bad_queries_are_rejected(params, message):
+    with pytest.raises(QueryError, match=message):
+        parse_query(params)
+
+
+def test_queries_normalize_to_one_cache_key():
+    a = parse_query({"platform": ["Deliveroo,hungrypanda"], "is_payday": ["true"], "start": ["2025-01-01"]})
+    b = parse_query({"start": ["2025-01-01 00:00"], "is_payday": ["1"], "platform": ["HungryPanda", "deliveroo"]})
+    assert a == b
+
+
+def published_orders(root: Path, n: int = 400, seed: int = 5) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    t = pd.Series(pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 90 * 24 * 60, n), unit="min"))
+    t[:8] = pd.NaT
+    orders = pd.DataFrame({
+        "order_id": np.arange(1, n + 1),
+        "user_id": rng.choice(["me", "user002"], n),
+        "platform_id": rng.integers(1, 3, n),
+        "restaurant_id": rng.integers(1, 4, n),
+        "ordered_time": t,
+        "is_weekend": np.nan,
+        "total_paid": rng.uniform(10, 40, n).round(2),
+        "delivery_minutes": rng.uniform(10, 60, n).round(1),
+        "fees_ratio": rng.uniform(0, 0.2, n).round(4),
+        "total_fees": rng.uniform(0, 5, n).round(2),
+        "shift_type": rng.choice(["morning shift", "night shift", "day off"], n),
+        "is_payday": rng.integers(0, 2, n),
+    })
+    derived = root / "data" / "derived"
+    derived.mkdir(parents=True)
+    orders.to_csv(derived / "orders_finance_context.csv", index=False)
+    pd.DataFrame({"platform_id": [1, 2], "platform": ["Deliveroo", "HungryPanda"]}).to_csv(
+        derived / "dim_platform.csv", index=False)
+    pd.DataFrame({"restaurant_id": [1, 2, 3], "restaurant": ["KFC", "Charllies", "Wagamama"]}).to_csv(
+        derived / "dim_restaurant.csv", index=False)
+    return orders
+
+
+def test_kpi_matches_eda_kpi_tables(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    orders = published_orders(tmp_path)
+    service = KpiService(ResultCache())
+    params = {"platform": ["deliveroo"], "is_payday": ["1"]}
+
+    # the batch KPI tables over the same orders
+    rows = orders[(orders["platform_id"] == 1) & (orders["is_payday"] == 1)].copy()
+    tables = eda_kpi.kpi_outputs(eda_kpi.build_cells(eda_kpi.add_time_features(rows)))
+
+    monthly = pd.DataFrame(service.query({**params, "group_by": ["month"]})["rows"])
+    expected = tables["kpi_orders_monthly.csv"]
+    pd.testing.assert_frame_equal(monthly[expected.columns], expected, check_dtype=False)
+
+    by_platform = pd.DataFrame(service.query({**params, "group_by": ["platform"]})["rows"])
+    expected = tables["kpi_orders_platform.csv"]
+    assert by_platform["platform"].tolist() == ["Deliveroo"]
+    pd.testing.assert_frame_equal(
+        by_platform[METRICS], expected[METRICS], check_dtype=False)
@@ -0,0 +1,75 @@
+"""Shift calendar: pattern rotation, per-user overrides and overnight windows."""
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+from common.shift_calendar import default_calendar  # noqa: E402
+
+
+def calendar():
+    cal = default_calendar()
+    cal.add_pattern("weekdays", ["morning shift"] * 5 + ["day off"] * 2)
+    # fortnightly rotation, spelled as in the roster export
+    cal.add_pattern("rotation", ["evenning shift"] * 7 + ["night shift"] * 7)
+    return cal
+
+
+def test_patterns_repeat_from_a_monday():
+    # cycles are anchored on Monday 1970-01-05: 2024-01-08 starts a fortnight
+    roster = calendar().expand("2024-01-08", "2024-02-04", {"alice": "weekdays", "bob": "rotation"})
+    alice = roster[roster["user_id"] == "alice"].set_index("date")["shift_type"]
+    bob = roster[roster["user_id"] == "bob"].set_index("date")["shift_type"]
+    assert len(alice) == len(bob) == 28
+
+    assert alice[pd.Timestamp("2024-01-08").date()] == "morning shift"
+    assert alice[pd.Timestamp("2024-01-13").date()] == "day off"
+    assert alice[pd.Timestamp("2024-01-15").date()] == "morning shift"
+    assert (bob.iloc[:7] == "evening shift").all()
+    assert (bob.iloc[7:14] == "night shift").all()
+    assert (bob.iloc[14:21] == "evening shift").all()
+
+
+def test_overrides_only_change_their_user_and_day():
+    cal = calendar()
+    cal.add_override("alice", "2024-01-03", "day off")
+    cal.add_override("alice", "2024-06-01", "night shift")  # outside the range
+    roster = cal.expand("2024-01-01", "2024-01-07", {"alice": "weekdays", "bob": "weekdays"})
+    shifts = roster.set_index(["user_id", "date"])["shift_type"]
+    day = pd.Timestamp("2024-01-03").date()
+    assert shifts[("alice", day)] == "day off"
+    assert shifts[("bob", day)] == "morning shift"
+    assert roster.loc[roster["user_id"] == "alice", "work_hours"].sum() == 4 * 8
+
+
+def test_overnight_shifts_end_the_next_day():
+    roster = calendar().expand("2024-01-15", "2024-01-15", {"bob": "rotation"})
+    row = roster.iloc[0]
+    assert row["shift_type"] == "night shift"
+    assert row["shift_start_dt"] == pd.Timestamp("2024-01-15 23:00")
+    assert row["shift_end_dt"] == pd.Timestamp("2024-01-16 07:00")
+    assert row["work_hours"] == 8
+
+    start, end = default_calendar().intervals(
+        pd.Series(["2024-01-08", "2024-01-08"]), pd.Series(["Night Shift", "day off"]))
+    assert end.iloc[0] == pd.Timestamp("2024-01-09 07:00")
+    assert pd.isna(start.iloc[1]) and pd.isna(end.iloc[1])
+
+
+def test_overrides_past_the_int8_range_of_days():
+    cal = calendar()
+    cal.add_override("alice", "2024-12-30", "night shift")
+    roster = cal.expand("2024-01-01", "2024-12-31", {"alice": "weekdays"})
+    assert roster.set_index("date").loc[pd.Timestamp("2024-12-30").date(), "shift_type"] == "night shift"
+
+
+def test_unknown_templates_and_patterns_are_rejected():
+    cal = calendar()
+    with pytest.raises(ValueError):
+        cal.add_pattern("bad", ["morning shift", "lunch shift"])
+    with pytest.raises(KeyError):
+        cal.add_override("alice", "2024-01-01", "lunch shift")
+    with pytest.raises(KeyError):
+        cal.expand("2024-01-01", "2024-01-07", {"alice": "missing"})
@@ -0,0 +1,24 @@
+"""Warehouse reads show up in the run metrics like file reads do."""
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+from common import metrics, warehouse  # noqa: E402
+
+
+def test_queries_are_recorded_as_reads(tmp_path, monkeypatch):
+    path = tmp_path / "warehouse.sqlite"
+    monkeypatch.setattr(warehouse, "WAREHOUSE_PATH", path)
+    monkeypatch.setattr(metrics, "_reads", [])
+    dims = {"dim_platform": pd.DataFrame({"platform_id": [1, 2], "platform": ["Deliveroo", "HungryPanda"]})}
+    fact = pd.DataFrame({"order_id": [1, 2, 3], "platform_id": [1, 2, 2], "total_paid": [10.0, 12.5, 8.0]})
+    warehouse.load_star_schema(dims, fact, path)
+
+    assert len(warehouse.read_columns("fact_orders", ["order_id", "total_paid", "missing"])) == 3
+    warehouse.query("SELECT platform_id, COUNT(*) AS n FROM fact_orders GROUP BY platform_id")
+
+    assert [r["rows"] for r in metrics._reads] == [3, 2]
+    assert {r["source"] for r in metrics._reads} == {"warehouse"}
+    assert metrics.snapshot()["rows_in"] == 5